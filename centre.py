@@ -9,17 +9,47 @@ Example use:
 	centre pdb1 [pdb2]
 where <pdbN> is the path of a PDB file, preferably including H atoms.
 
+The mass and centre of each PDB file are kept in a <pdb>.centre sidecar,
+keyed by the SHA-256 digest of the file, so that a file is parsed again
+only if it changes.  --nocache neither uses nor updates the sidecars.
+
+For a whole library of PDB files:
+	centre --batch out.csv [-j jobs] [--list pdbs.txt] [pdb ...]
+writes the mass, centre and net charge (from <pdb>.xyzqr for <pdb>H.pdb)
+of each file to out.csv, found by jobs processes, and the axis, centre
+separation and second file's start and end locations (as -n, -s, -m give
+for two files) of every pair of files to out-pairs.csv.  With out.npz,
+both tables are written to that as arrays instead, the pairs indexing
+the files.
+
 This module contains the following functions:
 	- calculate_mass
+	- calculate_charge
+	- net_charge
+	- centre_table
+	- pair_rows
 """
 #TODO documentation referenced above!
-__version__ = '0.1'
+__version__ = '0.4'
 __all__ = [
 	'calculate_mass',
+	'calculate_charge',
+	'net_charge',
+	'centre_table',
+	'pair_rows',
 ]
 
-from typing import Iterable, Tuple
+from typing import Iterable, List, Optional, Tuple
+from os import replace, stat
+from math import fsum, nan
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pybeep import Vector
+from numpy import arange, array, float64, ndarray, savez, sqrt, stack, \
+				  triu_indices, unique, where
+from coordio import formatRows, readPDB, readXYZ
+import hashlib
+import json
 import logging as log
 
 #=============================================================================
@@ -28,42 +58,153 @@ MolMass = dict( C=12.011, N=14.007, O=15.999, H=1.0079, S=32.065 )
 
 #=============================================================================
 # Functions
+# SHA-256 digest of a file
+def _digest(fn: str) -> str:
+	h = hashlib.sha256()
+	with open(fn, 'rb') as f:
+		for buf in iter(lambda: f.read(1 << 20), b''):
+			h.update(buf)
+	return h.hexdigest()
+
+# Cached mass and centre of a PDB file, or None if not cached for this file
+# The digest is only recalculated if the file size or time has changed, and
+# if it still matches the sidecar is updated with them (e.g. after a touch)
+def _cached(pdb: str) -> Optional[Tuple[float,Vector]]:
+	try:
+		with open(pdb + ".centre") as f:
+			c = json.load(f)
+		st = stat(pdb)
+		if c['masses'] != MolMass:
+			return None
+		if (c['size'], c['mtime']) != (st.st_size, st.st_mtime_ns):
+			if c['sha256'] != _digest(pdb):
+				return None
+			_cache(pdb, c['mass'], c['centre'], c['sha256'], st)
+		return (c['mass'], Vector(*c['centre']))
+	except (OSError, ValueError, KeyError, TypeError):
+		return None
+
+# Record the mass and centre of a PDB file in its sidecar, if possible, with
+# its digest and status if already known
+def _cache(pdb: str, mass: float, com: Tuple[float,float,float],
+		   digest: str = None, st = None) -> None:
+	try:
+		st = st if st != None else stat(pdb)
+		digest = digest if digest != None else _digest(pdb)
+		c = dict(sha256=digest, size=st.st_size, mtime=st.st_mtime_ns,
+				 masses=MolMass, mass=mass, centre=com)
+		with open(pdb + ".centre.tmp", 'w') as f:
+			json.dump(c, f, indent=1, sort_keys=True)
+		replace(pdb + ".centre.tmp", pdb + ".centre")
+	except OSError as e:
+		log.debug(f"Unable to cache the centre of {pdb}: {e}")
+
 # Calculate mass and centre of protein from PDB-H file
-def calculate_mass(pdb: str) -> Tuple[float,Vector]:
-	mass = 0.0
-	com = Vector(0,0,0)
-	atom = "none"
+def calculate_mass(pdb: str, cache: bool = True) -> Tuple[float,Vector]:
+	if cache:
+		c = _cached(pdb)
+		if c != None:
+			return c
 	try:
-		with open(pdb) as f:
-			for line in f:
-				if line[0:6] != "ATOM  ":
-					continue
-				pos = Vector(float(line[31:39]), float(line[39:47]),
-							 float(line[47:55]))
-				atom = line[77] if line[76] == " " else line[76:78]
-				matom = MolMass[atom]
-				mass += matom
-				com -= (com-pos)*matom/mass
+		atoms = readPDB(pdb, ('ATOM  ',))
+		(element, which) = unique(atoms['element'], return_inverse=True)
+		matom = array([MolMass[e] for e in element])[which.reshape(-1)]
 	except Exception as e:
-		log.warning(f"Zero mass assumed for {pdb} atom {atom} because {e}")
-	return (mass,com)
+		log.warning(f"Zero mass assumed for {pdb} because {e}")
+		return (0.0, Vector(0,0,0))
+	mass = matom.sum()
+	if mass == 0.0:
+		return (0.0, Vector(0,0,0))
+	com = [float((matom*atoms[c]).sum()/mass) for c in 'xyz']
+	if cache:
+		_cache(pdb, float(mass), com)
+	return (float(mass), Vector(*com))
 
-# NB, this is gratuitous - use math.fsum instead...
-def calculate_charge(qr: str) -> float:
-	charge = 0.0
-	(c, t) = (0.0, charge) # Kahan correction
+# Net charge from an xyzqr file, its fourth column, correctly rounded
+def net_charge(qr: str) -> float:
+	rows = readXYZ(qr)
+	return fsum(rows[:,3].tolist()) if len(rows) > 0 else 0.0
+
+# Net charge as text, or Unknown if the xyzqr file cannot be read
+def calculate_charge(qr: str) -> str:
 	try:
-		with open(qr) as f:
-			for line in f:
-				field = line.split(' ')
-				x = float(field[3])
-				y = x - c
-				charge = t + y
-				c = (charge - t) - y
-				t = charge
-	except:
+		return f"{net_charge(qr):.3f}"
+	except (OSError, ValueError, IndexError):
 		return "Unknown"
-	return f"{charge:.3f}"
+
+# Mass, centre and net charge (nan if unknown) of a PDB file
+def _record(pdb: str, cache: bool = True) -> Tuple:
+	(mass, com) = calculate_mass(pdb, cache)
+	charge = nan
+	if pdb[-5:] == "H.pdb":
+		try:
+			charge = net_charge(pdb[0:-5] + ".xyzqr")
+		except (OSError, ValueError, IndexError):
+			pass
+	return (pdb, mass, com.x, com.y, com.z, charge)
+
+# Table of mass, centre and net charge of PDB files, by jobs processes
+def centre_table(pdbs: List[str], jobs: int = 1,
+				 cache: bool = True) -> ndarray:
+	record = partial(_record, cache=cache)
+	if jobs > 1 and len(pdbs) > 1:
+		with ProcessPoolExecutor(max_workers=jobs) as pool:
+			rows = list(pool.map(record, pdbs,
+								 chunksize=max(1, len(pdbs)//(4*jobs))))
+	else:
+		rows = [record(pdb) for pdb in pdbs]
+	width = max([1] + [len(pdb) for pdb in pdbs])
+	return array(rows, dtype=[('pdb', f"U{width}"), ('mass', float64),
+							  ('x', float64), ('y', float64), ('z', float64),
+							  ('charge', float64)])
+
+# Pairs (i, j) of centres, by index:  unit axis from i to j, separation and
+# the start and end locations of j, as for two files in the main program
+def pair_rows(centres: ndarray, i: ndarray, j: ndarray, steps: int = 0,
+			  stepsize: float = 0.0, minsep: float = 0.0) -> Tuple[ndarray, ...]:
+	d = centres[j] - centres[i]
+	sep = sqrt((d*d).sum(axis=1))
+	axis = d / where(sep > 0.0, sep, 1.0)[:,None]
+	start = centres[j] + axis*(minsep+steps*stepsize)
+	end = centres[j] + axis*minsep
+	return (axis, sep, start, end)
+
+# Write the centre table and all its pairs as CSV files or to an npz file
+def _write_batch(out: str, table: ndarray, steps: int, stepsize: float,
+				 minsep: float) -> int:
+	centres = stack([table['x'], table['y'], table['z']], axis=1)
+	n = len(table)
+	if out[-4:] == ".npz":
+		(i, j) = triu_indices(n, 1)
+		(axis, sep, start, end) = pair_rows(centres, i, j, steps, stepsize,
+											minsep)
+		savez(out, pdb=table['pdb'], mass=table['mass'], centre=centres,
+			  charge=table['charge'], pair=stack([i, j], axis=1), axis=axis,
+			  separation=sep, start=start, end=end)
+		return len(i)
+	charge = array([f"{q:.3f}" if q == q else "NA" for q in table['charge']],
+				   dtype=object)
+	with open(out, 'w') as f:
+		print("pdb,mass,x,y,z,charge", file=f)
+		formatRows(f, "%s,%.3f,%.4f,%.4f,%.4f,%s",
+				   array([table['pdb'].astype(object), table['mass'],
+						  table['x'], table['y'], table['z'], charge],
+						 dtype=object).T)
+	count = 0
+	(stem, ext) = (out[0:-4], out[-4:]) if out[-4:] == ".csv" else (out, "")
+	with open(f"{stem}-pairs{ext}", 'w') as f:
+		print("pdb1,pdb2,ax,ay,az,separation,sx,sy,sz,ex,ey,ez", file=f)
+		for i in range(n - 1):
+			j = arange(i+1, n)
+			(axis, sep, start, end) = \
+				pair_rows(centres, i, j, steps, stepsize, minsep)
+			rows = [[table['pdb'][i]]*len(j), table['pdb'][j]] + \
+				   [axis[:,k] for k in range(3)] + [sep] + \
+				   [start[:,k] for k in range(3)] + [end[:,k] for k in range(3)]
+			formatRows(f, "%s,%s" + ",%.6f"*3 + ",%.4f"*7,
+					   array(rows, dtype=object).T)
+			count += len(j)
+	return count
 
 
 #=============================================================================
@@ -92,9 +233,24 @@ if __name__== "__main__":
 	# -m -- previously defaulted to 10.165 seemingly to protect BEEP?
 	parser.add_argument('-m', metavar='m', type=float, dest='m', default=0.0,
 						help='minimum distance')
+	# --nocache
+	parser.add_argument('--nocache', action='store_true', dest='nocache',
+						help='neither use nor update the <pdb>.centre caches')
+	# --batch
+	parser.add_argument('--batch', metavar='OUT', dest='batch', default=None,
+						help='write a table of all files and one of all pairs '
+							 'of files, as OUT and OUT-pairs (.csv) or to '
+							 'OUT.npz')
+	# -j number of processes for --batch
+	parser.add_argument('-j', metavar='jobs', type=int, dest='jobs', default=1,
+						help='number of processes for --batch')
+	# --list
+	parser.add_argument('--list', metavar='FILE', type=argparse.FileType('r'),
+						dest='list', default=None,
+						help='file of further PDB files, one per line')
 	# PDB Ids
 	parser.add_argument('pdblist', metavar='PDB-Id',
-						nargs='+',
+						nargs='*',
 						help='list of PDB files, exactly two for axis data')
 
 	# Interpret arguments
@@ -105,6 +261,14 @@ if __name__== "__main__":
 	stepsize = args['s']
 	minsep = args['m']
 	pdblist = args['pdblist']
+	cache = not args['nocache']
+	batch = args['batch']
+	jobs = args['jobs']
+	if args['list'] != None:
+		pdblist += [l.strip() for l in args['list'] if l.strip() != ""]
+		args['list'].close()
+	if len(pdblist) == 0:
+		parser.error("no PDB files given")
 
 	# Set up logging - if to stdout, assume caller handles time and module name
 	if logstream == stdout:
@@ -114,11 +278,22 @@ if __name__== "__main__":
 	log.basicConfig(stream=logstream, format=fmt,
 					level=getattr(log, loglevel.upper()))
 
+	# Batch mode:  tables of all the files and of all their pairs
+	if batch != None:
+		table = centre_table(pdblist, jobs, cache)
+		try:
+			count = _write_batch(batch, table, steps, stepsize, minsep)
+		except OSError as e:
+			log.error(f"Unable to write {batch}: {e}")
+			exit(1)
+		log.info(f"{len(table)} files and {count} pairs written to {batch}")
+		exit(0)
+
 	# For each PDB file on the list, calculate mass and centre
 	pdbnum = len(pdblist)
 	(mass,com) = ([None]*pdbnum,[None]*pdbnum)
 	for n in range(pdbnum):
-		(mass[n],com[n]) = calculate_mass(pdblist[n])
+		(mass[n],com[n]) = calculate_mass(pdblist[n], cache)
 
 		# And try calculating net charge
 		charge = "Unknown"
@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+# Author: Adam Light <la002@mail.cryst.bbk.ac.uk>
+"""MRes Bioinformatics with Systems Biology Project
+
+This module reads and writes the text files used by the scripts - GTS
+meshes, xyz-like columns (xyz, xyzr, xyzqr) and PDB records - as NumPy
+arrays in bulk.  A file is memory-mapped and indexed by line, so only the
+blocks of lines wanted are parsed, and rows are written a chunk at a time
+with one format operation, at the precision the scripts have always used.
+
+Example use:
+	(vertices, edges, faces) = readGTS("mesh.gts")
+	writeGTS("copy.gts", vertices, edges, faces)
+	xyzqr = readXYZ("x.xyzqr")
+	atoms = readPDB("xH.pdb", types=('ATOM  ',))
+Edges and faces are indexed from 0 in the arrays and from 1 in the files;
+triangles and faceEdges convert faces between edges and vertices.
+
+The lower level functions work on the mapped bytes and their line index:
+	buf = mapFile("x.pdb")
+	starts = lineIndex(buf)
+	rows = records(buf, starts, ('ATOM  ',))
+	xyz = parseColumns(buf, starts, rows, pdbcoords)
+"""
+__version__ = '0.1'
+__all__ = [
+	'mapFile',
+	'lineIndex',
+	'lineBytes',
+	'tokenCounts',
+	'parseBlock',
+	'fixedColumns',
+	'parseColumns',
+	'replaceColumns',
+	'xyzLines',
+	'pdbLines',
+	'records',
+	'matchRange',
+	'readGTSHeader',
+	'readGTS',
+	'readXYZ',
+	'readPDB',
+	'faceEdges',
+	'triangles',
+	'formatRows',
+	'writeBytes',
+	'writeGTS',
+	'writeXYZ',
+]
+
+# imports
+from typing import Iterable, List, Tuple
+from os import path
+from io import BytesIO
+from numpy import arange, argsort, array, bincount, concatenate, cumsum, \
+				  empty, flatnonzero, float64, frombuffer, int64, loadtxt, \
+				  memmap, minimum, ndarray, sort, stack, uint8, unique, where, \
+				  zeros
+from numpy import char
+from numpy.lib.recfunctions import structured_to_unstructured
+import re
+
+# Global variables
+chunk = 1 << 16		# Rows formatted by one operation
+scan = 1 << 26		# Bytes searched for newlines at a time
+gtsformat = "%.6f"	# Default GTS vertex coordinate format
+# Fixed PDB columns, [begin, end) from 0, of each field
+pdbfields = [('record', 0, 6), ('serial', 6, 11), ('name', 12, 16),
+			 ('altloc', 16, 17), ('resname', 17, 20), ('chain', 21, 22),
+			 ('resseq', 22, 26), ('icode', 26, 27), ('x', 30, 38),
+			 ('y', 38, 46), ('z', 46, 54), ('occupancy', 54, 60),
+			 ('tempfactor', 60, 66), ('element', 76, 78), ('charge', 78, 80)]
+pdbcoords = [(30, 38), (38, 46), (46, 54)]
+pdbformat = "%8.3f%8.3f%8.3f"	# [-999.999,9999.999]
+
+# Functions
+def mapFile(f) -> ndarray:
+	"""Returns the bytes of a file, given by name or as an open file, as a
+	uint8 array, memory-mapped if the file is a regular one."""
+	name = f if isinstance(f, str) else getattr(f, 'name', None)
+	if isinstance(f, str) or (isinstance(name, str) and path.isfile(name)):
+		if path.getsize(name) == 0:
+			return zeros(0, dtype=uint8)
+		return memmap(name, dtype=uint8, mode='r')
+	data = f.buffer.read() if hasattr(f, 'buffer') else f.read()
+	return frombuffer(data.encode() if isinstance(data, str) else data,
+					  dtype=uint8)
+
+def lineIndex(buf: ndarray) -> ndarray:
+	"""Returns the offset of the start of each line in buf, followed by the
+	offset one past the end of the last line's newline (real or implied), so
+	line i is buf[starts[i]:starts[i+1]-1] and there are len(starts)-1."""
+	newlines = [flatnonzero(buf[i:i+scan] == 10) + (i + 1)
+				for i in range(0, len(buf), scan)]
+	starts = concatenate([array([0], dtype=int64)] + newlines)
+	if len(buf) > 0 and buf[-1] != 10:
+		starts = concatenate([starts, array([len(buf) + 1], dtype=int64)])
+	return starts
+
+def lineBytes(buf: ndarray, starts: ndarray, first: int, count: int) -> bytes:
+	"""Returns lines first to first+count-1 of buf, with their newlines."""
+	count = max(0, min(count, len(starts) - 1 - first))
+	return bytes(buf[starts[first]:starts[first+count]])
+
+def tokenCounts(buf: ndarray, starts: ndarray, first: int,
+				count: int) -> ndarray:
+	"""Returns the number of white-space-separated tokens on each of lines
+	first to first+count-1 of buf."""
+	block = frombuffer(lineBytes(buf, starts, first, count), dtype=uint8)
+	if len(block) == 0:
+		return zeros(max(count, 0), dtype=int64)
+	space = (block == 32) | (block == 9) | (block == 10) | (block == 13)
+	begins = ~space & concatenate([[True], space[:-1]])
+	line = cumsum(block == 10) - (block == 10)
+	return bincount(line[begins], minlength=count)
+
+def parseBlock(buf: ndarray, starts: ndarray, first: int, count: int,
+			   columns: int, dtype=float64, name: str = None) -> ndarray:
+	"""Returns the first columns white-space-separated values of each of
+	lines first to first+count-1 of buf as a (count, columns) array.
+	Raises ValueError, giving the line number (and file name), if a line is
+	invalid."""
+	where = f" in {name}" if name != None else ""
+	if count <= 0:
+		return empty((0, columns), dtype=dtype)
+	block = lineBytes(buf, starts, first, count)
+	try:
+		values = loadtxt(BytesIO(block), dtype=dtype, comments=None,
+						 usecols=range(columns), ndmin=2)
+		if values.shape == (count, columns):
+			return values
+	except ValueError:
+		pass
+	# Find the offending line, including one that is missing or blank
+	lines = block.split(b'\n')
+	for i in range(count):
+		ll = lines[i].split()[0:columns] if i < len(lines) else []
+		try:
+			if len(ll) < columns:
+				raise ValueError
+			array(ll).astype(dtype)
+		except ValueError:
+			raise ValueError(f"Invalid line {first+i+1}{where}")
+	raise ValueError(f"Invalid lines {first+1} to {first+count}{where}")
+
+def fixedColumns(buf: ndarray, starts: ndarray, rows: ndarray, begin: int,
+				 end: int) -> ndarray:
+	"""Returns columns [begin, end) of each of the given lines of buf as a
+	bytes array, with spaces where a line is short."""
+	rows = array(rows, dtype=int64).reshape(-1)
+	if len(rows) == 0 or end <= begin:
+		return array([b''] * len(rows), dtype=f"S{max(end-begin,1)}")
+	stops = starts[rows + 1] - 1
+	stops -= (stops > starts[rows]) & (buf[minimum(stops - 1, len(buf) - 1)]
+										== 13)
+	index = starts[rows][:,None] + arange(begin, end)
+	cols = buf[minimum(index, len(buf) - 1)]
+	cols[index >= stops[:,None]] = 32
+	return cols.view(f"S{end-begin}").reshape(-1)
+
+def parseColumns(buf: ndarray, starts: ndarray, rows: ndarray,
+				 spans: List[Tuple[int, int]], dtype=float64,
+				 name: str = None) -> ndarray:
+	"""Returns the values in the fixed columns spans, each [begin, end), of
+	each of the given lines of buf as a (len(rows), len(spans)) array.
+	Raises ValueError, giving the line number (and file name), if a value
+	is invalid."""
+	where = f" in {name}" if name != None else ""
+	rows = array(rows, dtype=int64).reshape(-1)
+	values = empty((len(rows), len(spans)), dtype=dtype)
+	for (i, (begin, end)) in enumerate(spans):
+		text = fixedColumns(buf, starts, rows, begin, end)
+		try:
+			values[:,i] = text.astype(dtype)
+		except ValueError:
+			for j in range(len(text)):
+				try:
+					text[j:j+1].astype(dtype)
+				except ValueError:
+					raise ValueError(f"Invalid columns {begin+1}-{end} "
+									 f"{text[j].decode(errors='replace')!r} at "
+									 f"line {rows[j]+1}{where}")
+			raise
+	return values
+
+def replaceColumns(buf: ndarray, starts: ndarray, rows: ndarray, begin: int,
+				   text: bytes) -> ndarray:
+	"""Returns a copy of buf with the given lines' columns from begin
+	replaced by successive, equal, pieces of text.  Raises ValueError if a
+	line is too short or the pieces are not equal."""
+	rows = array(rows, dtype=int64).reshape(-1)
+	out = array(buf, dtype=uint8)
+	if len(rows) == 0:
+		return out
+	if len(text) % len(rows) != 0:
+		raise ValueError("Replacement columns vary in width")
+	width = len(text) // len(rows)
+	short = flatnonzero(starts[rows + 1] - 1 - starts[rows] < begin + width)
+	if len(short) > 0:
+		raise ValueError(f"Line {rows[short[0]]+1} too short")
+	out[starts[rows][:,None] + arange(begin, begin + width)] = \
+		frombuffer(text, dtype=uint8).reshape(len(rows), width)
+	return out
+
+def xyzLines(buf: ndarray, starts: ndarray, first: int, count: int,
+			 coords: ndarray, fmt: str = "%.6f %.6f %.6f") -> bytes:
+	"""Returns lines first to first+count-1 of buf with their first three
+	tokens replaced by coords, (count,3), formatted with fmt, and the other
+	tokens following singly spaced."""
+	counts = tokenCounts(buf, starts, first, count)
+	tokens = array(lineBytes(buf, starts, first, count).split())
+	index = concatenate([[0], cumsum(counts)[:-1]]).astype(int64)
+	lines = empty(count, dtype=object)
+	for k in unique(counts):
+		which = flatnonzero(counts == k)
+		cells = empty((len(which), 3 + max(k - 3, 0)), dtype=object)
+		cells[:,0:3] = coords[which]
+		cells[:,3:] = char.decode(tokens[index[which][:,None] + arange(3, k)])
+		rowfmt = fmt + " " + " ".join(["%s"]*(k - 3))
+		lines[which] = ((rowfmt + "\n") * len(which) %
+						tuple(cells.ravel().tolist())).split("\n")[:-1]
+	return ("\n".join(lines) + "\n").encode() if count > 0 else b''
+
+def pdbLines(buf: ndarray, starts: ndarray, first: int, count: int,
+			 coords: ndarray, fmt: str = pdbformat) -> bytes:
+	"""Returns lines first to first+count-1 of buf with the PDB coordinate
+	columns replaced by coords, (count,3), formatted with fmt."""
+	text = ((fmt * count) % tuple(coords.ravel().tolist())).encode()
+	block = frombuffer(lineBytes(buf, starts, first, count), dtype=uint8)
+	local = starts[first:first+count+1] - starts[first]
+	end = pdbcoords[-1][1]
+	if len(text) == count*(end - pdbcoords[0][0]) and \
+	   (local[1:] - 1 - local[:-1] >= end).all():
+		return replaceColumns(block, local, arange(count), pdbcoords[0][0],
+							  text).tobytes()
+	# Wider numbers, or short lines, change the line lengths
+	lines = bytes(block).split(b'\n')
+	for i in range(count):
+		lines[i] = lines[i][0:pdbcoords[0][0]] + \
+				   (fmt % tuple(coords[i])).encode() + lines[i][end:]
+	return b'\n'.join(lines[0:count]) + b'\n' if count > 0 else b''
+
+def records(buf: ndarray, starts: ndarray, prefixes: Iterable[str]) -> ndarray:
+	"""Returns the indexes of the lines of buf starting with one of the
+	prefixes, e.g. ('ATOM  ', 'HETATM')."""
+	lines = arange(len(starts) - 1)
+	found = zeros(len(lines), dtype=bool)
+	for prefix in prefixes:
+		found |= fixedColumns(buf, starts, lines, 0, len(prefix)) == \
+				 prefix.encode()
+	return flatnonzero(found)
+
+def matchRange(buf: ndarray, starts: ndarray, begre, endre) -> Tuple[int, int]:
+	"""Returns the first line of buf on which the compiled RE begre matches
+	and the first line from there on which endre matches (or the last line),
+	as (first, last), or (None, None) if begre never matches."""
+	(begre, endre) = (_bytesRE(begre), _bytesRE(endre))
+	data = memoryview(buf)
+	(first, last) = (None, len(starts) - 2)
+	for n in range(len(starts) - 1):
+		line = data[starts[n]:starts[n+1]-1]
+		if first == None:
+			if begre.search(line):
+				first = n
+		if first != None and endre.search(line):
+			last = n
+			break
+	return (first, last if first != None else None)
+
+def _bytesRE(r):
+	"""Returns the compiled RE r, or its equivalent for bytes if it is for
+	str."""
+	if isinstance(r.pattern, bytes):
+		return r
+	return re.compile(r.pattern.encode(), r.flags & ~re.UNICODE)
+
+def readGTSHeader(buf: ndarray, starts: ndarray,
+				  name: str = "file") -> Tuple[int, int, int]:
+	"""Returns the vertex, edge and face counts of a GTS file, or zeros
+	if it is empty.  Raises ValueError if the first line is invalid."""
+	if len(starts) < 2:
+		return (0, 0, 0)
+	ll = lineBytes(buf, starts, 0, 1).split()
+	try:
+		counts = tuple(int(ll[i]) for i in range(3))
+	except (IndexError, ValueError):
+		raise ValueError(f"Invalid first line in {name}")
+	if min(counts) < 0:
+		raise ValueError(f"Invalid first line in {name}")
+	return counts
+
+def readGTS(f, vertexonly: bool = False) -> Tuple[ndarray, ndarray, ndarray]:
+	"""Returns the vertex coordinates, (n,3) floats, the edges, (k,2) vertex
+	indexes, and the faces, (m,3) edge indexes, of a GTS file, given by name
+	or as an open file;  with vertexonly, the edges and faces are empty.
+	Raises ValueError if the file is invalid."""
+	name = f if isinstance(f, str) else getattr(f, 'name', "file")
+	buf = mapFile(f)
+	starts = lineIndex(buf)
+	(nv, ne, nf) = readGTSHeader(buf, starts, name)
+	(ne, nf) = (0, 0) if vertexonly else (ne, nf)
+	if max(len(starts) - 2, 0) < nv + ne + nf:
+		raise ValueError(f"Only {len(starts)-2} of {nv+ne+nf} lines after "
+						 f"the first in {name}")
+	vertices = parseBlock(buf, starts, 1, nv, 3, float64, name)
+	edges = parseBlock(buf, starts, 1 + nv, ne, 2, int64, name) - 1
+	faces = parseBlock(buf, starts, 1 + nv + ne, nf, 3, int64, name) - 1
+	if (len(edges) > 0 and (edges.min() < 0 or edges.max() >= nv)) or \
+	   (len(faces) > 0 and (faces.min() < 0 or faces.max() >= ne)):
+		raise ValueError(f"Index out of range in {name}")
+	return (vertices, edges, faces)
+
+def readXYZ(f, columns: int = None) -> ndarray:
+	"""Returns the rows of an xyz-like file (xyz, xyzr, xyzqr...), given
+	by name or as an open file, as an (n, columns) float array;  columns
+	defaults to the number on the first line.  Raises ValueError if the
+	file is invalid."""
+	name = f if isinstance(f, str) else getattr(f, 'name', "file")
+	buf = mapFile(f)
+	starts = lineIndex(buf)
+	count = len(starts) - 1
+	# A blank last line is not a row
+	while count > 0 and len(lineBytes(buf, starts, count - 1, 1).split()) == 0:
+		count -= 1
+	if columns == None:
+		columns = len(lineBytes(buf, starts, 0, 1).split()) if count > 0 else 0
+	return parseBlock(buf, starts, 0, count, columns, float64, name)
+
+def readPDB(f, types: Iterable[str] = ('ATOM  ', 'HETATM')) -> ndarray:
+	"""Returns the records of the given types in a PDB file, given by name or
+	as an open file, as a structured array, with fields line (from 0), x, y,
+	z (floats) and the other fixed columns as stripped strings:  record,
+	serial, name, altloc, resname, chain, resseq, icode, occupancy,
+	tempfactor, element and charge.  Raises ValueError if a coordinate is
+	invalid."""
+	name = f if isinstance(f, str) else getattr(f, 'name', "file")
+	buf = mapFile(f)
+	starts = lineIndex(buf)
+	rows = records(buf, starts, types)
+	fields = [(field, float64 if field in 'xyz' else f"U{end-begin}")
+			  for (field, begin, end) in pdbfields]
+	pdb = empty(len(rows), dtype=[('line', int64)] + fields)
+	pdb['line'] = rows
+	xyz = parseColumns(buf, starts, rows, pdbcoords, float64, name)
+	for (field, begin, end) in pdbfields:
+		if field in 'xyz':
+			pdb[field] = xyz[:,'xyz'.index(field)]
+		else:
+			pdb[field] = char.strip(char.decode(
+				fixedColumns(buf, starts, rows, begin, end), 'latin-1'))
+	return pdb
+
+def faceEdges(faces: ndarray) -> Tuple[ndarray, ndarray]:
+	"""Returns the distinct edges of the faces, (k,2) vertex indexes in order
+	of first use, and the edges of each face, (m,3) edge indexes."""
+	# Edges of a face are (v1,v2), (v2,v0) and (v0,v1)
+	pairs = sort(stack([faces[:,[1,2,0]], faces[:,[2,0,1]]], axis=2)
+				 .reshape(-1, 2), axis=1)
+	(edges, first, which) = unique(pairs, axis=0, return_index=True,
+								   return_inverse=True)
+	order = argsort(first)
+	rank = empty(len(order), dtype=int64)
+	rank[order] = range(len(order))
+	return (edges[order], rank[which.reshape(-1)].reshape(-1, 3))
+
+def triangles(edges: ndarray, faces: ndarray) -> ndarray:
+	"""Returns the vertices, (m,3) indexes, of each face given as edges,
+	ordered as GTS orients a triangle from its first two edges;  faceEdges
+	is the inverse."""
+	(e1, e2) = (edges[faces[:,0]], edges[faces[:,1]])
+	(c1, c2, c3) = (e1[:,1] == e2[:,0], e1[:,1] == e2[:,1], e1[:,0] == e2[:,0])
+	forward = c1 | c2
+	return stack([where(forward, e1[:,0], e1[:,1]),
+				  where(forward, e1[:,1], e1[:,0]),
+				  where(c1 | c3, e2[:,1], e2[:,0])], axis=1)
+
+def formatRows(out, fmt: str, rows: ndarray) -> None:
+	"""Writes each row of a 2-D array (numbers or objects) to the open text
+	file out with the %-format fmt, which has one conversion per column,
+	followed by a newline."""
+	for i in range(0, len(rows), chunk):
+		part = rows[i:i+chunk]
+		out.write(((fmt + "\n") * len(part)) % tuple(part.ravel().tolist()))
+
+def writeBytes(out, data) -> None:
+	"""Writes bytes, or a uint8 array such as part of a mapped file, to the
+	open text file out."""
+	if hasattr(out, 'buffer'):
+		out.flush()
+		out.buffer.write(data)
+	else:
+		out.write(bytes(data).decode())
+
+def writeGTS(f, vertices: ndarray, edges: ndarray, faces: ndarray,
+			 fmt: str = gtsformat, edgecount: int = None) -> None:
+	"""Writes a GTS file, given by name or as an open file, from the vertex
+	coordinates (numbers, formatted with fmt, or text), the edges, as vertex
+	indexes, and the faces, as edge indexes, both from 0.  The edge count in
+	the header is edgecount, if given."""
+	if isinstance(f, str):
+		with open(f, 'w') as out:
+			writeGTS(out, vertices, edges, faces, fmt, edgecount)
+		return
+	edgecount = edgecount if edgecount != None else len(edges)
+	print(f"{len(vertices)} {edgecount} {len(faces)} "
+		  "GtsSurface GtsFace GtsEdge GtsVertex", file=f)
+	formatRows(f, "%s %s %s" if vertices.dtype.kind == 'U' else
+				  " ".join([fmt]*3), vertices)
+	formatRows(f, "%d %d", edges + 1)
+	formatRows(f, "%d %d %d", faces + 1)
+
+def writeXYZ(f, rows: ndarray, fmt: str = "%.6f") -> None:
+	"""Writes rows of numbers to an xyz-like file, given by name or as an
+	open file, with fmt for each number or for each row (if it has more than
+	one conversion)."""
+	if isinstance(f, str):
+		with open(f, 'w') as out:
+			writeXYZ(out, rows, fmt)
+		return
+	if rows.dtype.names != None:
+		rows = structured_to_unstructured(rows)
+	if fmt.count('%') == 1 and rows.ndim == 2:
+		fmt = " ".join([fmt]*rows.shape[1])
+	formatRows(f, fmt, rows)
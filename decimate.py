@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# Author: Adam Light <la002@mail.cryst.bbk.ac.uk>
+"""MRes Bioinformatics with Systems Biology Project
+
+This script simplifies a closed GTS mesh by quadric error edge collapse
+(Garland and Heckbert), as meshlab's Quadric Edge Collapse Decimation
+filter does for simpli.py, but needing no X display.
+
+Example use:
+	decimate.py -i <gts> -o <gts-d> -p <pct>
+reduces the faces of <gts> to <pct> percent of their number (as meshlab's
+TargetPerc) and writes the result to <gts-d>.
+
+Each vertex has the quadric of the planes of its faces, weighted by area.
+Edges are collapsed cheapest first, from a heap, to the point minimising
+the sum of their vertices' quadrics.  A collapse is refused if it would
+make the surface non-manifold (the link condition) or turn a face over,
+so a closed manifold stays one, with the same topology.
+
+The steps are also available as functions, e.g.
+	(vertices, edges, faces) = readGTS("x.gts")
+	(vertices, tris) = decimate(vertices, triangles(edges, faces), 0.1)
+with readGTS and triangles from coordio.
+"""
+__version__ = '0.1'
+__all__ = [
+	'main',
+	'quadrics',
+	'decimate',
+]
+
+# imports
+from typing import List, Tuple
+from sys import stdout
+from os import path, sep as pathsep
+from heapq import heapify, heappop, heappush
+from numpy import abs as npabs, add, arange, argmin, array, concatenate, \
+				  einsum, flatnonzero, float64, full, int64, linalg, ndarray, ones, \
+				  sqrt, stack, where, zeros
+from coordio import faceEdges, readGTS, triangles, writeGTS
+import argparse
+import logging as log
+
+# Global variables
+singular = 1e-10	# Relative determinant below which a quadric has no minimum
+reach = 2.0			# Furthest optimal point, in edge lengths from the middle
+
+# Functions
+def _normals(p: ndarray) -> ndarray:
+	"""Returns the unnormalised normals of the (n,3,3) triangle corners p;
+	written out, as numpy's cross is slow for the few faces of a collapse."""
+	(u, v) = (p[:,1] - p[:,0], p[:,2] - p[:,0])
+	return stack([u[:,1]*v[:,2] - u[:,2]*v[:,1],
+				  u[:,2]*v[:,0] - u[:,0]*v[:,2],
+				  u[:,0]*v[:,1] - u[:,1]*v[:,0]], axis=1)
+
+def quadrics(vertices: ndarray, tris: ndarray) -> ndarray:
+	"""Returns the (n,4,4) quadric of each vertex, the sum of those of the
+	planes of its triangles, weighted by area."""
+	p0 = vertices[tris[:,0]]
+	normal = _normals(vertices[tris])
+	length = sqrt((normal*normal).sum(axis=1))
+	unit = normal / where(length > 0, length, 1.0)[:,None]
+	plane = stack([unit[:,0], unit[:,1], unit[:,2], -(unit*p0).sum(axis=1)],
+				  axis=1)
+	k = plane[:,:,None]*plane[:,None,:]*(length/2)[:,None,None]
+	q = zeros((len(vertices), 4, 4))
+	for i in range(3):
+		add.at(q, tris[:,i], k)
+	return q
+
+def _costs(q: ndarray, vertices: ndarray, a: ndarray,
+		   b: ndarray) -> Tuple[ndarray, ndarray]:
+	"""Returns the cost of collapsing each edge (a, b) and the point to
+	collapse it to:  the minimum of the summed quadric if it has one nearby,
+	else the best of the ends and the middle."""
+	qe = q[a] + q[b]
+	(va, vb) = (vertices[a], vertices[b])
+	middle = (va + vb)/2
+	m = qe[:,0:3,0:3]
+	scale = npabs(m).max(axis=(1,2)) if len(m) > 0 else zeros(0)
+	ok = npabs(linalg.det(m)) > singular*scale**3
+	best = middle.copy()
+	if ok.any():
+		best[ok] = linalg.solve(m[ok], -qe[ok,0:3,3:4])[:,:,0]
+		far = ((best - middle)**2).sum(axis=1) > \
+			  reach*reach*((va - vb)**2).sum(axis=1)
+		ok &= ~far
+	candidates = stack([best, va, vb, middle], axis=1)
+	homogeneous = concatenate([candidates, ones((len(a), 4, 1))], axis=2)
+	h = einsum('nki,nij,nkj->nk', homogeneous, qe, homogeneous)
+	h[~ok,0] = float('inf')
+	choice = argmin(h, axis=1)
+	rows = arange(len(a))
+	return (h[rows,choice].clip(min=0.0), candidates[rows,choice])
+
+def decimate(vertices: ndarray, tris: ndarray, fraction: float,
+			 faces: int = None) -> Tuple[ndarray, ndarray]:
+	"""Returns the vertices and triangles of a closed triangle mesh reduced
+	to the given fraction of its faces (or to the given number of faces),
+	or as near as collapses allow."""
+	vertices = array(vertices, dtype=float64)
+	tri = array(tris, dtype=int64)
+	target = faces if faces != None else int(round(len(tri)*fraction))
+	target = max(target, 4)
+	q = quadrics(vertices, tri)
+	alive = ones(len(vertices), dtype=bool)
+	version = zeros(len(vertices), dtype=int64)
+	live = ones(len(tri), dtype=bool)
+	vfaces = [set() for _ in range(len(vertices))]
+	for (f, t) in enumerate(tri.tolist()):
+		for v in t:
+			vfaces[v].add(f)
+
+	# Queue every edge, each once
+	(edges, _) = faceEdges(tri)
+	(cost, point) = _costs(q, vertices, edges[:,0], edges[:,1])
+	heap = [(c, a, b, 0, 0) for (c, a, b) in
+			zip(cost.tolist(), edges[:,0].tolist(), edges[:,1].tolist())]
+	heapify(heap)
+	points = {(a, b): p for (a, b, p) in
+			  zip(edges[:,0].tolist(), edges[:,1].tolist(), point)}
+
+	def ring(v: int) -> set:
+		return set(tri[list(vfaces[v])].ravel().tolist()) - {v}
+
+	(nfaces, nverts) = (len(tri), len(vertices))
+	while nfaces > target and nverts > 4 and len(heap) > 0:
+		(c, a, b, va, vb) = heappop(heap)
+		if not (alive[a] and alive[b] and version[a] == va and
+				version[b] == vb):
+			continue
+		shared = vfaces[a] & vfaces[b]
+		if len(shared) != 2:
+			continue
+		# Link condition:  only the two opposite vertices are common to both
+		opposite = set(tri[list(shared)].ravel().tolist()) - {a, b}
+		(ra, rb) = (ring(a), ring(b))
+		if ra & rb != opposite:
+			continue
+		# Refuse to turn any face over
+		p = points[(a, b)]
+		moving = array(sorted((vfaces[a] | vfaces[b]) - shared), dtype=int64)
+		t = tri[moving]
+		old = vertices[t]
+		new = old.copy()
+		new[(t == a) | (t == b)] = p
+		if ((_normals(old)*_normals(new)).sum(axis=1) <= 0.0).any():
+			continue
+
+		# Collapse b into a, at p, dropping the two shared faces
+		for f in shared:
+			live[f] = False
+			for v in tri[f].tolist():
+				vfaces[v].discard(f)
+		for f in vfaces[b]:
+			tri[f][tri[f] == b] = a
+			vfaces[a].add(f)
+		vfaces[b] = set()
+		vertices[a] = p
+		q[a] += q[b]
+		alive[b] = False
+		version[a] += 1
+		(nfaces, nverts) = (nfaces - 2, nverts - 1)
+
+		# Requeue the edges around a
+		around = array(sorted(ring(a)), dtype=int64)
+		ends = full(len(around), a, dtype=int64)
+		(cost, point) = _costs(q, vertices, ends, around)
+		for (c, n, p) in zip(cost.tolist(), around.tolist(), point):
+			(e0, e1) = (a, n) if a < n else (n, a)
+			points[(e0, e1)] = p
+			heappush(heap, (c, e0, e1, version[e0], version[e1]))
+
+	# Renumber the remaining vertices
+	keep = flatnonzero(alive)
+	index = full(len(vertices), -1, dtype=int64)
+	index[keep] = arange(len(keep))
+	return (vertices[keep], index[tri[live]])
+
+# Main program
+def main(argv: List[str] = None, cwd: str = None) -> int:
+	"""Runs decimate.py with the given arguments, returning the exit status.
+
+	- argv	  -- command line arguments, default sys.argv[1:]
+	- cwd	  -- directory for relative file names, default the current one
+	"""
+	# Set up command line parsing
+	parser = argparse.ArgumentParser(description=\
+					'Simplify a closed GTS mesh by quadric error edge collapse.')
+	# -i input gts file
+	parser.add_argument('-i', metavar='in-gts', dest='igts', required=True,
+	                    help='name of input gts file')
+	# -o output gts file
+	parser.add_argument('-o', metavar='out-gts', dest='ogts', required=True,
+	                    help='name of output gts file')
+	# -p target percentage of faces
+	parser.add_argument('-p', metavar='PERCENT', type=float, dest='pct',
+						required=True,
+						help='target percentage of the faces to keep')
+	# --loglevel
+	parser.add_argument('--loglevel', metavar='(INFO|WARNING|ERROR)',
+						dest='loglevel', default="INFO",
+	                    help='minimum log level to capture: INFO, WARNING, ERROR')
+	# --logfile
+	parser.add_argument('--logfile', metavar='log', type=argparse.FileType('a'),
+						dest='log', default=stdout, help='name of log file')
+
+	# Interpret arguments
+	args = vars(parser.parse_args(argv))
+	(igts, ogts) = (args['igts'], args['ogts'])
+	if cwd != None:
+		igts = igts if igts[0] == pathsep else path.join(cwd, igts)
+		ogts = ogts if ogts[0] == pathsep else path.join(cwd, ogts)
+	pct = args['pct']
+	loglevel = args['loglevel']
+	logstream = args['log']
+
+	# Set up logging - if to stdout, assume caller handles time and module name
+	if logstream == stdout:
+		fmt="%(levelname)s:%(message)s"
+	else:
+		fmt="%(asctime)s %(module)s %(levelname)s:%(message)s"
+	log.basicConfig(stream=logstream, format=fmt,
+	                level=getattr(log, loglevel.upper()))
+
+	# Simplify the mesh
+	try:
+		(vertices, edges, faces) = readGTS(igts)
+	except (OSError, ValueError) as e:
+		log.error(f"{e}")
+		return 1
+	tris = triangles(edges, faces)
+	if pct < 100.0:
+		(vertices, tris) = decimate(vertices, tris, pct/100.0)
+		(edges, faces) = faceEdges(tris)
+	log.info(f"{path.basename(ogts)}: {len(faces)} faces, {len(vertices)} "
+			 f"vertices")
+	writeGTS(ogts, vertices, edges, faces)
+
+	return 0
+
+if __name__ == "__main__":
+	exit(main())
@@ -11,18 +11,22 @@ where the list of numbers are the factors of expansion (or <1 for
 contraction) required and mesh.gts is the initial file.  The output
 files are named mesh-1.1x.gts, ...
 """
-__version__ = '0.1'
+__version__ = '0.3'
 __all__ = [
 	'expand',
 ]
 
 from typing import Iterable, Tuple
 from sys import stdout
+from numpy import array, empty, float64, multiply, ndarray, zeros
+from coordio import formatRows, lineBytes, lineIndex, mapFile, parseBlock, \
+					readGTSHeader, writeBytes
 import logging as log
 import re
 
 #=============================================================================
 # Global variables
+step = 1 << 16	# Vertices expanded and written at a time
 
 #=============================================================================
 # Functions
@@ -35,6 +39,50 @@ def vector(s):
 	except:
 		raise argparse.ArgumentTypeError("Direction must be x,y,z")
 
+def expand(gts: str, outputs: Iterable[str], proportion: Iterable[float],
+		   direction: Tuple[int, int, int] = (1, 1, 1)) -> ndarray:
+	"""Writes a copy of a GTS mesh to each of outputs, expanded about its
+	average vertex by the corresponding proportion, and returns the average.
+	Raises ValueError if the mesh is invalid.
+
+	The vertices are read once and each block of them is expanded and
+	written to every output in turn, so only one copy is held.
+	"""
+	buf = mapFile(gts)
+	starts = lineIndex(buf)
+	nvert = readGTSHeader(buf, starts, gts)[0]
+	vertices = parseBlock(buf, starts, 1, nvert, 3, float64, gts)
+	header = lineBytes(buf, starts, 0, 1).decode().strip()
+	tail = buf[starts[min(1 + nvert, len(starts) - 1)]:]
+
+	# The average coordinate is the centre, which stays put
+	ac = vertices.mean(axis=0) if nvert > 0 else zeros(3)
+	factor = 1+(array(proportion, dtype=float64)[:,None]-1)*array(direction)
+	offset = ac*(factor-1.0)
+
+	# Write the header, the expanded coordinates and the remaining lines
+	# unchanged - all indices
+	pf = [open(o, 'w') for o in outputs]
+	try:
+		for p in range(len(pf)):
+			print(header, file=pf[p])
+		scaled = empty((min(step, nvert), 3))
+		for i in range(0, nvert, step):
+			part = vertices[i:i+step]
+			ec = scaled[0:len(part)]
+			for p in range(len(pf)):
+				multiply(part, factor[p], out=ec)
+				ec -= offset[p]
+				formatRows(pf[p], "%.6g %.6g %.6g", ec)
+		for p in range(len(pf)):
+			writeBytes(pf[p], tail)
+			if len(tail) > 0 and tail[-1] != 10:
+				print("", file=pf[p])
+	finally:
+		for f in pf:
+			f.close()
+	return ac
+
 #=============================================================================
 # Main
 if __name__== "__main__":
@@ -81,85 +129,20 @@ if __name__== "__main__":
 					level=getattr(log, loglevel.upper()))
 
 	# Set up REs
-	nvrest = r"^([0-9]{1,10})\s+([0-9]{1,10})\s+([0-9]{1,10})\s+" \
-				"GtsSurface GtsFace GtsEdge GtsVertex"
-	floatrest = r"(-?[0-9\.]+(?:e-?[0-9]+)?)"
-	vertrest = r"^"+floatrest+"\s+"+floatrest+"\s+"+floatrest+"\s*$"
 	frootrest = r"^(.*)\.gts$"
-	nvre = re.compile(nvrest)
-	vertre = re.compile(vertrest)
 	frootre = re.compile(frootrest)
 
-	# For each proportion in the list expand the coordinates
-	proplen = len(proportion)
-	pf = list()
+	# Expand the mesh for all the proportions at once
 	m = frootre.search(gts)
 	if (not m):
 		print("Require a .gts extension")
 		exit(1)
 	froot = m.group(1)
-	for p in range(proplen):
-		pf.append(open(f"{froot}-{proportion[p]}x.gts", 'w'))
-	with open(gts) as f:
-		line = f.readline().strip()
-		m = nvre.search(line)
-		if (not m):
-			print("Oops, this doesn't look like a gts file!")
-			exit(1)
-		try:
-			nvert = int(m.group(1))
-		except:
-			print("Failed to interpret number of vertices")
-			exit(1)
-		
-		# Prep for expansion and write out the header to each output file
-		fmt = " ".join(["{:.6g}" for i in range(3)])
-		ac = [0, 0, 0]
-		ec = dict()
-		for p in range(proplen):
-			print(line.strip(), file=pf[p])
-			ec[p] = list()
-
-		# Multiply up each vertex
-		for n in range(nvert):
-			# Interpret the next line as a coordinate
-			try:
-				m = vertre.search(f.readline())
-			except:
-				print(f"Unexpected failure  at line {n+2}")
-				exit(1)
-			if (not m):
-				print(f"Unexpected line format at line {n+2}")
-				exit(1)
-			try:
-				c = [float(m.group(i)) for i in range(1,4)]
-			except:
-				print(f"Unexpected vertex format at line {n+2}")
-				exit(1)
-
-			# Maintain the average coodinate as the centre
-			ac = [ac[i] + (c[i]-ac[i])/(n+1) for i in range(3)]
-
-			# Expand the coordinate for each proportion
-			for p in range(proplen):
-				ec[p] += [[(1+(proportion[p]-1)*direction[i])*c[i] \
-							for i in range(3)]]
-
-		# Pause to adjust all the expanded coordinates and write them out
-		print("Centred at "+fmt.format(*ac))
-		for p in range(proplen):
-			for ecv in ec[p]:
-				ecv = [ecv[i]-ac[i]*((1+(proportion[p]-1)*direction[i])-1.0) \
-						for i in range(3)]
-				os = fmt.format(*ecv)
-				print(os, file=pf[p])
-
-		# Write out the remaining lines unchanged - all indices
-		for line in f:
-			for p in range(proplen):
-				print(line.strip(), file=pf[p])
-
-	# Close the files
-	for p in range(proplen):
-		pf[p].close()
-
+	try:
+		ac = expand(gts, [f"{froot}-{p}x.gts" for p in proportion], proportion,
+					direction)
+	except ValueError as e:
+		print(f"Oops, this doesn't look like a gts file! {e}")
+		exit(1)
+	fmt = " ".join(["{:.6g}" for i in range(3)])
+	print("Centred at "+fmt.format(*ac))
@@ -13,6 +13,7 @@ done <<-_PROGRAMS
 area.r
 areas.r
 centre.py
+decimate.py
 energies.r
 expand.py
 hydro.py
@@ -27,4 +28,5 @@ salt.r
 sepden.r
 shift.py
 simpli.py
+transform.py
 _PROGRAMS
@@ -12,275 +12,400 @@ The hydrophobicities-file has the format: RRR A PM1 HC
 where RRR is the three-letter residue, A is the PDB file atom specifier,
 PM1 is -1 for hydrophobic or +1 for hydrophilic, and HC is the hydrophobic
 charge to assign (-0.5, +1.0 or +2.0);  PM1 is ignored.
+
+Many files may be processed by one run, with {s} in the file names
+replaced by each of a list of ids, e.g.
+	hydro.py -a beep.ah -p {s}.pqr -g {s}-ref.gts -o {s}.xyzqr --batch 1a 2b
+
+The steps are also available as functions, e.g.
+	ah = readHydrophobicities("beep.ah")
+	pqr = readPQR("x.pqr")
+	surface = surfaceAtoms(pqr, readVertices("x-ref.gts"))
+	writeXYZQR("x.xyzqr", assign(pqr, ah, 1.0, surface))
 """
-__version__ = '1.0'
+__version__ = '1.4'
 __all__ = [
+	'main',
+	'readHydrophobicities',
+	'readPQR',
+	'readVertices',
+	'nearest',
+	'surfaceAtoms',
+	'assign',
+	'writeXYZQR',
 ]
 
 # imports
-from typing import Iterable, Tuple, List, Dict
+from typing import List, Dict
 from sys import stdout
 from os import environ, path, sep as pathsep
-from math import log10, floor
+from numpy import array, arange, argmin, char, concatenate, empty, \
+				  floor as npfloor, float64, full, inf, int32, int64, isin, \
+				  isnan, lexsort, maximum, minimum, ndarray, repeat, \
+				  searchsorted, stack, unique, where, zeros
+from coordio import readGTS, writeXYZ
 import argparse
 import logging as log
 
-# Types
-Coord = Tuple[float, float, float] # Coordinates x,y,z
+# Global variables
+cellsize = 2.0	# Nearest atom grid cell (A), about an atom to surface
+				# vertex distance
+step = 1 << 12	# Points per chunk of nearest atom candidates
+# The simple Lennard-Jones parameterisation (sigma, epsilon), by element and
+# for H by whether it has a radius
+lj = dict(C=(3.40,0.10), H0=(2.53,0.02), N=(3.04,0.19), O=(3.25,0.17),
+		  S=(2.06,0.43), H1=(0.36,0.01))
+# Output rows, one per line of an xyzqr file
+xyzqrtype = [('x', float64), ('y', float64), ('z', float64), ('q', float64),
+			 ('r', float64), ('hc', float64), ('sigma', float64),
+			 ('epsilon', float64)]
+xyzqrfmt = "%.6f %.6f %.6f %.6f %.6f %.1f %.2f %.2f"
+
+# Functions
+def readHydrophobicities(ahf: str) -> Dict[str, float]:
+	"""Returns the hydrophobic charges of a hydrophobicities file, by residue
+	and atom name, e.g. ah['ALACB'].  Raises ValueError if it is invalid."""
+	ah = dict()
+	with open(ahf, 'r') as f:
+		n = 0
+		for line in f:
+			n += 1
+			ll = line.split()
+			if len(ll) == 0 or ll[0][0] == '#':
+				continue
+			if len(ll) < 3:
+				raise ValueError(f"Invalid line {n} in {ahf}: {line}")
+			try:
+				ah[ll[0].upper()+ll[1].upper()] = float(ll[-1])
+			except:
+				raise ValueError(f"Unexpected non-float field line{n} in {ahf}: "
+								 f"{line}")
+	return ah
+
+def readPQR(pqrf: str) -> ndarray:
+	"""Returns the atoms of a pqr file as a structured array.
+
+	Fields are het (0 for ATOM, else the position in a run of HETATMs),
+	record, serial, name, resname, resseq (as in the file) and the floats
+	x, y, z, q, r.  Raises ValueError if the file is invalid.
+	"""
+	(hets, fields, lines) = (list(), list(), list())
+	with open(pqrf, 'r') as f:
+		n = 0								# line number for reporting
+		het = 0								# for tracking groups of hetatms
+		for line in f:
+			n += 1
+			if line[0:6] != 'ATOM  ' and line[0:6] != 'HETATM':
+				continue
+			# "Officially" the file format is white-space-separated fields:
+			#	 Field_name Atom_number Atom_name Residue_name Chain_ID (optional)
+			#		Residue_number X Y Z Charge Radius
+			# (http://apbs-pdb2pqr.readthedocs.io/en/latest/formats/pqr.html)
+			# But actually there are unspecified limits e.g. may have no white
+			# space after HETATM: "attempt to preserve the PDB format
+			# as much as possible" - whatever that means...
+			if line[0:6] == 'HETATM':
+				line = line[0:6] + " " + line[6:]
+				het += 1
+			else:
+				het = 0
+			ll = line.split()
+			if len(ll) < 10:
+				raise ValueError(f"Insufficient fields at line {n} in {pqrf}: "
+								 f"{line}")
+			elif len(ll) > 11:
+				raise ValueError(f"Additional fields at line {n} in {pqrf}: "
+								 f"{line}")
+			elif len(ll) == 11:
+				ll = ll[0:4] + ll[5:]	# Not interested in optional chain id here
+			hets.append(het)
+			fields.append(ll)
+			lines.append(n)
+	text = array(fields, dtype=str).reshape(-1, 10)
+	try:
+		values = text[:,5:10].astype(float64)
+	except ValueError:
+		for i in range(len(fields)):
+			try:
+				[float(v) for v in fields[i][5:10]]
+			except ValueError:
+				raise ValueError(f"Invalid coordinates at line {lines[i]} in {pqrf}")
+		raise
+	names = ['record', 'serial', 'name', 'resname', 'resseq']
+	pqr = empty(len(fields), dtype=[('het', int32)] +
+				[(names[i], text.dtype) for i in range(5)] +
+				[(c, float64) for c in ['x', 'y', 'z', 'q', 'r']])
+	pqr['het'] = hets
+	for i in range(5):
+		pqr[names[i]] = text[:,i]
+	for (i, c) in enumerate(['x', 'y', 'z', 'q', 'r']):
+		pqr[c] = values[:,i]
+	return pqr
+
+def readVertices(gtsf: str) -> ndarray:
+	"""Returns the vertex coordinates of a gts file as an (n,3) array.  Raises
+	ValueError if the file is invalid."""
+	return readGTS(gtsf, vertexonly=True)[0]
+
+def _nearestAll(points: ndarray, atoms: ndarray) -> ndarray:
+	"""Returns the index of the nearest atom to each point, by brute force."""
+	nearest = list()
+	chunk = max(1, (1 << 22) // max(len(atoms),1))	# Points per chunk
+	for i in range(0, len(points), chunk):
+		d = atoms[None,:,:] - points[i:i+chunk,None,:]
+		nearest += [argmin(d[:,:,0]*d[:,:,0] + d[:,:,1]*d[:,:,1] +
+						   d[:,:,2]*d[:,:,2], axis=1)]
+	return concatenate(nearest) if len(nearest) > 0 else array([], dtype=int64)
+
+def nearest(points: ndarray, atoms: ndarray, cell: float = cellsize) -> ndarray:
+	"""Returns the index of the nearest atom to each point, the first if
+	several are equally near.
+
+	- points  -- (n,3) array of coordinates
+	- atoms	  -- (m,3) array of atom coordinates, m > 0
+	- cell	  -- grid cell size
+	Atoms are binned in a grid of cells, and each point's nearest atom looked
+	for in the block of cells within r of its own, for r = 1, 2, ...  One
+	found within r cell sizes is the nearest;  points with none that near
+	are looked for again with r+1, up to 3, and then in all atoms.
+	"""
+	origin = atoms.min(axis=0)
+	shape = ((atoms.max(axis=0) - origin) // cell).astype(int64) + 1
+	# Cell keys are only unique within the grid, but cells outside it are
+	# empty, so other cells found by their keys only add candidates
+	key = lambda ijk: (ijk[:,0]*shape[1] + ijk[:,1])*shape[2] + ijk[:,2]
+	acell = key(npfloor((atoms - origin) / cell).astype(int64))
+	order = lexsort((arange(len(atoms)), acell))
+	acell = acell[order]
+	pcell = npfloor((points - origin) / cell).astype(int64)
+	found = full(len(points), -1, dtype=int64)
+	(rest, r) = (arange(len(points)), 1)
+	while len(rest) > 0 and r <= 3:
+		offsets = [array((x,y,z)) for x in range(-r,r+1)
+					for y in range(-r,r+1) for z in range(-r,r+1)]
+		for i in range(0, len(rest), step):
+			pi = rest[i:i+step]
+			(vi, ai) = (list(), list())
+			for off in offsets:
+				k = key(pcell[pi] + off)
+				(lo, hi) = (searchsorted(acell, k), searchsorted(acell, k, 'right'))
+				counts = hi - lo
+				vi += [repeat(arange(len(pi)), counts)]
+				ai += [order[arange(counts.sum()) -
+							 repeat(counts.cumsum() - counts - lo, counts)]]
+			(vi, ai) = (concatenate(vi), concatenate(ai))
+			d = atoms[ai] - points[pi[vi]]
+			d2 = d[:,0]*d[:,0] + d[:,1]*d[:,1] + d[:,2]*d[:,2]
+			# Nearest, then first, atom of each point, if certainly nearest
+			mind2 = full(len(pi), inf)
+			minimum.at(mind2, vi, d2)
+			tied = d2 == mind2[vi]
+			first = full(len(pi), len(atoms), dtype=int64)
+			minimum.at(first, vi[tied], ai[tied])
+			near = mind2 < (r*cell*0.999)**2
+			found[pi[near]] = first[near]
+		(rest, r) = ((found < 0).nonzero()[0], r+1)
+	if len(rest) > 0:
+		found[rest] = _nearestAll(points[rest], atoms)
+	return found
+
+def surfaceAtoms(pqr: ndarray, vertices: ndarray) -> ndarray:
+	"""Returns a mask of the ATOM records of pqr (from readPQR) whose
+	coordinates are those of an atom nearest to one of the vertices."""
+	atoms = (pqr['het'] == 0).nonzero()[0]
+	surface = zeros(len(pqr), dtype=bool)
+	if len(atoms) == 0 or len(vertices) == 0:
+		return surface
+	# Adding 0.0 makes -0.0 and 0.0 the same coordinate
+	coords = stack([pqr['x'], pqr['y'], pqr['z']], axis=1)[atoms] + 0.0
+	(_, same) = unique(coords, axis=0, return_inverse=True)
+	same = same.reshape(-1)
+	near = zeros(same.max()+1, dtype=bool)
+	near[same[nearest(vertices, coords)]] = True
+	surface[atoms] = near[same]
+	return surface
 
-# Utilities
-def float4(fs: str) -> float:
-	x = float(fs)
-	return round(x, 3-int(floor(log10(abs(x)))))  # 4 sig fig
+def _atomError(pqr: ndarray, i: int, scale: float) -> List:
+	"""Returns the fields of atom i, as reported in errors."""
+	return [str(pqr[c][i]) for c in ['record','serial','name','resname','resseq']] \
+		+ [float(pqr['x'][i]), float(pqr['y'][i]), float(pqr['z'][i]),
+		   float(pqr['q'][i]*scale), float(pqr['r'][i])]
 
-def length2(p1: Coord,p2: Coord) -> float:
-	diff = [p1[i]-p2[i] for i in range(3)]
-	return sum([dv*dv for dv in diff])
+def assign(pqr: ndarray, ah: Dict[str, float], scale: float = 1.0,
+		   surface: ndarray = None) -> ndarray:
+	"""Returns the xyzqr rows for the atoms of a pqr file, with hydrophobic
+	charges and Lennard-Jones parameters assigned.
 
-def rgAsString(rg: Dict) -> str:
-	return rg[0].strip() + f" {rg[1]:.1f} {rg[2][0]:.2f} {rg[2][1]:.2f}"
+	- pqr	  -- atoms, from readPQR
+	- ah	  -- hydrophobic charges, from readHydrophobicities
+	- scale	  -- factor by which to scale the charge
+	- surface -- mask of surface atoms, from surfaceAtoms, default all
+	Only surface atoms are assigned a hydrophobic charge.  An initial NH3+,
+	a final COO- and a histidine with HE2 have +2.0 on all their atoms.
+	Atoms are grouped into residues, each starting at an N, and if an atom
+	name appears twice in a residue, each row has the values of the last.
+	Raises ValueError for an atom with no parameters.
+	"""
+	pos = arange(len(pqr))
+	atom = pqr['het'] == 0
+	name = char.upper(pqr['name'])
+	res = char.upper(pqr['resname'])
+	surface = surface if surface is not None else full(len(pqr), True)
 
-def nearest(c: Coord, atomcoords: List[Coord]) -> Coord:
-	minl2 = None
-	rc = None
-	for ac in atomcoords:
-		l2 = length2(ac, c)
-		if minl2 == None or l2 < minl2:
-			minl2 = l2
-			rc = ac
-	return tuple(rc)
+	# Lennard-Jones parameters by element, and for H by radius
+	ljk = where(name.astype('U1') == 'H',
+				where(pqr['r'] == 0.0, 'H0', 'H1'), name.astype('U1'))
+	known = isin(ljk, list(lj))
+
+	# Residues start at an N or a HETATM run;  the residue number in a chain
+	# counts starts, and the chain ends after an OXT or HXT
+	start = atom & (name == 'N')
+	group = (start | (pqr['het'] == 1)).cumsum()
+	starts = start.cumsum()
+	ends = where(atom & isin(name, ['OXT','HXT']), starts, 0)
+	residue = starts - maximum.accumulate(concatenate([[0], ends[:-1]]))
+
+	# Corrections of terminals and histidine, else assigned hydrophobicity
+	t1 = atom & surface & (residue == 1) & isin(name, ['H2','H3'])
+	t2 = atom & surface & ~t1 & (name == 'OXT')
+	t3 = atom & surface & ~t1 & ~t2 & (res == 'HIS') & (name == 'HE2')
+	own = atom & surface & ~t1 & ~t2 & ~t3
+	(keys, which) = unique(char.add(res[own], name[own]), return_inverse=True)
+	hc = zeros(len(pqr))
+	hc[own] = array([ah.get(k, float('nan')) for k in keys])[which.reshape(-1)]
+
+	# Report the first atom that could not be assigned
+	bad = (atom & ~known) | (own & isnan(hc))
+	if bad.any():
+		i = bad.nonzero()[0][0]
+		msg = "Unrecognised atom" if not known[i] else \
+				"Unrecognised or duplicate atom"
+		raise ValueError(f"{msg} at atom {i+1}: {_atomError(pqr, i, scale)}")
+
+	# A correction applies to atoms of its residue up to that point
+	for (t, targets) in [(t1, ['N','H','H2','H3']), (t2, ['C','O','OXT']),
+						 (t3, ['NE2','HE2'])]:
+		last = full(group[-1]+1 if len(pqr) > 0 else 1, -1)
+		maximum.at(last, group[t], pos[t])
+		hc[atom & isin(name, targets) & (last[group] >= pos)] = 2.0
+
+	# Each row has the values of the last atom of its residue with its name
+	(_, entry) = unique(stack([group, unique(name, return_inverse=True)[1]
+							   .reshape(-1)], axis=1), axis=0, return_inverse=True)
+	entry = entry.reshape(-1)
+	final = full(entry.max()+1 if len(pqr) > 0 else 1, -1)
+	maximum.at(final, entry[atom], pos[atom])
+	src = where(atom, final[entry], pos)
+
+	rows = empty(len(pqr), dtype=xyzqrtype)
+	for c in ['x', 'y', 'z', 'r']:
+		rows[c] = pqr[c][src]
+	rows['q'] = pqr['q'][src]*scale
+	rows['hc'] = where(atom, hc[src], 0.0)
+	(keys, which) = unique(ljk, return_inverse=True)
+	which = which.reshape(-1)[src]
+	rows['sigma'] = where(atom, array([lj[k][0] for k in keys])[which], 0.0)
+	rows['epsilon'] = where(atom, array([lj[k][1] for k in keys])[which], 0.0)
+	return rows
+
+def writeXYZQR(oxyzqr: str, rows: ndarray) -> None:
+	"""Writes xyzqr rows, from assign, to a file."""
+	writeXYZ(oxyzqr, rows, xyzqrfmt)
 
 
 # Main program
+def main(argv: List[str] = None, cwd: str = None) -> int:
+	"""Runs hydro.py with the given arguments, returning the exit status.
 
-# Set up command line parsing
-parser = argparse.ArgumentParser(description=\
+	- argv	  -- command line arguments, default sys.argv[1:]
+	- cwd	  -- directory for relative file names, default $PWD
+	"""
+	# Set up command line parsing
+	parser = argparse.ArgumentParser(description=\
 				'From PQR, assign hydrophobicities and LJ parameters to xyzqr.')
-# -a hydrophobicities file
-parser.add_argument('-a', metavar='hydrophobicities-file', dest='ahf',
-					required=True,
-                    help='name of hydrophobicities file')
-# -p PQR file
-parser.add_argument('-p', metavar='pqr-file', dest='pqrf', required=True,
-                    help='name of pqr file (should include H)')
-# -g GTS file - optional, used to exclude non-surface atoms
-parser.add_argument('-g', metavar='gts-file', dest='gtsf', default=str(),
-                    help='reference gts file used to exclude non-surface atoms')
-# -s scale factor
-parser.add_argument('-s', metavar='scale-factor', dest='scale', default=1.0,
-					type=float,
-                    help='factor by which to scale the charge')
-# -o output xyzqr file
-parser.add_argument('-o', metavar='out-xyzqr', dest='oxyzqr', required=True,
-                    help='name of input xyzqr file')
-# --loglevel
-parser.add_argument('--loglevel', metavar='(INFO|WARNING|ERROR)',
-					dest='loglevel', default="INFO",
-                    help='minimum log level to capture: INFO, WARNING, ERROR')
-# --logfile
-parser.add_argument('--logfile', metavar='log', type=argparse.FileType('a'),
-					dest='log', default=stdout, help='name of log file')
-
-# Interpret arguments
-args = vars(parser.parse_args())
-ahf = args['ahf']
-pqrf = args['pqrf']
-gtsf = args['gtsf']
-scale = args['scale']
-oxyzqr = args['oxyzqr']
-loglevel = args['loglevel']
-logstream = args['log']
-
-# Set up logging - if to stdout, assume caller handles time and module name
-if logstream == stdout:
-	fmt="%(levelname)s:%(message)s"
-else:
-	fmt="%(asctime)s %(module)s %(levelname)s:%(message)s"
-log.basicConfig(stream=logstream, format=fmt,
-                level=getattr(log, loglevel.upper()))
-
-# Output filename substitutions
-here = environ['PWD']
-if ahf[0] != pathsep:
-	ahf = path.join(here, ahf)
-if pqrf[0] != pathsep:
-	pqrf = path.join(here, pqrf)
-if gtsf != str() and gtsf[0] != pathsep:
-	gtsf = path.join(here, gtsf)
-if oxyzqr[0] != pathsep:
-	oxyzqr = path.join(here, oxyzqr)
-
-# Read in the hydrophobicities
-ah = dict()
-with open(ahf, 'r') as f:
-	n = 0
-	for line in f:
-		n += 1
-		ll = line.split()
-		if len(ll) == 0 or ll[0][0] == '#':
-			continue
-		if len(ll) < 3:
-			log.error(f"Invalid line {n} in {ahf}: {line}")
-			exit(1)
-		try:
-			ah[ll[0].upper()+ll[1].upper()] = float(ll[-1])
-		except:
-			log.error(f"Unexpected non-float field line{n} in {ahf}: {line}")
-			exit(1)
-
-# Set up the simple Lennard-Jones parameterisation
-lj = dict(C=(3.40,0.10), H0=(2.53,0.02), N=(3.04,0.19), O=(3.25,0.17),	\
-			S=(2.06,0.43), H1=(0.36,0.01))
-
-# Read the pqr atoms
-pqr = list()		# the PQR data
-atomcoords = list()	# the PQR coords more conveniently
-with open(pqrf, 'r') as f:
-	n = 0								# line number for reporting
-	het = 0								# for tracking groups of hetatms
-	for line in f:
-		n += 1
-		if line[0:6] != 'ATOM  ' and line[0:6] != 'HETATM':
-			continue
-		# "Officially" the file format is white-space-separated fields:
-		#	 Field_name Atom_number Atom_name Residue_name Chain_ID (optional)
-		#		Residue_number X Y Z Charge Radius
-		# (http://apbs-pdb2pqr.readthedocs.io/en/latest/formats/pqr.html)
-		# But actually there are unspecified limits e.g. may have no white
-		# space after HETATM: "attempt to preserve the PDB format
-		# as much as possible" - whatever that means...
-		if line[0:6] == 'HETATM':
-			line = line[0:6] + " " + line[6:]
-			het += 1
-		else:
-			het = 0
-		ll = line.split()
-		if len(ll) < 10:
-			log.error(f"Insufficient fields at line {n} in {pqrf}: {line}")
-			exit(1)
-		elif len(ll) > 11:
-			log.error(f"Additional fields at line {n} in {pqrf}: {line}")
-			exit(1)
-		elif len(ll) == 11:
-			ll = ll[0:4] + ll[5:]	# Not interested in optional chain id here
-
-		# Store the data
-		try:
-			ll = ll[0:5] + [float(ll[i]) for i in range(5,10)]
-		except:
-			log.error(f"Invalid coordinates at line {n} in {pqrf}")
-			exit(1)
-		pqr.append((het,ll))
-		if het == 0:
-			atomcoords.append(ll[5:8])
-
-# Read the reference gts file if there is one
-surface = set()
-if gtsf != str():
-	with open(gtsf, 'r') as f:
-		n = 0
-		nvert = 0
-		for line in f:
-			if n == 0:
-				try:
-					nvert = int(line.split()[0])
-				except:
-					log.error(f"Invalid first line in {gtsf}")
-					exit(1)
-			elif n <= nvert:
-				gl = line.split()
-				try:
-					c = [float(gl[i]) for i in range(3)]
-				except:
-					log.error(f"Invalid line {n+1} in {gtsf}")
-					exit(1)
-				# Store the nearest atom coords in the surface set
-				surface.add(nearest(c, atomcoords))
-			else:
-				break # rest of gts file is irrelevant
-			n += 1
+	# -a hydrophobicities file
+	parser.add_argument('-a', metavar='hydrophobicities-file', dest='ahf',
+						required=True,
+	                    help='name of hydrophobicities file')
+	# -p PQR file
+	parser.add_argument('-p', metavar='pqr-file', dest='pqrf', required=True,
+	                    help='name of pqr file (should include H)')
+	# -g GTS file - optional, used to exclude non-surface atoms
+	parser.add_argument('-g', metavar='gts-file', dest='gtsf', default=str(),
+	                    help='reference gts file used to exclude non-surface atoms')
+	# -s scale factor
+	parser.add_argument('-s', metavar='scale-factor', dest='scale', default=1.0,
+						type=float,
+	                    help='factor by which to scale the charge')
+	# -o output xyzqr file
+	parser.add_argument('-o', metavar='out-xyzqr', dest='oxyzqr', required=True,
+	                    help='name of input xyzqr file')
+	# --batch ids to substitute for {s} in file names
+	parser.add_argument('--batch', metavar='id', nargs='+', dest='batch',
+						default=None,
+						help='process the files named with {s} replaced by '
+							 'each id in turn')
+	# --loglevel
+	parser.add_argument('--loglevel', metavar='(INFO|WARNING|ERROR)',
+						dest='loglevel', default="INFO",
+	                    help='minimum log level to capture: INFO, WARNING, ERROR')
+	# --logfile
+	parser.add_argument('--logfile', metavar='log', type=argparse.FileType('a'),
+						dest='log', default=stdout, help='name of log file')
+
+	# Interpret arguments
+	args = vars(parser.parse_args(argv))
+	ahf = args['ahf']
+	scale = args['scale']
+	batch = args['batch'] if args['batch'] != None else [None]
+	loglevel = args['loglevel']
+	logstream = args['log']
 
-# Assign hydrophobicities and LJ parameters and output the results
-out = open(oxyzqr, 'w')
-(residue, chain) = (0, 0)			# for tracking group in sequence
-(resgrp,atmord) = (dict(),list())	# for grouping output with order kept
-n = 0
-for (het,ll) in pqr:
-	n += 1
-
-	# Scale the charge
-	ll[8] = ll[8]*scale
-	# Convert xyzqr info to what seems to be the xyzqr file format:
-	info = " ".join([f"{ll[i]:.6f}" for i in range(5,10)]).strip()
-	# Grab the keys
-	res = ll[3].strip().upper()
-	atom = ll[2].strip().upper()
-
-	# The output has to be by residue because of terminal corrections
-	# Check for start of a residue - output the current one
-	if (het == 0 and atom == 'N') or het == 1:
-		# Output the current residue's extended lines
-		for a in atmord:
-			print(rgAsString(resgrp[a]), file=out)
-
-		# Reset the residue
-		(resgrp,atmord) = (dict(),list())
-		if het == 0:
-			if residue == 0:
-				chain += 1
-			residue += 1
-
-	# Spit out HETATMs directly and get the next line
-	if het > 0:
-		print(rgAsString([info, 0.0, (0.0, 0.0)]), file=out)
-		continue
-
-	# Construct L-J key
-	ljk = atom[0]
-	if ljk == 'H':
-		ljk += '0' if ll[9] == 0.0 else '1'
-	if ljk not in lj:
-		log.error(f"Unrecognised atom at line {n} in {pqrf}: {ll}")
-		exit(1)
-		
-	# Group ATOM residues - provisional assignment
-	resgrp[atom] = [info, 0.0, lj[ljk]]  # important 0.0 invalid
-	atmord += [atom]
-	# Ignore non-surface atoms
-	if gtsf != str() and tuple(ll[5:8]) not in surface:
-		pass
-	# For an initial NH3+ all four atoms are +2.0
-	elif residue == 1 and (atom == 'H2' or atom == 'H3'):
-		for a in ['N','H','H2','H3']:	# H2,3 have to come after N,H
-			if a in resgrp:
-				resgrp[a][1] = 2.0
-	# For a final COO- (OXT but not HXT) all three atoms are +2.0
-	elif atom == 'OXT':
-		for a in ['C','O','OXT']:		# OXT has to come after C,O
-			if a in resgrp:
-				resgrp[a][1] = 2.0
-	# Histidine can be weakly positive if it has an HE2
-	elif res == 'HIS' and atom == 'HE2':
-		for a in ['NE2','HE2']:			# Hs come after all others
-			if a in resgrp:
-				resgrp[a][1] = 2.0
-	# Otherwise assign specified hydrophobicity for now
-	elif (res+atom) in ah and resgrp[atom][1] == 0.0:
-		resgrp[atom][1] = ah[res+atom]
+	# Set up logging - if to stdout, assume caller handles time and module name
+	if logstream == stdout:
+		fmt="%(levelname)s:%(message)s"
 	else:
-		log.error(f"Unrecognised or duplicate atom at line {n} in {pqrf}: "\
-					f"{ll}")
-		exit(1)
-	# And move to the next chain, if there is one
-	if atom == 'OXT' or atom == 'HXT':
-		residue = 0
+		fmt="%(asctime)s %(module)s %(levelname)s:%(message)s"
+	log.basicConfig(stream=logstream, format=fmt,
+	                level=getattr(log, loglevel.upper()))
 
-# Output any final residue's extended lines
-for a in atmord:
-	print(rgAsString(resgrp[a]), file=out)
+	# Output filename substitutions
+	here = cwd if cwd != None else environ['PWD']
+	absolute = lambda fn: fn if fn == str() or fn[0] == pathsep \
+								else path.join(here, fn)
+	ahf = absolute(ahf)
 
-out.close()
+	# Read in the hydrophobicities
+	try:
+		ah = readHydrophobicities(ahf)
+	except ValueError as e:
+		log.error(str(e))
+		return 1
 
-# Exit cleanly
-exit(0)
+	# Assign hydrophobicities and LJ parameters to each pqr file
+	failed = 0
+	for s in batch:
+		(pqrf, gtsf, oxyzqr) = [absolute(args[a] if s == None
+								else args[a].replace("{s}", s))
+								for a in ['pqrf', 'gtsf', 'oxyzqr']]
+		ok = False
+		try:
+			pqr = readPQR(pqrf)
+			# Use the reference gts file, if any, to exclude non-surface atoms
+			surface = surfaceAtoms(pqr, readVertices(gtsf)) \
+						if gtsf != str() else None
+			try:
+				rows = assign(pqr, ah, scale, surface)
+			except ValueError as e:
+				raise ValueError(f"{e} in {pqrf}")
+			writeXYZQR(oxyzqr, rows)
+			ok = True
+		except ValueError as e:
+			log.error(str(e))
+			failed += 1
+		if s != None:
+			log.info(f"{s}: {len(rows)} atoms assigned" if ok else f"{s}: failed")
+	return 1 if failed > 0 else 0
 
+if __name__ == "__main__":
+	exit(main())
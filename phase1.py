@@ -54,9 +54,21 @@ GMRESmaxit	& GMRES max iterations**		& 100	\\
 QualPts		& Qualocation points**			& 0	\\
 QuadPts		& Quadrature points**			& 0	\\
 NbSize		& BEM neighbourhood size**		& 2200	\\
+LODlevels	& Coarser crowder meshes (\%)***	& None	\\
+LODdistance	& Debye lengths to coarsest mesh***	& 3.0	\\
+LODbatch	& Level changes per reinsertion***	& 8	\\
 
 * Warning:  setting this value may lead to crowders overlapping each other!
 ** See BEEP documentation for explanation.
+*** LODlevels, e.g. 50,10, turns on crowder level of detail:  each crowder
+is inserted from its own mesh when near a subject, and from the decimated
+<pdb>-50 and <pdb>-10 meshes (made by simpli.py) in even steps of the gap
+to the nearest subject, the coarsest beyond LODdistance Debye lengths
+(1/Kappa).  A crowder keeps its mesh while an MC move is tried;  once
+LODbatch accepted moves have taken crowders across a step, BEEP's crowder
+instances are reinserted, from the first changed, with their new meshes,
+and solved again so that later moves are compared with the energy of the
+new meshes:  each reinsertion costs one extra solve.
 [TBD] These features are not currently implemented.
 
 This module contains the following functions:
@@ -72,7 +84,8 @@ __all__ = [
 from sys import stdout,getsizeof,getallocatedblocks
 from resource import getrusage,RUSAGE_SELF
 import os.path as path
-from typing import Iterable, Tuple
+from os import environ
+from typing import Iterable, List, Tuple
 from math import exp, fsum
 import argparse
 import re
@@ -80,7 +93,7 @@ from pybeep import BEEP, Mesh, Vector, Quaternion
 from scenario import Scenario
 from packed_sphere_arena import PackedSphereArena
 from arena import CollisionError
-from pipeline import readPipeline, runPipeline
+from pipeline import readPipeline, runPipelines
 import random
 import logging as log
 from centre import calculate_mass
@@ -95,7 +108,38 @@ RT = 0.0083144598 * 300 # kJ K-1 mol-1 * K as BEEP produces kJ mol-1
 
 #=============================================================================
 # Functions
-	
+def lodLevel(gap: float, kappa: float, distance: float, n: int) -> int:
+	"""Returns the level of detail, from 0 (finest) to n-1 (coarsest), of a
+	crowder gap Angstroms from the nearest subject:  levels step evenly out
+	to distance Debye lengths (1/kappa), beyond which the coarsest is used."""
+	if n <= 1 or distance <= 0.0:
+		return 0
+	return min(n-1, max(0, int(gap*kappa*(n-1)/distance)))
+
+def subjectGap(location: Vector, radius: float, centres: List[Vector],
+			   radii: List[float]) -> float:
+	"""Returns the gap between the bounding spheres of a crowder at location
+	and the nearest subject."""
+	return min([(location - c).length() - r for (c, r) in zip(centres, radii)]) \
+		   - radius
+
+def compound(p: Quaternion, q: Quaternion) -> Quaternion:
+	"""Returns the rotation q followed by p, the quaternion product pq."""
+	return Quaternion(p.a*q.a - p.b*q.b - p.c*q.c - p.d*q.d,
+					  p.a*q.b + p.b*q.a + p.c*q.d - p.d*q.c,
+					  p.a*q.c + p.c*q.a + p.d*q.b - p.b*q.d,
+					  p.a*q.d + p.d*q.a + p.b*q.c - p.c*q.b)
+
+def reinsertCrowders(beep: BEEP, first: int, libids: List[int],
+					 locations: List[Vector], rotations: List[Quaternion],
+					 dprotein: float) -> None:
+	"""Replaces the mesh instances, from first on, with instances of the
+	library meshes at the locations and (absolute) rotations given, so
+	keeping their instance ids;  BEEP cannot change an instance's mesh."""
+	beep.clear_mesh_instances(first, -1)
+	for (m, v, q) in zip(libids, locations, rotations):
+		beep.insert_mesh_instance(m, v, q, dprotein)
+
 #=============================================================================
 # Utility classes and helpers
 # Results data storage and dumping
@@ -217,6 +261,11 @@ parser.add_argument('--nosolve', action='store_true', dest='nosolve',
 # -f force refresh of pipeline
 parser.add_argument('-f', action='store_true', dest='refresh',
                     help="force refresh of whole pipeline")
+# -j number of concurrent pipelines
+parser.add_argument('-j', metavar='jobs', type=int, dest='jobs', default=1,
+                    help="number of pipeline processes to run concurrently; "
+						 "if more than 1, each PDB Id logs to "
+						 "pipeline-<PDB-Id>.log")
 
 # Interpret arguments
 args = vars(parser.parse_args())
@@ -228,6 +277,7 @@ workdir=args['workdir']
 dropkin=args['kin']
 dropplot=args['r']
 solve=not args['nosolve'] # avoid double negatives later by using once here
+jobs=args['jobs']
 
 # Set up output
 out = args['outfile']
@@ -273,9 +323,25 @@ log.info("BEEP initialised: Dsolvent=%f, Kappa=%f, QuadPts=%d, QualPts=%d,"
             scenario.parameters['QuadPts'], scenario.parameters['QualPts'],
             scenario.parameters['NbSize'], scenario.parameters['Planar']))
 
-# Run pipeline for each PDB Id to get meshes and load into BEEP library
+# Run pipeline for each PDB Id without a mesh, concurrently if requested,
+# sharing stage outputs through the BEEP_STORE directory if set
+# Repeated PDB Ids are prepared once
+pdbids = dict.fromkeys(scenario.subjlist + scenario.crwdlist)
+missing = [path.join(workdir,pdbid) for pdbid in pdbids
+			if not path.isfile(path.join(workdir,pdbid) + ".mtz")]
+retcodes = runPipelines(pipeline, missing, refresh, jobs=jobs,
+						logdir=workdir if jobs > 1 else None,
+						store=environ.get('BEEP_STORE'))
+for pdbid in retcodes:
+	if retcodes[pdbid] < len(pipeline) - 1:
+		print(retcodes[pdbid], len(pipeline))
+		log.error(f"Failed to generate mesh files for {pdbid}, exiting")
+		exit(1)
+
+# Load meshes for each PDB Id into BEEP library
 masslist = dict()
 pvollist = dict()
+radlist = dict()	# Mesh radius by library id
 ressbjl = list()	# To hold subject results header info
 rescrwd = list()	# To hold crowder results header info
 meshes = dict()		# Used to detect repeats
@@ -290,14 +356,8 @@ for pdbid in scenario.subjlist + [str()] + scenario.crwdlist:
 		crowding = True
 		continue
 
-	# Find and check the mtz file for the pdb id
+	# The mtz file for the pdb id, prepared above if necessary
 	mtz = path.join(workdir,pdbid) + ".mtz"
-	if not path.isfile(mtz):
-		retcode = runPipeline(pipeline, path.join(workdir,pdbid), refresh)
-		if retcode < len(pipeline) - 1:
-			print(retcode, len(pipeline))
-			log.error("Failed to generate mesh files, exiting")
-			exit(1)
 
 	# Check for repeats (only load each mesh once to reduce memory demand)
 	# Record library ids - crowder instances processed later
@@ -317,6 +377,7 @@ for pdbid in scenario.subjlist + [str()] + scenario.crwdlist:
 	(masslist[lid],mc) = calculate_mass(path.join(workdir,pdbidonly) + "H.pdb")
 	pvollist[lid] = m.calculate_volume()
 	radius = m.get_radius()
+	radlist[lid] = radius
 	#mc = m.get_centre()
 	charge = fsum([m.get_charge(chg).charge for chg in range(m.num_charges)])
 	log.debug(f"Load subject {pdbid}, mass {masslist[lid]:.3f}, "
@@ -328,7 +389,30 @@ for pdbid in scenario.subjlist + [str()] + scenario.crwdlist:
 	else:
 		ressbjl += [(pdbid, radius)]
 	lid +=1
+
+# Load the coarser meshes of each crowder for level of detail, finest first
+lodlevels = sorted(scenario.parameters['LODlevels'], reverse=True)
+lodlib = list()		# Library ids of each crowder's levels of detail
+for (c, pdbid) in enumerate(scenario.crwdlist):
+	lodlib += [[lib[len(scenario.subjlist)+c]]]
+	for pct in lodlevels:
+		lodid = f"{pdbid.split('-')[0]}-{pct}"
+		if not lodid in meshes:
+			mtz = path.join(workdir,lodid) + ".mtz"
+			if not path.isfile(mtz):
+				log.error(f"No mesh {lodid}.mtz for level of detail, exiting "
+						  "(see simpli.py)")
+				exit(1)
+			m = beep.load_library_mesh(mtz)
+			radlist[lid] = m.get_radius()
+			log.debug(f"Load level of detail {lodid}, radius {radlist[lid]:.3f}")
+			meshes[lodid] = lid
+			lid += 1
+		lodlib[c] += [meshes[lodid]]
 log.info("BEEP library loaded")
+if len(lodlevels) > 0:
+	log.info(f"Crowder levels of detail {lodlevels}, coarsest beyond "
+			 f"{scenario.parameters['LODdistance']} Debye lengths")
 
 # Arena initialisation
 # Calculate packed sphere radius
@@ -407,6 +491,14 @@ for l in range(locnLen):
 		log.warning(f"Abandoning location {l}")
 		continue
 
+	# Level of detail of crowder species c at v, by its gap to the subjects
+	scentres = [scenario.locnlist[s][l] for s in range(cbase)]
+	sradii = [radlist[lib[s]] for s in range(cbase)]
+	level = lambda c, v: lodLevel(
+				subjectGap(v, radlist[lodlib[c][0]], scentres, sradii),
+				scenario.parameters['Kappa'],
+				scenario.parameters['LODdistance'], len(lodlib[c]))
+
 	# Can now set the crowd counts as the scenario is staged
 	#[TBD] add limitCrowdSize as a parameter for non-packed-sphere arena?
 	# Number of unoccupied packed spheres sets upper limit on crowding
@@ -428,6 +520,10 @@ for l in range(locnLen):
 		cloc = dict()	# crowder location in BEEP keyed by cid
 		crot = dict()	# crowder rotation in BEEP keyed by cid
 		cref = dict()	# crowder reference from PSA keyed by cid
+		corn = dict()	# crowder orientation (all rotations) keyed by cid
+		clod = dict()	# crowder level of detail keyed by cid
+		cmsh = dict()	# crowder level of detail in BEEP keyed by cid
+		(reinserts, reinserted) = (0, 0)	# LOD reinsertions and instances
 
 		# Set up the crowders for this run
 		log.info(f"Initialising crowders for run {r}")
@@ -456,17 +552,24 @@ for l in range(locnLen):
 				ctyp[cid] = c					# crowder species
 				crot[cid] = Quaternion.rand() \
 					if scenario.parameters['CrowderRotate'] else no_rotation
+				corn[cid] = crot[cid]
+				clod[cid] = cmsh[cid] = level(c, cloc[cid])
 				# Add to BEEP
 				log.debug(f"Insert {scenario.crwdlist[c]} instance {cid} "
-						  f"library id {lib[cbase+c]} "
+						  f"library id {lodlib[c][clod[cid]]} "
 						  f"at {cloc[cid]}, rotation {crot[cid]}")
-				beep.insert_mesh_instance(lib[cbase+c], cloc[cid], crot[cid],
+				beep.insert_mesh_instance(lodlib[c][clod[cid]], cloc[cid],
+										  crot[cid],
 				                          scenario.parameters['Dprotein'])
 				# Next crowder instance
 				cid += 1
 
 		# Report crowd configuration
 		#TODO
+		if len(lodlevels) > 0:
+			counts = [list(clod.values()).count(n)
+						for n in range(len(lodlevels)+1)]
+			log.info(f"Crowders at each level of detail, finest first: {counts}")
 
 		# Report mass proportions...
 		mass = msubj + sum([masslist[cbase+c]*crwdsize[c][r] \
@@ -567,8 +670,34 @@ for l in range(locnLen):
 				this_energy = next_energy
 				if c >= 0:
 					(cloc[c], crot[c], cref[c]) = (location, rotation, ref)
+					corn[c] = compound(rotation, corn[c])
+					clod[c] = level(ctyp[c], location)
 				log.info("Move accepted")
 
+			# Give crowders their new levels of detail once enough have changed
+			changed = [n for n in range(cbase, cid) if clod[n] != cmsh[n]]
+			if len(changed) >= max(scenario.parameters['LODbatch'], 1):
+				reinsertCrowders(beep, changed[0],
+					[lodlib[ctyp[n]][clod[n]] for n in range(changed[0], cid)],
+					[cloc[n] for n in range(changed[0], cid)],
+					[corn[n] for n in range(changed[0], cid)],
+					scenario.parameters['Dprotein'])
+				cmsh.update(clod)
+				(reinserts, reinserted) = (reinserts + 1,
+										   reinserted + cid - changed[0])
+				log.debug(f"[{it}] Level of detail changed for instances "
+						  f"{changed}, {cid - changed[0]} reinserted")
+
+				# Compare later moves with the energy of the new meshes
+				if solve:
+					log.debug(f"BEEP solve... {it} reinserted")
+					beep.solve(scenario.parameters['GMREStol'], \
+							scenario.parameters['GMRESmaxit'])
+				lod_energy = beep.calculate_energies() if solve else 0.0
+				log.info(f"Level of detail energy {lod_energy}, "
+						 f"change {lod_energy - this_energy}")
+				this_energy = lod_energy
+
 			# Garbage collection
 			gc.collect()
 			
@@ -578,6 +707,9 @@ for l in range(locnLen):
 		(0, this_energy, origin, no_rotation, 0)
 		it = iters  # for dump
 		results.dump()
+		if len(lodlevels) > 0:
+			log.info(f"Level of detail reinsertions {reinserts}, "
+					 f"instances reinserted {reinserted}")
 		if dropkin and l > 0:
 			beep.kinemage(path.join(workdir, f"mesh-{l}-{r}.kin"))
 		if dropplot and l > 0:
@@ -6,27 +6,108 @@ This module implements the management of a pipeline of processes.
 The pipeline is specified in a configuration file.
 
 Example use:
-	pipeline.py -p <pipeline-spec> <pdb>
+	pipeline.py -p <pipeline-spec> [-j <jobs>] <pdb> ...
 with <pdb> being a PDB Id.
 
+Each line of the pipeline specification is a tuple of input file types, the
+command and output file types, optionally followed by a dict of stage
+options:
+	heavy -- the stage is memory-heavy, so limited to --heavy concurrent runs
+	display -- the stage needs an X display, as do those run with xvfb-run
+	timeout -- seconds after which the stage's processes are killed
+	retries -- number of times a failed stage is run again, waiting backoff
+		seconds (default 10) before the first retry, doubling for each other
+
+Each stage is run in a scratch directory next to its PDB Id, holding links to
+its input files, and its outputs are only moved into place, by rename, when
+the command succeeds and all of them are present and not empty.  So a failed
+or killed command never leaves partial outputs for later stages.
+
+Each stage run records a manifest, <pdb><first-output-type>.manifest, next to
+its outputs.  This holds a fingerprint of the digests of its input files, its
+command (with the PDB Id directory removed) and the digests of any tools the
+command names, and the stage is only run again if the fingerprint changes.
+Outputs without a manifest are adopted if they are newer than their inputs.
+
+If a store directory is given (--store, or the BEEP_STORE environment
+variable), the outputs of each stage are also kept there by fingerprint,
+read-only, and a stage whose fingerprint is in the store has its outputs
+linked (or, across file systems, copied) from there instead of being run.
+
+With --displays N, up to N virtual X displays are started once and shared by
+the stages needing a display, instead of xvfb-run starting a server for each
+command.  The display is passed in DISPLAY and BEEP_DISPLAY, so that Python
+stages (e.g. simpli.py) run their own meshlab commands on it too.
+
+A command of the form py:<module>.<function> <arguments> is run in this
+process, by calling the function of the Python module (found where commands
+are run) with the list of arguments and the directory commands are run from,
+e.g. py:hydro.main -p {s}.pqr ...  The function returns the exit status.
+This saves starting an interpreter and importing numpy for each such stage.
+
+Each command run is recorded in pipeline-runs.jsonl, in the directory of its
+PDB Id, with its wall, user and system times, peak memory and output sizes;
+pipeline.py --report summarises these records by stage.
+
+pipeline.py --plan lists the stages that would be run for each PDB Id (given
+on the command line or, with --bsc, as setupResults.sh finds them in a
+scenario file), estimates their time and memory from the run records, and
+simulates runs with various -j and --heavy settings to propose one that
+meets any --max-time and --max-memory budget.
+
+This module contains the following classes:
+	- DisplayPool -- starts and shares virtual X displays
+
 This module contains the following functions:
 	- runCommand -- runs the specified command, managing logs and errors
 	- runPipeline -- runs processes in the pipeline if their input files
 	                 need to be updated
+	- runPipelines -- runs the pipeline for several PDB Ids concurrently
 	- readPipeline -- reads the pipeline configuration
+	- reportRuns -- summarises the run records of pipeline commands
+	- planPipelines -- estimates the work to bring PDB Ids up to date
+	- bscPdbIds -- lists the PDB Ids of a scenario file
+	- stageInputs, stageCommand, stageOutputs, stageOptions -- access the
+	                 parts of a pipeline stage
 """
-__version__ = '1.0'
+__version__ = '1.8'
 __all__ = [
+	'DisplayPool',
 	'runCommand',
 	'runPipeline',
+	'runPipelines',
 	'readPipeline',
+	'reportRuns',
+	'planPipelines',
+	'bscPdbIds',
+	'stageInputs',
+	'stageCommand',
+	'stageOutputs',
+	'stageOptions',
 ]
 
 # imports
-from os import environ as env, chdir, getcwd, remove, path, sep as pathsep
-from typing import Iterable, Tuple
+from os import environ as env, cpu_count, remove, replace, stat, chmod, link, makedirs, \
+			   symlink, killpg, wait4, waitstatus_to_exitcode, path, \
+			   sep as pathsep
+from tempfile import mkdtemp
+from typing import Dict, Iterable, List, Tuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import contextmanager, nullcontext
+from threading import BoundedSemaphore, Event, Lock, Thread, local
+from importlib import import_module
+from queue import Queue
 import argparse
+import atexit
+import hashlib
+import heapq
+import json
 import re
+import resource
+import shlex
+import sys
+import shutil
+import signal
 from io import TextIOWrapper
 import logging as log
 import subprocess
@@ -41,56 +122,633 @@ Pipeline = Iterable[Tuple]
 
 # Global variables
 quote = re.compile(r"'")
+here = path.dirname(path.realpath(__file__))	# Where commands are run
+words = re.compile(r"[^\s|&;<>()'\"]+")	# Candidate tool names in commands
+files = re.compile(r"\{s\}([^\s|&;<>()'\"]*)")	# File suffixes in commands
+digests = dict()	# File digests by (file, size, modification time)
+runrecord = "pipeline-runs.jsonl"	# Run record, in each PDB Id directory
+xvfbrun = re.compile(r"\bxvfb-run\s+(-a\s+|--auto-servernum\s+)?")
+recordlock = Lock()
+pycommand = re.compile(r"^py:([\w.]+)\.(\w+)(\s+|$)")	# In-process commands
+context = local()	# Display of the stage run by each thread, if any
+grace = 10	# Seconds between terminating and killing timed out processes
+bscpdb = re.compile(r"^\s*([-a-z0-9.A-Z]+)\s+(location|proportion)=")
+
+# Classes
+class DisplayPool:
+	""" Starts virtual X displays as needed, up to a limit, and shares them
+
+	Position Arguments:
+	- size -- maximum number of displays
+	- server -- command starting a display server, with {display} to be
+		replaced by the display number, default BEEP_DISPLAY_SERVER from
+		the environment if set, else Xvfb
+
+	A server is taken to be ready when its socket appears, or after startup
+	seconds if it is still running then (so any long-running command may
+	stand in for a server in testing).  A server that exits is assumed to
+	have found its display number in use, and the next number is tried.
+
+	Object Methods:
+	- display -- context manager providing a free display, e.g. ":101"
+	- stop -- stops all servers started
+	"""
+	def __init__(self, size: int, server: str = None, first: int = 100,
+				 startup: float = 2.0):
+		self._size = size
+		self._server = server if server != None else env.get(
+				'BEEP_DISPLAY_SERVER', "Xvfb :{display} -screen 0 1280x1024x24 "
+									   "-nolisten tcp")
+		(self._next, self._startup) = (first, startup)
+		self._free = Queue()
+		(self._procs, self._started) = (list(), 0)
+		self._lock = Lock()
+		atexit.register(self.stop)
+
+	def _start(self) -> str:
+		for _ in range(10):
+			with self._lock:
+				n = self._next
+				self._next += 1
+			if path.exists(f"/tmp/.X{n}-lock"):
+				continue
+			p = subprocess.Popen(shlex.split(self._server.format(display=n)),
+								 stdout=subprocess.DEVNULL,
+								 stderr=subprocess.DEVNULL,
+								 start_new_session=True)
+			end = time.time() + self._startup
+			while p.poll() == None and time.time() < end and \
+					not path.exists(f"/tmp/.X11-unix/X{n}"):
+				time.sleep(0.05)
+			if p.poll() == None:
+				log.info(f"Display :{n} started")
+				self._procs += [p]
+				return f":{n}"
+			log.debug(f"Display server for :{n} exited")
+		raise OSError(f"Unable to start a display with {self._server}")
+
+	def _acquire(self) -> str:
+		with self._lock:
+			start = self._free.empty() and self._started < self._size
+			if start:
+				self._started += 1
+		if start:
+			try:
+				return self._start()
+			except:
+				with self._lock:
+					self._started -= 1
+				raise
+		return self._free.get()
+
+	@contextmanager
+	def display(self):
+		d = self._acquire()
+		try:
+			yield d
+		finally:
+			self._free.put(d)
+
+	def stop(self) -> None:
+		for p in self._procs:
+			if p.poll() == None:
+				p.terminate()
+				try:
+					p.wait(5)
+				except subprocess.TimeoutExpired:
+					p.kill()
+		self._procs = list()
 
 # Functions
 
+# In-process Python commands
+def _pymodule(word: str) -> str:
+	"""Returns the file of the module named by a py: command word, if any."""
+	m = pycommand.match(word)
+	if m == None:
+		return None
+	fn = path.join(here, *m.group(1).split('.')) + ".py"
+	return fn if path.isfile(fn) else None
+
+def _runPython(cmd: str, logger: log.Logger, usage: dict) -> int:
+	"""Runs a py:<module>.<function> command in this process."""
+	m = pycommand.match(cmd)
+	if not here in sys.path:
+		sys.path.insert(0, here)
+	(ru0, start) = (resource.getrusage(resource.RUSAGE_THREAD), time.time())
+	try:
+		func = getattr(import_module(m.group(1)), m.group(2))
+		retcode = func(shlex.split(cmd[m.end():]), here)
+	except SystemExit as e:	# e.g. from argparse
+		retcode = e.code if type(e.code) == int else 0 if e.code == None else 1
+	except Exception as e:
+		logger.exception(f"Execution failed: {e}")
+		return -1
+	if usage != None:
+		ru = resource.getrusage(resource.RUSAGE_THREAD)
+		usage.update(wall=time.time()-start, user=ru.ru_utime-ru0.ru_utime,
+					 sys=ru.ru_stime-ru0.ru_stime,
+					 maxrss=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+	return retcode if retcode != None else 0
+
+# Timeouts:  processes are run in their own process group, which is signalled
+# as a whole so that children of the shell are stopped too
+def _expire(pgid: int, timeout: float, done: Event, expired: Event,
+			logger: log.Logger) -> None:
+	if done.wait(timeout):
+		return
+	expired.set()
+	logger.error(f"Process timed out after {timeout}s, terminating")
+	for sig in [signal.SIGTERM, signal.SIGKILL]:
+		try:
+			killpg(pgid, sig)
+		except ProcessLookupError:
+			return
+		if done.wait(grace):
+			return
+
 # Generic runCommand knows nothing of pipelines
-def runCommand(cmd: str, dummy = False) -> int:
+def runCommand(cmd: str, dummy = False, logger: log.Logger = None,
+			   usage: dict = None, display: str = None,
+			   timeout: float = None) -> int:
 	"""Runs the command provided, logging and reporting errors consistently.
 
 	- cmd	  -- the command to be run
 	- dummy	  -- if true does not run processes, just echoes commands.
+	- logger  -- logger to use, default the root logger
+	- usage	  -- if a dict, is set with the wall, user and sys times (s) and
+				 peak resident set size (maxrss, kB) of the command, which
+				 include those of any processes it waited for
+	- display -- X display to use instead of starting one with xvfb-run,
+				 default that of the stage run by this thread, if any, else
+				 BEEP_DISPLAY from the environment if set
+	- timeout -- seconds after which the command and any processes it started
+				 are terminated (killed if still running grace seconds later)
 
 	Note: the cmd is run from the directory determined by the python script
 	invocation (this is necessary because some commands are relative to this
 	location).  Filenames on the command line must therefore be absolute.
+	Neither the current directory nor the environment of this process are
+	changed, so commands may be run concurrently from several threads.
+	A py: command (see above) is run in this thread, and commands it runs in
+	turn use its display;  its usage has the times of this thread only, and
+	the peak resident set size of this process.  Timeouts do not apply to
+	py: commands, as a thread cannot be stopped.
 	"""
-	cwd = getcwd()
-	here = path.dirname(path.realpath(__file__))
-	chdir(here)
-	binpath = env['PATH']
-	if binpath[0:2] != ".:":
-		env['PATH'] = ".:" + binpath
+	logger = log.getLogger() if logger == None else logger
+	cmdenv = dict(env)
+	if cmdenv['PATH'][0:2] != ".:":
+		cmdenv['PATH'] = ".:" + cmdenv['PATH']
+	display = display if display != None else getattr(context, 'display', None)
+	display = display if display != None else env.get('BEEP_DISPLAY')
+	if display != None:
+		cmd = xvfbrun.sub("", cmd)
+		cmdenv['DISPLAY'] = cmdenv['BEEP_DISPLAY'] = display
 	retcode = -1
-	log.info("---")  # Separator line in logfile
-	log.info(cmd)
+	logger.info("---")  # Separator line in logfile
+	logger.info(cmd)
+	if pycommand.match(cmd) != None:
+		if dummy:
+			return 0
+		if timeout != None:
+			logger.warning("Timeout not applied to in-process command")
+		context.display = display
+		try:
+			retcode = _runPython(cmd, logger, usage)
+		finally:
+			context.display = None
+		if retcode != 0:
+			logger.warning(f"Process returned {retcode}")
+		else:
+			logger.info("Process completed successfully")
+		return retcode
 	echo = ""
 	if dummy:
 		echo = "echo "
 		cmd = "'" + quote.sub("''", cmd) + "'"
 	try:
-		p = subprocess.Popen(echo + cmd, shell=True, env = env,
-                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-		for line in p.stdout:
-			log.info(line)
-		retcode = p.wait()  # No timeout, consider adding timeouts to pipeline
+		start = time.time()
+		timeout = None if dummy else timeout
+		p = subprocess.Popen(echo + cmd, shell=True, cwd=here, env=cmdenv,
+                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+							 start_new_session=timeout != None)
+		(done, expired) = (Event(), Event())
+		if timeout != None:
+			Thread(target=_expire, args=(p.pid, timeout, done, expired, logger),
+				   daemon=True).start()
+		try:
+			for line in p.stdout:
+				logger.info(line)
+			# wait4 rather than wait, for the resource usage of this child only
+			(_, status, ru) = wait4(p.pid, 0)
+		finally:
+			done.set()
+		p.returncode = retcode = waitstatus_to_exitcode(status)
+		if usage != None:
+			usage.update(wall=time.time()-start, user=ru.ru_utime,
+						 sys=ru.ru_stime, maxrss=ru.ru_maxrss)
 	except OSError as e:
-		log.error(f"Execution failed: {e}")
+		logger.error(f"Execution failed: {e}")
 		return -1
-	finally:
-		chdir(cwd)
-		env['PATH'] = binpath
 
-	if retcode < 0:
-		log.warning("Process terminated by signal %d" % (-retcode))
+	if expired.is_set():
+		logger.error(f"Process timed out, ended by signal {-retcode}" \
+					 if retcode < 0 else f"Process timed out, returned {retcode}")
+		retcode = retcode if retcode != 0 else -signal.SIGTERM
+	elif retcode < 0:
+		logger.warning("Process terminated by signal %d" % (-retcode))
 	elif retcode > 0:
-		log.warning(f"Process returned {retcode}")
+		logger.warning(f"Process returned {retcode}")
 	else:
-		log.info("Process completed successfully")
+		logger.info("Process completed successfully")
 	return retcode
 
+# Pipeline stage access:  (command-index, input, ..., command, output, ...)
+# with an optional trailing dict of stage options
+def stageInputs(stage: Tuple) -> Tuple:
+	return stage[1:stage[0]]
+
+def stageCommand(stage: Tuple) -> str:
+	return stage[stage[0]]
+
+def stageOutputs(stage: Tuple) -> Tuple:
+	return tuple([t for t in stage[stage[0]+1:] if type(t) != dict])
+
+def stageOptions(stage: Tuple) -> dict:
+	return stage[-1] if type(stage[-1]) == dict else dict()
+
+# Stage fingerprints
+def _digest(fn: str) -> str:
+	"""Returns the SHA-256 digest of a file, remembering it until it changes."""
+	st = stat(fn)
+	key = (fn, st.st_size, st.st_mtime_ns)
+	if not key in digests:
+		h = hashlib.sha256()
+		with open(fn, 'rb') as f:
+			for buf in iter(lambda: f.read(1 << 20), b''):
+				h.update(buf)
+		digests[key] = h.hexdigest()
+	return digests[key]
+
+def _manifest(stage: Tuple, pdbid: str) -> dict:
+	"""Returns the manifest of a stage for the pdb id, or None if an input
+	file is missing.  Tools are words of the command naming files, either
+	relative to where commands are run or on the PATH, or the modules of py:
+	commands."""
+	pdb = path.basename(pdbid)
+	cmd = stageCommand(stage).format(s=pdb, ll="{ll}")
+	inputs = dict()
+	for t in stageInputs(stage):
+		if not path.isfile(f"{pdbid}{t}"):
+			return None
+		inputs[t] = _digest(f"{pdbid}{t}")
+	tools = dict()
+	files = [f"{pdb}{t}" for t in stageInputs(stage) + stageOutputs(stage)]
+	binpath = env['PATH'].replace(".:", here + ":", 1) \
+				if env['PATH'][0:2] == ".:" else here + ":" + env['PATH']
+	for word in words.findall(cmd):
+		if word[0] == '-' or word in files or word in tools:
+			continue
+		tool = _pymodule(word) if word[0:3] == "py:" else path.join(here, word)
+		if tool != None and not path.isfile(tool):
+			tool = shutil.which(word, path=binpath) if not pathsep in word \
+					else None
+		if tool != None:
+			tools[word] = _digest(tool)
+	manifest = dict(command=cmd, inputs=inputs, tools=tools)
+	manifest['fingerprint'] = hashlib.sha256(
+				json.dumps(manifest, sort_keys=True).encode()).hexdigest()
+	return manifest
+
+def _manifestFile(stage: Tuple, pdbid: str) -> str:
+	return f"{pdbid}{stageOutputs(stage)[0]}.manifest"
+
+def _readManifest(fn: str) -> dict:
+	try:
+		with open(fn) as f:
+			return json.load(f)
+	except (OSError, ValueError):
+		return None
+
+def _writeManifest(fn: str, manifest: dict) -> None:
+	with open(fn + ".tmp", 'w') as f:
+		json.dump(manifest, f, indent=1, sort_keys=True)
+	replace(fn + ".tmp", fn)
+
+def _status(stage: Tuple, pdbid: str, manifest: dict) -> str:
+	"""Returns 'current' if the outputs of a stage match its manifest,
+	'legacy' if they have no manifest but no input is newer than them,
+	'changed' if its fingerprint has changed, else 'missing'."""
+	outputs = [f"{pdbid}{t}" for t in stageOutputs(stage)]
+	if manifest == None or len([fn for fn in outputs if not path.exists(fn)]) > 0:
+		return 'missing'
+	previous = _readManifest(_manifestFile(stage, pdbid))
+	if previous != None:
+		return 'current' if previous.get('fingerprint') == \
+				manifest['fingerprint'] else 'changed'
+	pt = min([path.getmtime(fn) for fn in outputs])
+	return 'legacy' if len([t for t in stageInputs(stage)
+							if path.getmtime(f"{pdbid}{t}") > pt]) == 0 \
+			else 'changed'
+
+# Content-addressed store of stage outputs:  <store>/<fp[0:2]>/<fp>/ holds
+# output<type> for each output type of the stage with fingerprint fp
+def _storeEntry(store: str, manifest: dict) -> str:
+	fp = manifest['fingerprint']
+	return path.join(store, fp[0:2], fp)
+
+def _place(src: str, dst: str) -> None:
+	"""Hard links src to dst, replacing dst, or copies if linking fails."""
+	if path.lexists(dst):
+		remove(dst)
+	try:
+		link(src, dst)
+	except OSError:
+		shutil.copy2(src, dst)
+
+def _stored(store: str, stage: Tuple, manifest: dict) -> bool:
+	"""Returns true if the store holds all the outputs of a stage."""
+	entry = _storeEntry(store, manifest)
+	return len([t for t in stageOutputs(stage)
+				if not path.isfile(path.join(entry, f"output{t}"))]) == 0
+
+def _fetch(store: str, stage: Tuple, pdbid: str, manifest: dict) -> bool:
+	"""Places the stored outputs of a stage, returning true if found."""
+	if not _stored(store, stage, manifest):
+		return False
+	entry = _storeEntry(store, manifest)
+	for t in stageOutputs(stage):
+		_place(path.join(entry, f"output{t}"), f"{pdbid}{t}")
+	return True
+
+def _publish(store: str, stage: Tuple, pdbid: str, manifest: dict,
+			 logger: log.Logger) -> None:
+	"""Adds the outputs of a stage to the store, read-only."""
+	entry = _storeEntry(store, manifest)
+	if path.isdir(entry):
+		return
+	tmp = None
+	try:
+		makedirs(path.dirname(entry), exist_ok=True)
+		tmp = mkdtemp(dir=path.dirname(entry), prefix=".tmp-")
+		for t in stageOutputs(stage):
+			fn = path.join(tmp, f"output{t}")
+			_place(f"{pdbid}{t}", fn)
+			chmod(fn, 0o444)
+		_writeManifest(path.join(tmp, "manifest"), manifest)
+		replace(tmp, entry)
+	except OSError as e:
+		# Another process may have published the same entry first
+		if not path.isdir(entry):
+			logger.warning(f"Unable to add to store {store}: {e}")
+		if tmp != None:
+			shutil.rmtree(tmp, ignore_errors=True)
+
+# Run records:  one JSON object per line for each command run
+def _record(fn: str, record: dict) -> None:
+	with recordlock:
+		try:
+			with open(fn, 'a') as f:
+				print(json.dumps(record), file=f)
+		except OSError as e:
+			log.warning(f"Unable to write run record {fn}: {e}")
+
+def _readRuns(fns: List[str], key) -> dict:
+	"""Returns the run records of the files, grouped by key(record) into
+	dicts of successful runs, count of failed runs and set of PDB Ids.
+	Missing files are skipped, as are lines that cannot be read, such as
+	a last line cut short by a killed run."""
+	stages = dict()
+	for fn in fns:
+		try:
+			f = open(fn)
+		except OSError as e:
+			log.warning(f"Skipping run record {fn}: {e}")
+			continue
+		with f:
+			for line in f:
+				try:
+					r = json.loads(line)
+					(k, ok, pdb) = (key(r), r['retcode'] == 0, r['pdb'])
+				except (ValueError, KeyError, TypeError):
+					continue
+				if not k in stages:
+					stages[k] = dict(runs=list(), failed=0, pdbs=set())
+				if ok:
+					stages[k]['runs'] += [r]
+					stages[k]['pdbs'].add(pdb)
+				else:
+					stages[k]['failed'] += 1
+	return stages
+
+def reportRuns(fns: List[str]) -> List[str]:
+	"""Summarises run records by stage, slowest first, as lines of text.
+
+	- fns	  -- names of run record files
+	Only successful runs are included in the times, memory and sizes.
+	"""
+	stages = _readRuns(fns, lambda r: (r['outputs'], r['command']))
+	lines = [f"{'stage':<16} {'runs':>5} {'fail':>4} {'pdbs':>4} "
+			 f"{'wall-tot':>9} {'wall-av':>8} {'wall-max':>8} {'cpu-av':>8} "
+			 f"{'rss-max':>8} {'out-av':>8}  command"]
+	total = lambda k: sum([r['wall'] for r in stages[k]['runs']])
+	for key in sorted(stages, key=total, reverse=True):
+		(runs, ns) = (stages[key]['runs'], max(len(stages[key]['runs']),1))
+		wall = [r['wall'] for r in runs] + [0]
+		cpu = sum([r['user']+r['sys'] for r in runs]) / ns
+		rss = max([r['maxrss'] for r in runs] + [0]) / 1024
+		out = sum([sum(r['sizes'].values()) for r in runs]) / ns / (1 << 20)
+		lines += [f"{key[0]:<16} {len(runs):>5} {stages[key]['failed']:>4} "
+				  f"{len(stages[key]['pdbs']):>4} {sum(wall):9.1f} "
+				  f"{sum(wall)/ns:8.1f} {max(wall):8.1f} {cpu:8.1f} "
+				  f"{rss:7.1f}M {out:7.2f}M  {key[1]}"]
+	return lines
+
+# Planning:  the stages to run for each PDB Id, their costs estimated from run
+# records, and simulated runs as by runPipelines
+def bscPdbIds(bsc: TextIOWrapper) -> List[str]:
+	"""Returns the sorted PDB Ids of the subject and crowder lines of a
+	scenario (.bsc) file, as setupResults.sh lists them in PDBLIST."""
+	pdbids = set()
+	for line in bsc:
+		m = bscpdb.match(line)
+		if m != None:
+			pdbids.add(m.group(1))
+	return sorted(pdbids)
+
+def _stale(pipe: Pipeline, pdbid: str, store: str = None) -> Dict[int, str]:
+	"""Returns the processes that would be run for the pdb id, each with
+	'run' or, if its outputs would be taken from the store, 'store'.  A
+	process after one that is run is assumed to be run too."""
+	(deps, order) = _dependencies(pipe)
+	stale = dict()
+	for n in order:
+		if len([d for d in deps[n] if stale.get(d) == 'run']) > 0:
+			stale[n] = 'run'
+			continue
+		manifest = _manifest(pipe[n], pdbid)
+		if _status(pipe[n], pdbid, manifest) in ['current', 'legacy']:
+			continue
+		stale[n] = 'store' if store != None and manifest != None and \
+						_stored(store, pipe[n], manifest) else 'run'
+	return stale
+
+def _simulate(tasks: List[List[Tuple]], jobs: int, heavy: int) \
+				-> Tuple[float, float]:
+	"""Returns the time and peak memory of running the tasks of each PDB Id
+	as runPipelines would with jobs and heavy.  Each task is a tuple of its
+	duration, memory, heaviness and the indexes of the tasks it follows."""
+	(pending, active, ready, running) = (list(range(len(tasks))), set(),
+										 list(), list())
+	done = [set() for _ in tasks]
+	(now, mem, peak, slots, heavyslots) = (0.0, 0.0, 0.0, jobs, heavy)
+	while True:
+		# PDB Ids each take a worker of the pool until all their tasks are done
+		while len(active) < jobs and len(pending) > 0:
+			p = pending.pop(0)
+			if len(tasks[p]) == 0:
+				continue
+			active.add(p)
+			ready += [(p, t) for t in range(len(tasks[p]))
+						if len(tasks[p][t][3]) == 0]
+		# Start ready tasks, first come first served, as slots allow
+		for (p, t) in ready[:]:
+			(dur, m, hv, _) = tasks[p][t]
+			if slots > 0 and (heavyslots > 0 or not hv):
+				ready.remove((p, t))
+				(slots, heavyslots) = (slots-1, heavyslots-(1 if hv else 0))
+				mem += m
+				heapq.heappush(running, (now+dur, p, t))
+		peak = max(peak, mem)
+		if len(running) == 0:
+			return (now, peak)
+		# Finish the next tasks to end
+		now = running[0][0]
+		while len(running) > 0 and running[0][0] <= now:
+			(_, p, t) = heapq.heappop(running)
+			(dur, m, hv, _) = tasks[p][t]
+			(slots, heavyslots) = (slots+1, heavyslots+(1 if hv else 0))
+			mem -= m
+			done[p].add(t)
+			ready += [(p, u) for u in range(len(tasks[p]))
+						if t in tasks[p][u][3] and tasks[p][u][3] <= done[p]]
+			if len(done[p]) == len(tasks[p]):
+				active.remove(p)
+
+def _hms(seconds: float) -> str:
+	return f"{int(seconds)//3600}:{int(seconds)//60%60:02d}:{int(seconds)%60:02d}"
+
+def planPipelines(pipe: Pipeline, pdbids: List[str], runs: List[str],
+				  store: str = None, maxtime: float = None,
+				  maxmem: float = None, maxjobs: int = None) -> List[str]:
+	"""Plans bringing the pdb ids up to date, as lines of text.
+
+	- pipe	  -- the pipeline, as for runPipeline
+	- pdbids  -- list of PDB Ids, as paths (see runPipeline)
+	- runs	  -- names of run record files giving stage costs
+	- store	  -- store directory of stage outputs, if any
+	- maxtime -- time budget (s), if any
+	- maxmem  -- memory budget (kB), if any
+	- maxjobs -- largest number of jobs considered, default the CPU count
+	Each stage to be run is estimated to take the mean wall time and peak
+	memory of its successful runs, or nothing if there are none;  a stage
+	whose outputs are in the store is taken to take no time.  The proposed
+	-j and --heavy are the fewest jobs (and then heavy stages) meeting the
+	budgets, or if there is no time budget the fastest within the memory
+	budget.
+	"""
+	costs = _readRuns([fn for fn in runs if path.isfile(fn)],
+					  lambda r: r['outputs'])
+	cost = lambda n: (sum([r['wall'] for r in costs[n]['runs']]) /
+					  len(costs[n]['runs']),
+					  max([r['maxrss'] for r in costs[n]['runs']])) \
+				if n in costs and len(costs[n]['runs']) > 0 else None
+	(deps, _) = _dependencies(pipe)
+	(tasks, unknown, serial, stored) = (list(), set(), 0.0, 0)
+	lines = [f"{'pdb':<16} {'run':>4} {'store':>5} {'est-wall':>9}  processes"]
+	for pdbid in pdbids:
+		stale = _stale(pipe, pdbid, store)
+		todo = sorted(stale)
+		task = list()
+		for n in todo:
+			c = cost(" ".join(stageOutputs(pipe[n])))
+			if c == None and stale[n] == 'run':
+				unknown.add(n)
+			(dur, m) = c if c != None and stale[n] == 'run' else (0.0, 0.0)
+			task += [(dur, m, stageOptions(pipe[n]).get('heavy', False),
+					  set([todo.index(d) for d in deps[n] if d in stale]))]
+		tasks += [task]
+		wall = sum([t[0] for t in task])
+		serial += wall
+		nstore = len([n for n in todo if stale[n] == 'store'])
+		stored += nstore
+		lines += [f"{path.basename(pdbid):<16} {len(todo)-nstore:>4} "
+				  f"{nstore:>5} {_hms(wall):>9}  "
+				  f"{' '.join([str(n) for n in todo])}"]
+	total = sum([len(t) for t in tasks])
+	lines += ["", f"{len(pdbids)} PDB Ids, {total-stored} processes to run and "
+			  f"{stored} from store, {_hms(serial)} run one at a time"]
+	if len(unknown) > 0:
+		lines += ["No run records for processes "
+				  f"{' '.join([str(n) for n in sorted(unknown)])}, "
+				  "estimated to take no time"]
+	if total == 0:
+		return lines
+
+	# Simulate runs with numbers of jobs and heavy stages up to the CPU count
+	maxjobs = maxjobs if maxjobs != None else cpu_count() or 1
+	counts = sorted(set([1 << i for i in range(maxjobs.bit_length())] + [maxjobs]))
+	plans = [(j, h) + _simulate(tasks, j, h)
+			 for j in counts for h in counts if h <= j]
+	lines += ["", f"{'jobs':>4} {'heavy':>5} {'est-time':>9} {'peak-mem':>9}"]
+	lines += [f"{j:>4} {h:>5} {_hms(t):>9} {m/(1 << 20):8.1f}G"
+			  for (j, h, t, m) in plans]
+	fits = [p for p in plans if maxmem == None or p[3] <= maxmem]
+	if len(fits) == 0:
+		lines += ["", "No plan meets the memory budget"]
+		return lines
+	intime = [p for p in fits if maxtime != None and p[2] <= maxtime]
+	if len(intime) > 0:
+		(j, h, t, m) = min(intime, key=lambda p: (p[0], p[1]))
+	else:
+		if maxtime != None:
+			lines += ["", "No plan meets the time budget"]
+		(j, h, t, m) = min(fits, key=lambda p: (round(p[2]), p[0], p[1]))
+	lines += ["", f"Proposed:  pipeline.py -j {j} --heavy {h}, "
+			  f"estimated {_hms(t)} and {m/(1 << 20):.1f}G"]
+	return lines
+
+# Pipeline dependency graph:  each stage depends on the stages producing its
+# input types;  types produced by no stage are source files (e.g. .pdb)
+def _dependencies(pipe: Pipeline) -> Tuple[List[set], List[int]]:
+	"""Returns the set of stages each stage depends on, and an order in
+	which stages may be run.  The terminal entry is not included."""
+	stages = [n for n in range(len(pipe)) if pipe[n][0] > 0]
+	producer = dict()
+	for n in stages:
+		for t in stageOutputs(pipe[n]):
+			if t in producer:
+				log.error(f"File type {t} produced by processes "
+						  f"{producer[t]} and {n}")
+				raise ValueError
+			producer[t] = n
+	deps = [set([producer[t] for t in stageInputs(pipe[n]) if t in producer])
+				if n in stages else set() for n in range(len(pipe))]
+	# Topological order, preferring configuration order
+	order = list()
+	while len(order) < len(stages):
+		ready = [n for n in stages if not n in order and deps[n] <= set(order)]
+		if len(ready) == 0:
+			log.error("Pipeline processes depend on each other in a cycle")
+			raise ValueError
+		order += [ready[0]]
+	return (deps, order)
+
 # Pipeline management
-def runPipeline(pipe: Pipeline, pdbid: str, refresh=False, dummy=False) -> int:
+def runPipeline(pipe: Pipeline, pdbid: str, refresh=False, dummy=False,
+				logger: log.Logger = None, heavy: BoundedSemaphore = None,
+				slots: BoundedSemaphore = None, store: str = None,
+				displays: DisplayPool = None) -> int:
 	"""Runs the process pipeline for the pdb id supplied.
 
 	- pipe	  -- list of tuples;  the last element in each tuple is the process 
@@ -99,70 +757,207 @@ def runPipeline(pipe: Pipeline, pdbid: str, refresh=False, dummy=False) -> int:
 	- pdbid	  -- a string for the PDB Id
 	- refresh -- if true forces the pipeline to run for each process.
 	- dummy	  -- if true does not run processes, just echoes commands.
-	Returns the number of the process in the pipeline that was reached.
+	- logger  -- logger to use, default the root logger
+	- heavy	  -- semaphore limiting concurrent runs of heavy stages, if any
+	- slots	  -- semaphore limiting concurrent runs of all stages, if any
+	- store	  -- store directory of stage outputs, if any
+	- displays -- pool of X displays for stages needing one, if any
+	Processes form a graph by their input and output file types.  Each is
+	considered as soon as the processes it depends on are complete, and run
+	if an output is missing or its fingerprint has changed (see above), and
+	its outputs are not in the store, concurrently with any others that are
+	ready.  Each is run in a scratch directory, subject to its timeout and
+	retries options (see above), and its outputs moved into place if it
+	succeeds.
+	Returns the number of the process in the pipeline that was reached:  the
+	terminal entry if all succeeded, else the first that did not complete,
+	or -1 if a source file is missing.
 	"""
-	# Start processing from the first out-of-date or non-existent file type
-	ll=log.getLevelName(log.getLogger().getEffectiveLevel())
-	#lf=log.getLogger().handlers[0].baseFilename  - no multiple process logging
-	required = 0 if refresh else len(pipe)  # type: int
-	for n in range(len(pipe)):
-		if required > n:
-			# Find oldest output file
-			pt = None  # previous file modification time
-			for t in pipe[n][pipe[n][0]+1:]:
-				file = f"{pdbid}{t}"  # type: str
-				if path.exists(file):
-					mt = path.getmtime(file)
-					if pt == None or mt < pt:
-						pt = mt
-				else:
-					log.debug(f"Output {file} not found")
-					required = n
-					break
-			log.debug(f"Oldest output for process {n} is {file}")
-	
-			# Test each input file age against oldest output file
-			for t in pipe[n][1:pipe[n][0]]:
-				if required <= n:	# Already found requirement
-					break
-				try:
-					file = f"{pdbid}{t}"  # type: str
-					log.debug(f"Test {file} existence")
-					assert path.exists(file)
-					mt = path.getmtime(file)
-					log.debug(f"Test {file} time")
-					assert mt <= pt
-				except:
-					log.debug("Required from here {n}")
-					required = -1
-				if required >= 0:  # Input exists and is younger than output
-					continue
-				if n == 0:  # First input not found
-					break
-				# Find process with this input as output
-				try:
-					required = \
-						[r for r in range(n) if t in pipe[r][pipe[r][0]+1:]][0]
-					log.debug(f"Set required to {required}")
-				except:
-					log.error(f"File type {t} used before produced")
-					raise
-				break
-		if required < 0:
-			log.error(f"Error:  {pdbid}.pdb not found")
-			break
-		elif required < n:
-			cmd = pipe[required][pipe[required][0]].format(s=pdbid,ll=ll)
-			if runCommand(cmd, dummy) != 0:
-				# Delete the output from the failed command
-				for t in pipe[required][pipe[required][0]+1:]:
-					try:
-						os.remove(f"{pdbid}{t}")
-					except:
-						pass
+	logger = log.getLogger() if logger == None else logger
+	ll=log.getLevelName(logger.getEffectiveLevel())
+	(deps, order) = _dependencies(pipe)
+
+	# Source files, produced by no process, must exist
+	for n in order:
+		for t in stageInputs(pipe[n]):
+			file = f"{pdbid}{t}"  # type: str
+			if len([d for d in deps[n] if t in stageOutputs(pipe[d])]) == 0 \
+					and not path.exists(file):
+				logger.error(f"Error:  {file} not found")
+				return -1
+
+	# Run a process once, in a scratch directory of links to its inputs,
+	# holding a heavy slot (first) and a general slot while it runs;  move its
+	# outputs into place only if it succeeded and they are all present
+	def attempt(n: int, tries: int) -> int:
+		options = stageOptions(pipe[n])
+		scratch = None
+		try:
+			if dummy:
+				spdbid = pdbid
+			else:
+				scratch = mkdtemp(dir=path.dirname(pdbid),
+								  prefix=f".{path.basename(pdbid)}-{n}-")
+				spdbid = path.join(scratch, path.basename(pdbid))
+				for t in stageInputs(pipe[n]):
+					symlink(f"{pdbid}{t}", f"{spdbid}{t}")
+			cmd = stageCommand(pipe[n]).format(s=spdbid,ll=ll)
+			heavyslot = heavy if heavy != None and options.get('heavy') \
+							else nullcontext()
+			display = displays.display() if displays != None and not dummy and \
+						(options.get('display') or xvfbrun.search(cmd)) \
+						else nullcontext()
+			(usage, queued) = (dict(), time.time())
+			with heavyslot, (slots if slots != None else nullcontext()), \
+					display as d:
+				started = time.time()
+				retcode = runCommand(cmd, dummy, logger, usage, d,
+									 options.get('timeout'))
+			if dummy:
+				return retcode
+			# Output validation:  each must exist and not be empty
+			missing = [t for t in stageOutputs(pipe[n])
+						if not path.exists(f"{spdbid}{t}") or
+						   path.getsize(f"{spdbid}{t}") == 0]
+			if retcode == 0 and len(missing) > 0:
+				logger.error(f"Process {n} produced no {' '.join(missing)}")
+				retcode = 1
+			_record(path.join(path.dirname(pdbid), runrecord),
+					dict(started=time.strftime("%Y-%m-%dT%H:%M:%S",
+											   time.localtime(started)),
+						 pdb=path.basename(pdbid), stage=n,
+						 outputs=" ".join(stageOutputs(pipe[n])),
+						 command=stageCommand(pipe[n]), retcode=retcode,
+						 attempt=tries, queued=started-queued, **usage,
+						 sizes=dict([(t, path.getsize(f"{spdbid}{t}"))
+									 for t in stageOutputs(pipe[n])
+									 if path.isfile(f"{spdbid}{t}")])))
+			# Renaming replaces any links into the store, not their targets
+			if retcode == 0:
+				for t in stageOutputs(pipe[n]):
+					if path.isdir(f"{pdbid}{t}") and not path.islink(f"{pdbid}{t}"):
+						shutil.rmtree(f"{pdbid}{t}")
+					replace(f"{spdbid}{t}", f"{pdbid}{t}")
+			return retcode
+		except OSError as e:
+			logger.error(f"Process {n} not run: {e}")
+			return -1
+		finally:
+			if scratch != None:
+				shutil.rmtree(scratch, ignore_errors=True)
+
+	# Run a process if necessary, retrying as its options allow
+	def run(n: int) -> int:
+		outputs = [f"{pdbid}{t}" for t in stageOutputs(pipe[n])]
+		mfn = _manifestFile(pipe[n], pdbid)
+		manifest = _manifest(pipe[n], pdbid)
+		status = _status(pipe[n], pdbid, manifest) if not refresh else 'missing'
+		if status == 'current':
+			logger.debug(f"Process {n} is up to date")
+			return 0
+		elif status == 'legacy':
+			# Legacy outputs:  adopt as no input is newer than them
+			logger.info(f"Adopting outputs of process {n}")
+			if not dummy:
+				_writeManifest(mfn, manifest)
+			return 0
+		elif status == 'changed':
+			logger.debug(f"Process {n} fingerprint has changed")
+		if store != None and not refresh and not dummy and manifest != None \
+				and _fetch(store, pipe[n], pdbid, manifest):
+			logger.info(f"Outputs of process {n} taken from store")
+			_writeManifest(mfn, manifest)
+			return 0
+		options = stageOptions(pipe[n])
+		retries = options.get('retries', 0) if not dummy else 0
+		for tries in range(retries+1):
+			if tries > 0:
+				delay = options.get('backoff', 10) * 2**(tries-1)
+				logger.warning(f"Process {n} failed, retrying in {delay}s")
+				time.sleep(delay)
+			retcode = attempt(n, tries)
+			if retcode == 0:
 				break
-			required += 1
-	return required
+		if retcode != 0:
+			# Delete the outputs and manifest left by earlier runs
+			for fn in outputs + [mfn]:
+				try:
+					remove(fn)
+				except OSError:
+					pass
+		elif not dummy:
+			# Inputs were complete before running, as processes they depend on
+			# had completed, and are unchanged by this process
+			manifest = manifest if manifest != None else _manifest(pipe[n], pdbid)
+			_writeManifest(mfn, manifest)
+			if store != None:
+				_publish(store, pipe[n], pdbid, manifest, logger)
+		return retcode
+
+	# Run each process once those it depends on are done;  after a failure
+	# let running processes finish but start no more
+	(pending, running, failed) = (order[:], dict(), set())
+	with ThreadPoolExecutor(max_workers=max(len(pending),1)) as pool:
+		while len(running) > 0 or (len(pending) > 0 and len(failed) == 0):
+			for n in [n for n in pending if len(failed) == 0 and \
+						len(deps[n] & (set(pending) | set(running.values()))) == 0]:
+				pending.remove(n)
+				running[pool.submit(run, n)] = n
+			(done, _) = wait(running, return_when=FIRST_COMPLETED)
+			for future in done:
+				if future.result() != 0:
+					failed.add(running[future])
+				del running[future]
+	incomplete = failed | set(pending)
+	return min(incomplete) if len(incomplete) > 0 else len(pipe) - 1
+
+# Concurrent pipelines for several PDB Ids
+def runPipelines(pipe: Pipeline, pdbids: List[str], refresh=False, dummy=False,
+				 jobs=1, heavy=1, logdir: str = None,
+				 store: str = None, displays: DisplayPool = None) \
+				 -> Dict[str, int]:
+	"""Runs the process pipeline for each pdb id, several at a time.
+
+	- pipe	  -- the pipeline, as for runPipeline
+	- pdbids  -- list of PDB Ids, as paths (see runPipeline)
+	- refresh -- if true forces the pipeline to run for each process.
+	- dummy	  -- if true does not run processes, just echoes commands.
+	- jobs	  -- maximum number of processes running at once
+	- heavy	  -- maximum number of heavy stages running at once, or None
+	- logdir  -- if set, each PDB Id logs to pipeline-<pdb>.log in this
+				 directory, rather than to the root logger
+	- store	  -- store directory of stage outputs, if any
+	- displays -- pool of X displays for stages needing one, if any
+	Returns a dict by pdb id of the number of the process reached.
+	"""
+	heavyslots = BoundedSemaphore(heavy) if heavy != None else None
+	slots = BoundedSemaphore(max(jobs,1))
+	rootlog = log.getLogger()
+	def run(pdbid: str) -> int:
+		logger = None
+		if logdir != None:
+			name = path.basename(pdbid)
+			logger = log.getLogger(f"pipeline.{name}")
+			logger.propagate = False
+			logger.setLevel(rootlog.getEffectiveLevel())
+			handler = log.FileHandler(path.join(logdir, f"pipeline-{name}.log"),
+									  mode='w')
+			handler.setFormatter(log.Formatter(
+						"%(asctime)s %(levelname)s:%(message)s"))
+			logger.addHandler(handler)
+		rootlog.info(f"Pipeline started for {pdbid}")
+		try:
+			rv = runPipeline(pipe, pdbid, refresh, dummy, logger, heavyslots,
+							 slots, store, displays)
+		finally:
+			if logger != None:
+				logger.removeHandler(handler)
+				handler.close()
+		rootlog.info(f"Pipeline reached process {rv} for {pdbid}")
+		return rv
+	with ThreadPoolExecutor(max_workers=max(jobs,1)) as pool:
+		futures = [(pdbid, pool.submit(run, pdbid)) for pdbid in pdbids]
+	return dict([(pdbid, future.result()) for (pdbid, future) in futures])
 
 # Reading the pipeline configuration
 # This is possibly a little quick and dirty...
@@ -176,15 +971,25 @@ def readPipeline(pcfg: TextIOWrapper) -> Pipeline:
 	# Set the first element to be the index to the command
 	for p in range(len(pipe)):
 		for c in range(len(pipe[p])):
-			if "{s}" in pipe[p][c]:
+			if type(pipe[p][c]) == str and "{s}" in pipe[p][c]:
 				pipe[p] = tuple([c+1] + pipe[p])
 				break
 		if c >= len(pipe[p])-1:
 			log.error("No command specification found in process {p}")
 			raise ValueError
+	# Stages run in scratch directories holding only their inputs, so every
+	# file a command names must be an input, an output or an output stem
+	for p in pipe:
+		(inputs, outputs) = (stageInputs(p), stageOutputs(p))
+		for t in files.findall(stageCommand(p)):
+			if not t in inputs and \
+			   len([o for o in outputs if o.startswith(t)]) == 0:
+				log.error(f"{{s}}{t} is neither an input nor an output of "
+						  f"\"{stageCommand(p)}\"")
+				raise ValueError(f"Undeclared file type {t} in pipeline")
 	# Add the terminal entry - final outputs become inputs, blank command
 	try:
-		pipe += [(-1, pipe[-1][pipe[-1][0]+1:], '')]
+		pipe += [(-1, stageOutputs(pipe[-1]), '')]
 	except:
 		log.error("No output specification on final process")
 		raise
@@ -214,9 +1019,52 @@ if __name__== "__main__":
 	# -d dummy run - only log the commands that would be run
 	parser.add_argument('-d', action='store_true', dest='dummy',
 						help='dummy run, log commands to be run only')
+	# -j number of concurrent pipelines
+	parser.add_argument('-j', metavar='jobs', type=int, dest='jobs', default=1,
+						help='number of processes to run concurrently, for any '
+							 'PDB Ids;  if more than 1, each PDB Id logs to '
+							 'pipeline-<PDB-Id>.log')
+	# --heavy number of concurrent heavy stages
+	parser.add_argument('--heavy', metavar='jobs', type=int, dest='heavy',
+						default=1,
+						help='number of memory-heavy stages to run concurrently')
+	# --store directory of stage outputs shared between working directories
+	parser.add_argument('--store', metavar='store-dir', dest='store',
+						default=env.get('BEEP_STORE'),
+						help='directory in which to keep and find stage outputs '
+							 'by fingerprint, default $BEEP_STORE if set')
+	# --displays number of shared virtual displays
+	parser.add_argument('--displays', metavar='N', type=int, dest='displays',
+						default=0,
+						help='number of virtual X displays to share between '
+							 'stages, rather than each using xvfb-run '
+							 '(server command $BEEP_DISPLAY_SERVER if set)')
+	# --report summarise run records rather than running the pipeline
+	parser.add_argument('--report', metavar='runs', nargs='*', dest='report',
+						default=None,
+						help='report times and memory by stage from run record '
+							 'files, default pipeline-runs.jsonl in work-dir')
+	# --plan estimate the work to be done rather than running the pipeline
+	parser.add_argument('--plan', action='store_true', dest='plan',
+						help='list the processes to be run for each PDB Id and '
+							 'propose -j (up to the -j given, if more than 1, '
+							 'else the CPU count) and --heavy, from the times '
+							 'and memory in the run records of work-dir')
+	# --bsc scenario file naming PDB Ids
+	parser.add_argument('--bsc', metavar='scenario', type=argparse.FileType('r'),
+						dest='bsc', default=None,
+						help='scenario file from which to take further PDB Ids')
+	# --max-time time budget for --plan
+	parser.add_argument('--max-time', metavar='hours', type=float,
+						dest='maxtime', default=None,
+						help='time budget for --plan')
+	# --max-memory memory budget for --plan
+	parser.add_argument('--max-memory', metavar='GB', type=float,
+						dest='maxmem', default=None,
+						help='memory budget for --plan')
 	# PDB Ids
 	parser.add_argument('pdbidlist', metavar='PDB-Id',
-						nargs='+',
+						nargs='*',
 						help='list of PDB Ids to be processed')
 
 	# Interpret arguments
@@ -227,11 +1075,37 @@ if __name__== "__main__":
 	workdir=args['workdir']
 	dummy = args['dummy']
 	pdbidlist = args['pdbidlist']
+	jobs = args['jobs']
+	heavy = args['heavy']
+	store = args['store']
+	displays = DisplayPool(args['displays']) \
+				if args['displays'] > 0 and not dummy else None
 
 	# Interpret workdir as an absolute path
 	if workdir[0] != pathsep:
 		workdir = path.join(env['PWD'], workdir)
 
+	# Report on run records only
+	if args['report'] != None:
+		runs = args['report'] if len(args['report']) > 0 \
+				else [path.join(workdir, runrecord)]
+		print("\n".join(reportRuns(runs)))
+		exit(0)
+	if args['bsc'] != None:
+		pdbidlist += [p for p in bscPdbIds(args['bsc']) if not p in pdbidlist]
+	if len(pdbidlist) == 0:
+		parser.error("at least one PDB Id is required")
+
+	# Plan only
+	if args['plan']:
+		print("\n".join(planPipelines(readPipeline(pcfg),
+						[path.join(workdir, pdbid) for pdbid in pdbidlist],
+						[path.join(workdir, runrecord)], store,
+						args['maxtime'] * 3600 if args['maxtime'] != None else None,
+						args['maxmem'] * (1 << 20) if args['maxmem'] != None else None,
+						jobs if jobs > 1 else None)))
+		exit(0)
+
 	# Set up logging
 	logfile = workdir+pathsep+"pipeline.log"
 	log.basicConfig(filename=logfile, filemode='w',
@@ -243,13 +1117,17 @@ if __name__== "__main__":
 	log.info("Pipeline read with %d processes" % (len(pipeline)))
 
 	# Run the pipeline using absolute path of PDB files
-	for pdbid in pdbidlist:
-		pdbpath = path.join(workdir, pdbid) if pdbid[0] != pathsep else pdbid
-		rv = runPipeline(pipeline, path.join(workdir, pdbid), refresh, dummy)
-		if rv < len(pipeline) - 1:
-			print(rv, len(pipeline))
-			log.error("Failed to generate mesh files, exiting")
-			exit(1)
+	pdbpaths = [path.join(workdir, pdbid) for pdbid in pdbidlist]
+	rvs = runPipelines(pipeline, pdbpaths, refresh, dummy, jobs, heavy,
+					   workdir if jobs > 1 else None, store, displays)
+	if displays != None:
+		displays.stop()
+	failed = [pdbid for pdbid in pdbpaths if rvs[pdbid] < len(pipeline) - 1]
+	for pdbid in failed:
+		print(rvs[pdbid], len(pipeline), pdbid)
+	if len(failed) > 0:
+		log.error("Failed to generate mesh files, exiting")
+		exit(1)
 
 	# Exit cleanly
 	print(f"See {logfile}")
@@ -3,159 +3,227 @@
 """MRes Bioinformatics with Systems Biology Project
 
 This script converts EDTSurf PLY files to GTS format.
-It does a basic job and is not a general PLY to GTS converter.
+It does a basic job and is not a general PLY to GTS converter:  the faces
+must be triangles, but the PLY file may be ASCII or binary little-endian.
 
 Example use:
 	ply2gts.py file-prefix
-converts file-prefix.ply to file-prefix.gts and file-prefix.xyz
+converts file-prefix.ply to file-prefix.gts and file-prefix.xyz, the latter
+holding each vertex with its normal, the normalised sum of the normals of
+its faces weighted by their areas.
+
+The steps are also available as functions, e.g.
+	(vertices, text, faces) = readPLY("x.ply")
+	(edges, faceedges) = faceEdges(faces)
+	normals = vertexNormals(vertices, faces)
+with faceEdges, writeGTS and writeXYZ from coordio.
 """
-__version__ = '1.0'
+__version__ = '1.3'
 __all__ = [
+	'main',
+	'readPLY',
+	'faceEdges',
+	'vertexNormals',
 ]
 
 # imports
-from typing import Iterable, Tuple, List, Dict
-from pybeep import Vector
+from typing import List, Tuple
 from sys import stdout
+from os import path, sep as pathsep
+from numpy import add, arange, array, concatenate, cross, cumsum, dtype, \
+				  float64, fromfile, int64, ndarray, sqrt, stack, where, zeros
+from coordio import faceEdges, lineBytes, lineIndex, mapFile, parseBlock, \
+					tokenCounts, writeGTS, writeXYZ
 import argparse
 import logging as log
 
-# Types
-Coord = Tuple[float, float, float] # Coordinates x,y,z
-
-# Utilities
-
-# Main program
-
-# Set up command line parsing
-parser = argparse.ArgumentParser(description=\
-				'Convert EDTSurf PLY file to GTS format.')
-# --loglevel
-parser.add_argument('--loglevel', metavar='(INFO|WARNING|ERROR)',
-					dest='loglevel', default="INFO",
-                    help='minimum log level to capture: INFO, WARNING, ERROR')
-# --logfile
-parser.add_argument('--logfile', metavar='log', type=argparse.FileType('a'),
-					dest='log', default=stdout, help='name of log file')
-# file-prefix
-parser.add_argument('file-prefix', metavar='file-prefix',
-                    help='prefix of input ply file')
-
-# Interpret arguments
-args = vars(parser.parse_args())
-plyfile = args['file-prefix']+".ply"
-gtsfile = args['file-prefix']+".gts"
-xyzfile = args['file-prefix']+".xyz"
-loglevel = args['loglevel']
-logstream = args['log']
-
-# Set up logging - if to stdout, assume caller handles time and module name
-if logstream == stdout:
-	fmt="%(levelname)s:%(message)s"
-else:
-	fmt="%(asctime)s %(module)s %(levelname)s:%(message)s"
-log.basicConfig(stream=logstream, format=fmt,
-                level=getattr(log, loglevel.upper()))
-
-# Produce the GTS file first
-perm = (1, 2, 2, 0, 0, 1)
-(fn, vn, en, ec) = (0, 0, 0, 0)
-(edge, face, vertex, normal, vertri) = (dict(), list(), list(), list(), dict())
-out = open(gtsfile,'w')
-with open(plyfile) as f:
-	state = 0
-	n = 0
-	for line in f:
+# Global variables
+# PLY property types as numpy types
+plytypes = dict(char='i1', uchar='u1', short='i2', ushort='u2', int='i4',
+				uint='u4', float='f4', double='f8', int8='i1', uint8='u1',
+				int16='i2', uint16='u2', int32='i4', uint32='u4',
+				float32='f4', float64='f8')
+
+# Functions
+def _readHeader(f) -> Tuple[str, List, int]:
+	"""Returns the format and the elements of a PLY header, each a list of
+	name, count and (property name, type, list count type or None), and the
+	number of lines in the header."""
+	(fmt, elements, n) = (None, list(), 0)
+	for line in iter(f.readline, b''):
 		n += 1
-		line.strip()
-
-		# Read header
-		if state == 0:
-			if line[0:15] == "element vertex ":
-				try:
-					vn = int(line[15:])
-				except:
-					log.error(f"Integer not found for vertex count, line {n}")
-					exit(1)
-			elif line[0:13] == "element face ":
-				try:
-					fn = int(line[13:])
-				except:
-					log.error(f"Integer not found for face count, line {n}")
-					exit(1)
-				if fn % 2 != 0:
-					log.error(f"Weird face count {fn}, line {n}")
-					exit(1)
-			elif line[0:10] == "end_header":
-				en = int(3*fn/2)
-				print(f"{vn} {en} {fn} GtsSurface GtsFace GtsEdge GtsVertex",
-					  file=out)
-				state = 1
-		# Vertices
-		elif state == 1:
-			ll = line.split()
-			print(f"{ll[0]} {ll[1]} {ll[2]}", file=out)
-			try:
-				vertex.append(Vector(*[float(ll[i]) for i in range(3)]))
-			except:
-				log.error(f"Bad vertex {ll[0:3]}, line {n}")
-				exit(1)
-			vn -= 1
-			if vn == 0:
-				state = 2
-		# Faces, er, edges
-		elif state == 2:
-			ll = line.split()
-			if ll[0] != "3":
-				log.error(f"Weird face vertex count {ll[0]}, line {n}")
-				exit(1)
-			# define and store unique edges and define faces in terms of these
+		ll = line.decode('ascii', 'replace').split()
+		if len(ll) == 0:
+			continue
+		elif ll[0] == 'format':
+			fmt = ll[1] if len(ll) > 1 else None
+		elif ll[0] == 'element':
 			try:
-				vix = [int(ll[i]) for i in range(1,4)]
-			except:
-				log.error(f"Bad face vertex index {ll[1:4]}, line {n}")
-				exit(1)
-			face.append(list())
-			for i in range(3):
-				k = tuple(sorted((vix[perm[2*i]],vix[perm[2*i+1]])))
-				if k not in edge:
-					ec += 1
-					edge[k] = ec
-					print(f"{k[0]+1:d} {k[1]+1:d}", file=out)
-				face[-1].append(edge[k])
-
-				# Add the triangle (face) to the list for each vertex
-				v = vertex[vix[i]]
-				if v in vertri:
-					vertri[v].append(len(face)-1)
-				else:
-					vertri[v] = [len(face)-1]
-			if ec > en:
-				log.error(f"Sorry, goofed on edge count {ec} > {en}, line {n}")
-				exit(1)
-			# Calculate the normal to this face and record it
-			v1 = vertex[vix[1]]-vertex[vix[0]]
-			v2 = vertex[vix[2]]-vertex[vix[0]]
-			norm = v1.cross(v2)
-			#norm.normalise() -- unnormalised makes value proportional to area
-			normal.append(norm)
-
-# Finally, output the new faces in the gts file
-for nf in face:
-	print(f"{nf[0]:d} {nf[1]:d} {nf[2]:d}", file=out)
-out.close()
-
-# Now generate the xyz file
-out = open(xyzfile,'w')
-for v in vertex:
-	norm = Vector(0,0,0)
-	for fix in vertri[v]:
-		norm = norm + normal[fix] # weighted by face area
-	norm.normalise()
-	print(f"{v.x:.6f} {v.y:.6f} {v.z:.6f} " +
-		  f"{norm.x:.6f} {norm.y:.6f} {norm.z:.6f}", file=out)
-out.close()
-
-# Exit cleanly
-exit(0)
+				elements.append([ll[1], int(ll[2]), list()])
+			except (IndexError, ValueError):
+				raise ValueError(f"Integer not found for {ll[1:2]} count, "
+								 f"line {n}")
+		elif ll[0] == 'property' and len(elements) > 0:
+			if len(ll) == 5 and ll[1] == 'list':
+				elements[-1][2].append((ll[4], ll[3], ll[2]))
+			elif len(ll) == 3:
+				elements[-1][2].append((ll[2], ll[1], None))
+			else:
+				raise ValueError(f"Unrecognised property, line {n}")
+		elif ll[0] == 'end_header':
+			return (fmt, elements, n)
+	raise ValueError("No end_header found")
+
+def _readASCII(plyfile: str, first: int,
+			   elements: List) -> Tuple[ndarray, ndarray, ndarray]:
+	(vertices, text, faces) = (None, None, None)
+	buf = mapFile(plyfile)
+	starts = lineIndex(buf)
+	for (name, count, props) in elements:
+		if name == 'vertex':
+			vertices = parseBlock(buf, starts, first, count, 3, float64)
+			# Keep the coordinates as given, usually the only properties
+			tokens = array(lineBytes(buf, starts, first, count).split())
+			counts = tokenCounts(buf, starts, first, count)
+			if len(counts) > 0 and (counts == counts[0]).all():
+				text = tokens.reshape(count, -1)[:,0:3].astype(str)
+			else:
+				index = concatenate([[0], cumsum(counts)[:-1]])
+				text = tokens[index[:,None] + arange(3)].astype(str)
+		elif name == 'face':
+			faces = parseBlock(buf, starts, first, count, 4, int64)
+			weird = (faces[:,0] != 3).nonzero()[0]
+			if len(weird) > 0:
+				raise ValueError(f"Weird face vertex count {faces[weird[0],0]}, "
+								 f"line {first+weird[0]+1}")
+			faces = faces[:,1:4]
+		first += count
+	return (vertices, text, faces)
+
+def _readBinary(f, elements: List) -> Tuple[ndarray, ndarray]:
+	(vertices, faces) = (None, None)
+	for (name, count, props) in elements:
+		# Triangle faces make list properties a fixed size
+		fields = list()
+		for (prop, ptype, ctype) in props:
+			if not ptype in plytypes or (ctype != None and not ctype in plytypes):
+				raise ValueError(f"Unrecognised type of property {prop}")
+			if ctype == None:
+				fields += [(prop, '<' + plytypes[ptype])]
+			else:
+				fields += [(prop + '-count', '<' + plytypes[ctype]),
+						   (prop, '<' + plytypes[ptype], 3)]
+		data = fromfile(f, dtype=dtype(fields), count=count)
+		if len(data) < count:
+			raise ValueError(f"Only {len(data)} of {count} {name} elements read")
+		if name == 'vertex':
+			vertices = stack([data[c] for c in 'xyz'], axis=1).astype(float64)
+		elif name == 'face':
+			lists = [p for (p, _, c) in props if c != None]
+			if len(lists) != 1:
+				raise ValueError("Faces do not have one list of vertices")
+			weird = (data[lists[0] + '-count'] != 3).nonzero()[0]
+			if len(weird) > 0:
+				raise ValueError("Weird face vertex count "
+								 f"{data[lists[0] + '-count'][weird[0]]}, "
+								 f"face {weird[0]}")
+			faces = data[lists[0]].astype(int64)
+	return (vertices, faces)
+
+def readPLY(plyfile: str) -> Tuple[ndarray, ndarray, ndarray]:
+	"""Returns the vertices, (n,3) floats, the vertex coordinates as text
+	(for an ASCII file, else None) and the faces, (m,3) vertex indexes, of a
+	PLY file of triangles.  Raises ValueError if the file is not one."""
+	with open(plyfile, 'rb') as f:
+		(fmt, elements, lines) = _readHeader(f)
+		names = [e[0] for e in elements]
+		if not 'vertex' in names or not 'face' in names:
+			raise ValueError("Vertex or face element missing")
+		if fmt == 'ascii':
+			(vertices, text, faces) = _readASCII(plyfile, lines, elements)
+		elif fmt == 'binary_little_endian':
+			(vertices, faces) = _readBinary(f, elements)
+			text = None
+		else:
+			raise ValueError(f"Unsupported PLY format {fmt}")
+	if len(faces) > 0 and (faces.min() < 0 or faces.max() >= len(vertices)):
+		raise ValueError("Face vertex index out of range")
+	return (vertices, text, faces)
+
+def vertexNormals(vertices: ndarray, faces: ndarray) -> ndarray:
+	"""Returns the unit normal at each vertex, the sum of the normals of its
+	faces weighted by their areas (zero if it has no faces)."""
+	v0 = vertices[faces[:,0]]
+	normal = cross(vertices[faces[:,1]] - v0, vertices[faces[:,2]] - v0)
+	sums = zeros(vertices.shape)
+	for i in range(3):
+		add.at(sums, faces[:,i], normal)
+	length = sqrt((sums*sums).sum(axis=1))
+	return sums / where(length > 0, length, 1.0)[:,None]
 
+# Main program
+def main(argv: List[str] = None, cwd: str = None) -> int:
+	"""Runs ply2gts.py with the given arguments, returning the exit status.
+
+	- argv	  -- command line arguments, default sys.argv[1:]
+	- cwd	  -- directory for a relative file-prefix, default the current one
+	"""
+	# Set up command line parsing
+	parser = argparse.ArgumentParser(description=\
+					'Convert EDTSurf PLY file to GTS format.')
+	# --loglevel
+	parser.add_argument('--loglevel', metavar='(INFO|WARNING|ERROR)',
+						dest='loglevel', default="INFO",
+	                    help='minimum log level to capture: INFO, WARNING, ERROR')
+	# --logfile
+	parser.add_argument('--logfile', metavar='log', type=argparse.FileType('a'),
+						dest='log', default=stdout, help='name of log file')
+	# file-prefix
+	parser.add_argument('file-prefix', metavar='file-prefix',
+	                    help='prefix of input ply file')
+
+	# Interpret arguments
+	args = vars(parser.parse_args(argv))
+	prefix = args['file-prefix']
+	if cwd != None and prefix[0] != pathsep:
+		prefix = path.join(cwd, prefix)
+	plyfile = prefix+".ply"
+	gtsfile = prefix+".gts"
+	xyzfile = prefix+".xyz"
+	loglevel = args['loglevel']
+	logstream = args['log']
+
+	# Set up logging - if to stdout, assume caller handles time and module name
+	if logstream == stdout:
+		fmt="%(levelname)s:%(message)s"
+	else:
+		fmt="%(asctime)s %(module)s %(levelname)s:%(message)s"
+	log.basicConfig(stream=logstream, format=fmt,
+	                level=getattr(log, loglevel.upper()))
+
+	# Read the surface and find its edges:  for a closed surface of
+	# triangles there are 3/2 edges per face
+	try:
+		(vertices, text, faces) = readPLY(plyfile)
+		if len(faces) % 2 != 0:
+			raise ValueError(f"Weird face count {len(faces)}")
+		(edges, faceedges) = faceEdges(faces)
+		if len(edges) > len(faces)*3//2:
+			raise ValueError(f"Sorry, goofed on edge count {len(edges)} > "
+							 f"{len(faces)*3//2}")
+	except ValueError as e:
+		log.error(f"{e} in {plyfile}")
+		return 1
+
+	# Produce the GTS file, with the vertices as given if they were text
+	writeGTS(gtsfile, text if text is not None else vertices, edges,
+			 faceedges, edgecount=len(faces)*3//2)
+
+	# Now generate the xyz file
+	writeXYZ(xyzfile, concatenate([vertices, vertexNormals(vertices, faces)],
+								  axis=1))
+
+	return 0
+
+if __name__ == "__main__":
+	exit(main())
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# Author: Adam Light <la002@mail.cryst.bbk.ac.uk>
+"""BEEP results data access
+
+This module provides utilities to decode the results data written by
+phase1.py, and to keep the analyses made from it by results.py in an
+on-disk cache so that re-plotting does not need to decode it all again,
+and to keep running statistics while a simulation is still writing it.
+See results.py for details of the results file layout.
+
+Example use:
+	from resdata import ResultsReader, ResultsCache
+
+	cache = ResultsCache("results.dat", (elim, subsel))
+	reader = ResultsReader()
+	with open("results.dat", 'rb') as dat:
+		reader.read(dat)
+	for (l, r, it, e) in reader.energy:
+		...
+
+The module contains the following public classes:
+	- ResultsReader -- Decodes complete record groups from a results file
+	- ResultsCache -- Stores indexing state and analyses for a results file
+	- RunningStats -- Keeps running statistics per (location, run) block
+"""
+__version__ = '1.0'
+__all__ = [
+	'ResultsReader',
+	'ResultsCache',
+	'RunningStats',
+	'Status',
+]
+
+from typing import Any, List, Tuple
+from math import sqrt
+from enum import IntEnum
+from io import BufferedReader
+from os import path, makedirs, replace, remove, stat, listdir
+from pickle import Unpickler, UnpicklingError, dump, load
+import hashlib
+import logging as log
+
+#=============================================================================
+# Global variables
+# Cache status of a results file
+Status = IntEnum('Status', 'stale grown current', start=0)
+
+#=============================================================================
+# Functions
+# Digest of the first size bytes of a file
+def _digest(fn: str, size: int) -> str:
+	h = hashlib.sha1()
+	with open(fn, 'rb') as f:
+		while size > 0:
+			buf = f.read(min(size, 1 << 20))
+			if len(buf) == 0:
+				break
+			h.update(buf)
+			size -= len(buf)
+	return h.hexdigest()
+
+#=============================================================================
+# Classes
+class ResultsReader:
+	""" Decodes the record groups of a phase1.py results file
+
+	Position Arguments:
+	- header -- header record already read, if any
+	- version -- results format version, used until a header is read
+
+	Object Attributes:
+	- header -- the first header record read (None if none)
+	- version -- results format version (3 if there is no header)
+	- energy, subjects, crowders, locations, rotations, outcomes -- lists of
+		records, one entry per group, in file order;  crowders is empty
+		before version 5
+	- offsets -- list of the file offsets at which each group starts
+	- offset -- file offset following the last complete group read
+
+	Object Methods:
+	- read -- decodes complete groups from a binary stream
+	- clear -- forgets the groups read so far
+	"""
+	def __init__(self, header: list = None, version: int = 3):
+		self.header = header
+		self.version = header[1] if header != None else version
+		self.offset = 0
+		self.clear()
+
+	def clear(self) -> None:
+		"""Forgets the groups read so far, but not the header or offset."""
+		(self.energy, self.subjects, self.crowders) = (list(), list(), list())
+		(self.locations, self.rotations) = (list(), list())
+		self.outcomes = list()
+		self.offsets = list()
+
+	def read(self, dat: BufferedReader, offset: int = None) -> int:
+		"""Reads complete record groups, returning the number read.
+
+		- dat	  -- binary stream of results data
+		- offset  -- file offset of a group to start from, default self.offset
+		An incomplete final group, as left by a running simulation, is not
+		consumed;  a later read from self.offset will pick it up.
+		"""
+		self.offset = self.offset if offset == None else offset
+		dat.seek(self.offset)
+		results = Unpickler(dat)	# Memo is cleared at each group start
+		count = 0
+		while True:
+			try:
+				record = results.load()
+				if type(record[0]) != int:	# Header:  all should be the same
+					if self.header == None:
+						self.header = record
+						self.version = record[1]
+					record = results.load()
+				group = [results.load()
+							for _ in range(5 if self.version > 4 else 4)]
+			except (EOFError, UnpicklingError):
+				break
+			self.offsets += [self.offset]
+			self.energy += [record]
+			self.subjects += [group[0]]
+			if self.version > 4:
+				self.crowders += [group[1]]
+			self.locations += [group[-3]]
+			self.rotations += [group[-2]]
+			self.outcomes += [group[-1]]
+			self.offset = dat.tell()
+			count += 1
+		return count
+
+
+class ResultsCache:
+	""" Keeps results.py analyses alongside the results file they came from
+
+	Position Arguments:
+	- dfn -- results file name
+	- options -- tuple of the analysis options on which the cache depends;
+		each distinct tuple has its own cache
+
+	Cached data lives in <results>.cache/<options-digest>/ as a state record,
+	keyed by the results file size, modification time and a digest of the
+	data it covers, and one analysis record per (location, run) block, keyed
+	by the number of record groups in the block.  As results files only ever
+	grow, a block whose group count is unchanged is still valid.
+
+	Object Attributes:
+	- state -- the cached state dict, or None if there is none
+
+	Object Methods:
+	- status -- compares the results file with the cached state
+	- clear -- discards all cached data
+	- save -- stores the state, covering results data up to an offset
+	- loadBlock, saveBlock -- retrieve or store the analysis of a block
+	"""
+	def __init__(self, dfn: str, options: Tuple):
+		self._dfn = dfn
+		key = hashlib.sha1(repr(options).encode()).hexdigest()[0:12]
+		self._dir = path.join(path.splitext(dfn)[0] + ".cache", key)
+		self._writable = True
+		self._stat = None		# Results file status when last checked
+		self.state = self._load("state.pkl")
+
+	def _load(self, fn: str) -> Any:
+		try:
+			with open(path.join(self._dir, fn), 'rb') as f:
+				return load(f)
+		except FileNotFoundError:
+			return None
+		except Exception as e:
+			log.warning(f"Ignoring unreadable cache file {fn}: {e}")
+			return None
+
+	def _save(self, fn: str, data: Any) -> None:
+		if not self._writable:
+			return
+		try:
+			makedirs(self._dir, exist_ok=True)
+			tfn = path.join(self._dir, fn + ".tmp")
+			with open(tfn, 'wb') as f:
+				dump(data, f)
+			replace(tfn, path.join(self._dir, fn))
+		except OSError as e:
+			log.warning(f"Unable to write cache in {self._dir}: {e}")
+			self._writable = False
+
+	def status(self) -> Status:
+		"""Reports whether the cached state still matches the results file.
+
+		The file status found here is what a later save records, so this
+		should be called before reading the results file.
+		"""
+		try:
+			self._stat = stat(self._dfn)
+		except OSError:
+			return Status.stale
+		if self.state == None:
+			return Status.stale
+		(size, mtime, offset, digest) = self.state['fingerprint']
+		try:
+			st = self._stat
+			if st.st_size == size and st.st_mtime_ns == mtime:
+				return Status.current
+			if st.st_size >= offset and _digest(self._dfn, offset) == digest:
+				return Status.grown
+		except OSError:
+			pass
+		return Status.stale
+
+	def clear(self) -> None:
+		"""Discards the cached state and all cached blocks."""
+		self.state = None
+		try:
+			for fn in listdir(self._dir):
+				remove(path.join(self._dir, fn))
+		except OSError:
+			pass
+
+	def save(self, state: dict, offset: int) -> None:
+		"""Stores the state as covering the results file up to offset."""
+		st = self._stat if self._stat != None else stat(self._dfn)
+		state['fingerprint'] = (st.st_size, st.st_mtime_ns, offset,
+								_digest(self._dfn, offset))
+		self._save("state.pkl", state)
+		self.state = state
+
+	def loadBlock(self, k: Tuple[int,int], count: int) -> Any:
+		"""Returns cached analysis values for block k if it has count groups."""
+		blk = self._load(f"block-{k[0]}-{k[1]}.pkl")
+		return blk[1] if blk != None and blk[0] == count else None
+
+	def saveBlock(self, k: Tuple[int,int], count: int, values: Any) -> None:
+		"""Stores analysis values for block k, calculated from count groups."""
+		self._save(f"block-{k[0]}-{k[1]}.pkl", (count, values))
+
+
+class RunningStats:
+	""" Keeps running statistics for each (location, run) block of results
+
+	Statistics are updated from each batch of record groups decoded, so that
+	a growing results file need only be decoded once.  The iteration rate
+	of a block is measured between the times at which its records are seen,
+	so it is only available once the block has grown while being followed.
+
+	Object Attributes:
+	- blocks -- dict by (location-idx, run-idx) of dicts of:
+		its -- number of records;  accepted, proposed -- counts of moves;
+		mean, m2 -- running mean and sum of squared differences of the
+		accepted energy;  it0, t0 and it, t -- iteration and time when the
+		block was first and last seen
+
+	Object Methods:
+	- update -- adds the records held by a ResultsReader
+	- rate -- iterations per hour of a block
+	- summary -- lists the statistics as lines of text
+	"""
+	def __init__(self):
+		self.blocks = dict()
+
+	def update(self, reader: ResultsReader, when: float) -> int:
+		"""Adds the records read, seen at time when, returning their count."""
+		for n in range(len(reader.energy)):
+			(l,r,it,e) = reader.energy[n]
+			if not (l,r) in self.blocks:
+				self.blocks[(l,r)] = dict(its=0, accepted=0, proposed=0,
+								mean=0.0, m2=0.0, it0=it, t0=when, it=it, t=when)
+			blk = self.blocks[(l,r)]
+			blk['its'] += 1
+			# Welford's update of the accepted energy mean and variance
+			delta = e - blk['mean']
+			blk['mean'] += delta / blk['its']
+			blk['m2'] += delta * (e - blk['mean'])
+			# Acceptance status is only recorded from version 3
+			oc = reader.outcomes[n]
+			if len(oc) > 4:
+				blk['proposed'] += 1
+				blk['accepted'] += 1 if oc[4] == 0 else 0
+			if blk['t'] == blk['t0']:	# Same observation as the first
+				blk['it0'] = max(it, blk['it0'])
+			(blk['it'], blk['t']) = (max(it, blk['it']), when)
+		return len(reader.energy)
+
+	def rate(self, k: Tuple[int,int]) -> float:
+		"""Returns iterations per hour for block k, or None if not known."""
+		blk = self.blocks[k]
+		if blk['t'] <= blk['t0']:
+			return None
+		return (blk['it'] - blk['it0']) * 3600 / (blk['t'] - blk['t0'])
+
+	def summary(self) -> List[str]:
+		"""Returns a line of statistics per block, after a heading line."""
+		lines = [f"{'loc':>4} {'run':>4} {'records':>8} {'last-it':>8} "
+				 f"{'accept':>7} {'mean-E':>12} {'sd-E':>10} {'it/h':>9}"]
+		for k in sorted(self.blocks):
+			blk = self.blocks[k]
+			acpt = f"{blk['accepted']/blk['proposed']:7.1%}" \
+					if blk['proposed'] > 0 else f"{'-':>7}"
+			sd = sqrt(blk['m2'] / (blk['its']-1)) if blk['its'] > 1 else 0.0
+			rate = self.rate(k)
+			rate = f"{rate:9.1f}" if rate != None else f"{'-':>9}"
+			lines += [f"{k[0]:>4} {k[1]:>4} {blk['its']:>8} {blk['it']:>8} "
+					  f"{acpt} {blk['mean']:12.3f} {sd:10.3f} {rate}"]
+		return lines
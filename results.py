@@ -13,6 +13,14 @@ from typing import List
 from math import acos,pi,sqrt,inf
 from enum import IntEnum
 from copy import deepcopy
+from numpy import array, arange, bincount, concatenate, newaxis, where, \
+				  minimum, maximum, histogram, triu_indices, empty, stack
+from numpy import sqrt as npsqrt
+from coordio import formatRows
+from resdata import ResultsReader, ResultsCache, RunningStats, Status
+from os.path import getsize
+from sys import stdout
+from time import sleep, strftime, time
 
 # Rotations Utilities
 # Quaternion multiplication (= compound rotation)
@@ -50,6 +58,26 @@ def tband(l, t, u):
 	return (t < (u if u < pi else pi) and t >= (l if l > 0 else 0)) or \
 			((t > pi + l) if l < 0 else (t < u - pi))
 
+# Write initial and final separations for sepden.r, either one line per
+# separation or, if bins is set, as counts in bins spanning both
+def writeSeps(fn: str, initial, final, bins: int = None) -> None:
+	(initial, final) = (array(initial, dtype=float), array(final, dtype=float))
+	with open(fn, 'w') as f:
+		if bins == None:
+			print(f"initial final", file=f)
+			formatRows(f, "%d %.6f %.6f",
+					   stack([arange(1,len(initial)+1), initial, final], axis=1))
+		else:
+			both = concatenate((initial, final))
+			rng = (both.min(), both.max()) if len(both) > 0 else (0, 1)
+			(ci, edges) = histogram(initial, bins=bins, range=rng)
+			(cf, edges) = histogram(final, bins=bins, range=rng)
+			print(f"lower upper initial final", file=f)
+			rows = empty((bins, 4), dtype=object)
+			(rows[:,0], rows[:,1], rows[:,2], rows[:,3]) = \
+				(edges[:-1].tolist(), edges[1:].tolist(), ci.tolist(), cf.tolist())
+			formatRows(f, "%r %r %d %d", rows)
+
 # Rainbow colour scheme
 # This is a little biased to the dark end?  And may produce some sillies...
 def rainbow(n: int) -> list:
@@ -125,6 +153,10 @@ parser.add_argument('--sepden', action='store_true', dest='sepden',
 					help="output sepden-r-l-t.txt for R density plot of\n" \
 						"crowder separation distances s for l-location,\n" \
                         "r-run and t-type (s(ubject),c(rowder))")
+parser.add_argument('--sepbins', default=None, dest='sepbins', type=int,
+					metavar="BINS",
+					help="with --sepden, output counts in BINS separation\n" \
+						"bins instead of every separation")
 
 # BEEP scenario configuration files
 parser.add_argument('--bsc', nargs='*', default=None, dest='bsc',
@@ -156,6 +188,18 @@ at   2Ddat     Average angle by energy
 dt   2Ddad     Angle density by energy
 """)
 
+# follow a running simulation
+parser.add_argument('--follow', nargs='?', default=None, const=10.0,
+					type=float, dest='follow', metavar="SECONDS",
+					help="keep reporting statistics per location and run\n"
+						"as the results file grows, every SECONDS (10);\n"
+						"no plots are made")
+
+# analysis cache
+parser.add_argument('--nocache', action='store_true', dest='nocache',
+					help="neither use nor update the analysis cache kept in\n"
+						"<results>.cache for re-plotting")
+
 # results-file
 parser.add_argument('results', nargs='?', default="results",
 					help='name of results file (.dat assumed)')
@@ -164,7 +208,6 @@ parser.add_argument('results', nargs='?', default="results",
 args = parser.parse_args()
 print(args)
 dfn = args.results + ('' if args.results[-4:] == '.dat' else '.dat')
-dat = open(dfn,'rb')
 elim = float(args.elim) if args.elim != None else None
 offmet = OffsetMethod.fur
 if args.offset[0:3] == 'avg':
@@ -183,6 +226,45 @@ dropbsc = (None if args.bsc == None \
 plotfigs = ([fgn.name for fgn in Fig] if args.plot == None \
 			else (args.plot if len(args.plot) > 0 else list()))
 
+# Follow mode:  decode only the groups added since the last look and keep
+# running statistics, until interrupted
+if args.follow != None:
+	stats = RunningStats()
+	reader = ResultsReader()
+	clear = "\033[H\033[J" if stdout.isatty() else ""
+	try:
+		while True:
+			try:
+				if getsize(dfn) < reader.offset:	# Restarted:  start again
+					(stats, reader) = (RunningStats(), ResultsReader())
+				with open(dfn, 'rb') as dat:
+					count = reader.read(dat)
+				stats.update(reader, time())
+				reader.clear()		# Keep only the statistics
+			except FileNotFoundError:
+				count = 0
+			print(f"{clear}{dfn}: {reader.offset} bytes, {count} new records, "
+				  f"{strftime('%H:%M:%S')}")
+			print("\n".join(stats.summary()), flush=True)
+			sleep(args.follow)
+	except KeyboardInterrupt:
+		pass
+	exit(0)
+
+# Analysis cache:  the indexing state and the crowding analysis of each
+# location-idx and run-idx block are kept alongside the results file, per
+# set of options they depend on.  Re-plotting then needs no results data
+# decoded, and if the results file has grown only the new data is indexed
+# and only new or extended blocks are analysed again.
+AnalysisVersion = 3	# Increment whenever the cached analyses change
+cache = None if args.nocache else \
+			ResultsCache(dfn, (AnalysisVersion, elim, subsel))
+status = cache.status() if cache != None else Status.stale
+if status == Status.stale and cache != None:
+	cache.clear()
+# bsc and sepden output come from the records of every block
+rawneeded = args.sepden or dropbsc != None
+
 
 # Unpickle results data
 # A single header record (if present) lists:
@@ -208,37 +290,122 @@ plotfigs = ([fgn.name for fgn in Fig] if args.plot == None \
 # Version 2 is missing the proposal energy in line 5, which is corrected below.
 # Version 3 and below have no header record.
 # Version 4 and below have no crowders (crowder-types) records
-from pickle import Unpickler
-header = list()
-energy = list()
-subjects = list()
-crowders = list()
-locations = list()
-rotations = list()
-outcomes = list()
-
-results = Unpickler(dat)
-header = None
-version = 3	# Assumption for now
-while True:
-	try:
-		record = results.load()
-		if type(record[0]) == int:
-			energy += [record]
-		else:
-			if header == None:	# All headers should be the same
-				header = record
-				version = header[1]
-			energy += [results.load()]
-	except EOFError:
-		break
-	subjects += [results.load()]
-	if version > 4:
-		crowders += [results.load()]
-	locations += [results.load()]
-	rotations += [results.load()]
-	outcomes += [results.load()]
+# Reading starts after the groups already indexed, if any.
+state = cache.state if status != Status.stale else None
+if state == None:
+	state = dict(header=None, version=3, offset=0, e0=None, crowded=False,
+				 lrit=dict(), ser=dict(), serfl=dict(), sim=dict(), lrrep=dict(),
+				 lrsbj=dict(), lrofs=dict(), lrcnt=dict())
+dat = open(dfn,'rb')
+reader = ResultsReader(state['header'], state['version'])
+reader.read(dat, state['offset'])
+(header, version) = (reader.header, reader.version)
+if version < 4:		# No caching as these may depend on run2.txt
+	cache = None
+
+pct = [ 10, 20, 30, 40, 50, 60, 70, 80, 90, 100 ] # Fixed simplification levels
+
+# Indexing analysis
+# lrit dict by location-idx then run-idx then iteration of repeat count
+# ser dict by run-idx then location-idx of minimum energy across iterations
+# sim dict by location-idx then run-idx then iteration of energy
+# lrsbj, lrofs and lrcnt dicts by (location-idx, run-idx) of first subject
+# locations, first group file offset and count of groups, before filtering
+# lrrep dict by (location-idx, run-idx) of [repeat counts by iteration,
+# maximum iteration], and serfl dict by run-idx then repeat counter of first
+# (lowest) location-idx in ser, after filtering;  these keep each record's
+# indexing independent of the number of records indexed before it
+# All are continued from the cached state, so only new groups are indexed
+lrit = state['lrit']	# general indexing nested dictionary
+ser = state['ser']		# separation energy records: list of repeats (simplis)
+serfl = state['serfl']	# first location-idx of each separation energy record
+sim = state['sim']		# simplification energy record
+lrrep = state['lrrep']	# repeat counter, assumed to run in sequence against pct
+(lrsbj, lrofs, lrcnt) = (state['lrsbj'], state['lrofs'], state['lrcnt'])
+for n in range(len(reader.energy)):
+	(l,r,it,e) = reader.energy[n]
+	# Block bookkeeping
+	if not (l,r) in lrcnt:
+		lrsbj[(l,r)] = reader.subjects[n][1]
+		(lrofs[(l,r)], lrcnt[(l,r)]) = (reader.offsets[n], 0)
+	lrcnt[(l,r)] += 1
+	if len(reader.locations[n][1]) > 0:
+		state['crowded'] = True
+
+	# lrit processing - runs are only unique per location
+	if not l in lrit:
+		lrit[l] = dict()
+	if not r in lrit[l]:
+		lrit[l][r] = dict()
+	if not it in lrit[l][r]:	# NB iterations should be safely consecutive
+		lrit[l][r][it] = 1
+	else:
+		lrit[l][r][it] += 1
+
+	# Repeats processing - ctr counts earlier unfiltered records for it
+	if not (l,r) in lrrep:
+		lrrep[(l,r)] = [dict(), None]
+	(reps, maxit) = lrrep[(l,r)]
+	ctr = reps[it] if it in reps else 0
+
+	# ser processing - runs link across locations in this case
+	if not r in ser:
+		ser[r] = [dict()]*len(pct)
+		serfl[r] = [None]*len(pct)
+		ser[r][ctr] = {l: e}	# Safer as a dict() as l may not be consecutive
+	if len(ser[r][ctr]) == 0:
+		ser[r][ctr] = {l: e}
+	if serfl[r][ctr] == None:
+		serfl[r][ctr] = l
+	# If filtering silly values, then skip this record entirely if bad
+	# Note that the first energy value is reliable even if others are not
+	if elim != None and abs(e-ser[r][ctr][serfl[r][ctr]]) >= elim:
+		print("Skipping", l, r, it, e)
+		continue
+	reps[it] = ctr+1
+	if not l in ser[r][ctr]:
+		ser[r][ctr][l] = e
+		serfl[r][ctr] = min(l, serfl[r][ctr])
+	# min is wrong here - should be last iteration!!
+	# store e if it is for the same iteration as the maximum found so far
+	if maxit == None or it >= maxit:
+		ser[r][ctr][l] = e
+		lrrep[(l,r)][1] = it
+
+	# sim processing
+	if not l in sim:
+		sim[l] = dict()
+	if not r in sim[l]:
+		sim[l][r] = dict()
+	#if not it in sim[l][r]:
+	#	sim[l][r][it] = list()
+	#sim[l][r][it] += [e]
+	if not ctr in sim[l][r]:
+		sim[l][r][ctr] = list()
+	sim[l][r][ctr] += [e]
+
+# Blocks with cached analyses need no records, so read back only as far as
+# the first group of any block still to be analysed
+lrblk = dict()	# cached analysis values by (location-idx, run-idx)
+if cache != None and not rawneeded:
+	for k in lrcnt:
+		blk = cache.loadBlock(k, lrcnt[k])
+		if blk != None:
+			lrblk[k] = blk
+start = min([lrofs[k] for k in lrcnt if k not in lrblk] + [reader.offset])
+if start < state['offset']:
+	reader = ResultsReader(header, version)
+	reader.read(dat, start)
 dat.close()
+(state['header'], state['version']) = (header, version)
+state['offset'] = reader.offset
+energy = reader.energy
+subjects = reader.subjects
+crowders = reader.crowders
+locations = reader.locations
+rotations = reader.rotations
+outcomes = reader.outcomes
+
 if header == None:
 	ns = len(subjects[0]) if len(subjects) > 0 else 0
 	nc = locations[0][0] if len(locations) > 0 else 0
@@ -316,6 +483,11 @@ else:
 	arenaCentre = header[4][2]
 
 
+# Energy of the first proposal, against which --elim filters
+if state['e0'] == None and len(outcomes) > 0:
+	state['e0'] = outcomes[0][1]
+e0 = state['e0']
+
 # Header processing for later plots
 forsubjpdbs = "for " + ":".join([subj[0] for subj in header[2]]) \
 				if version > 3 else ""
@@ -357,7 +529,6 @@ print(f"Filtering set to {elim}")
 # Simpli	per	per	per	>1	any (but usually none)
 #
 
-pct = [ 10, 20, 30, 40, 50, 60, 70, 80, 90, 100 ] # Fixed simplification levels
 # Colour, marker and line scheme
 #cs = ['r', 'y', 'g', 'c', 'b', 'm']	# colours
 ps = rainbow((len(pct)+2) // 3)		# pct spectrum (colour scheme)
@@ -367,92 +538,22 @@ ms = ['^', 'o']						# marker styles
 ls = ['solid', 'dotted']			# corresponding line styles
 lab = ["accepted", "rejected"]		# legend labels
 
-# Indexing analysis
-# lrit dict by location-idx then run-idx then iteration of repeat count
-# ser dict by run-idx then location-idx of minimum energy across iterations
-# sim dict by location-idx then run-idx then iteration of energy
-lrit = dict()	# general indexing nested dictionary
-ser = dict()	# separation energy records: list of repeats (simplifications)
-sim = dict()	# simplification energy record
-lrrep = dict()	# repeat counter, assumed to run in sequence against pct
-for (l,r,it,e) in energy:
-	# lrit processing - runs are only unique per location
-	if not l in lrit:
-		lrit[l] = dict()
-	if not r in lrit[l]:
-		lrit[l][r] = dict()
-	if not it in lrit[l][r]:	# NB iterations should be safely consecutive
-		lrit[l][r][it] = 1
-	else:
-		lrit[l][r][it] += 1
-
-	# Repeats processing
-	if not (l,r) in lrrep:
-		lrrep[(l,r)] = [it]
-	else:
-		# if it < max(lrrep[(l,r)]): continue  # Skip earlier iterations
-		lrrep[(l,r)] += [it]
-	#ctr = lrrep[(l,r)]
-	#ctr = len([1 for i in lrrep[(l,r)] if i == max(lrrep[(l,r)])])-1
-	ctr = len([1 for i in lrrep[(l,r)] if it == i])-1
-
-	# TODO lose old ser[r][l] processing commented out
-	# ser processing - runs link across locations in this case
-	if not r in ser:
-		ser[r] = [dict()]*len(pct)
-		ser[r][ctr] = {l: e}	# Safer as a dict() as l may not be consecutive
-		#ser[r] = {l: e}	# Safer as a dict() as l may not be consecutive
-	if len(ser[r][ctr]) == 0:
-		ser[r][ctr] = {l: e}
-	# If filtering silly values, then skip this record entirely if bad
-	# Note that the first energy value is reliable even if others are not
-	#if elim != None and abs(e-ser[r][min([k for k in ser[r]])]) >= elim:
-	if elim != None and \
-			abs(e-ser[r][ctr][min([k for k in ser[r][ctr]])]) >= elim:
-		print("Skipping", l, r, it, e)
-		lrrep[(l,r)] = lrrep[(l,r)][0:-1]  # Lose this iteration record
-		continue
-	#print("Including", l, r, it, e)
-	#if not l in ser[r]:
-	if not l in ser[r][ctr]:
-		#ser[r][l] = e
-		ser[r][ctr][l] = e
-	#ser[r][l] = min(e,ser[r][l])
-	# min is wrong here - should be last iteration!!
-	#ser[r][ctr][l] = min(e,ser[r][ctr][l])
-	# store e if it is for the same iteration as the maximum found so far
-	if it >= max(lrrep[(l,r)]):
-		ser[r][ctr][l] = e
-
-	# sim processing
-	if not l in sim:
-		sim[l] = dict()
-	if not r in sim[l]:
-		sim[l][r] = dict()
-	#if not it in sim[l][r]:
-	#	sim[l][r][it] = list()
-	#sim[l][r][it] += [e]
-	if not ctr in sim[l][r]:
-		sim[l][r][ctr] = list()
-	sim[l][r][ctr] += [e]
-
 # Subject separation processing
 sep = dict()	# dict by run of list of separations
 see = dict()	# dict by run of list of minimum energies in separation order
 seq = dict()	# dict by run of list of minimum energies in location-idx order
 # If there is more than one energy per location and run, then plot minimum
-subjectsl = len(subjects)
 for r in ser:
 	# Calculate separation as average distance of subjects from mutual centre
-	# Note len(energy) == len(subjects)
 	tmpd = dict()  # Not used outside of this preparatory phase
 	# TODO this is better as set of locations...
 	for l in sorted(lrit):
 		# Select subject locations for this location-idx l and run-idx r
 		# There could be repeats, but same value, so just take the first one
 		# i.e. location-idx and run-idx fix the subject location across its/reps
-		sbj = [subjects[n][1] for n in range(subjectsl) \
-				if energy[n][0] == l and energy[n][1] == r][0]
+		if not (l,r) in lrsbj:
+			continue
+		sbj = lrsbj[(l,r)]
 		if len(sbj) < 1:	# Not enough subjects to have a separation
 			continue
 		elif len(sbj) == 1:	# Still not enough, but useful check on variability
@@ -526,14 +627,31 @@ for r in ser:
 lrct = dict()
 lrebc = dict()
 (lrlb, lrca, lrlbc) = (dict(), dict(), dict())
+# Analysis values by (l,r) as cached
+lrdicts = (lre, lra, lrsx, lrsy, lrsz, lrccs, lrcli, lrclf, lrvc, lrqc,
+		   lrd, lrits, lrtheta, lrpe, lrave, lrpc, lrcc, lrdtx, lrdty,
+		   lravd, lrsdd, lravt, lrsdt, lrct, lrebc, lrlb, lrca, lrlbc)
+
+# Record indices by (l,r) for the main plots, after the elim filter
+lrrec = dict()
+for n in range(len(energy)):
+	k = (energy[n][0],energy[n][1])
+	if elim != None and abs(outcomes[n][1]-e0) >= elim:
+		continue
+	if not k in lrrec:
+		lrrec[k] = list()
+	lrrec[k] += [n]
 
 for l in sorted(lrit):
 	for r in sorted(lrit[l]):
+		k = (l,r)
+		if k in lrblk:	# Analysis already cached
+			for (lrdv, blkv) in zip(lrdicts, lrblk[k]):
+				lrdv[k] = blkv
+			continue
+
 		# Select the record indices for main plots by l, r and elim filter
-		rec = [n for n in range(len(energy)) \
-				if energy[n][0] == l and energy[n][1] == r and \
-					((abs(outcomes[n][1]-outcomes[0][1]) < elim) \
-										if elim != None else True)]
+		rec = lrrec[k] if k in lrrec else list()
 
 		# Construct outcomes and energy list for further processing
 		ctyp = [[crowders[n][k] for k in sorted(crowders[n])] for n in rec]
@@ -584,20 +702,15 @@ for l in sorted(lrit):
 			clf[c] = [[cloc[-1][n][cd] for n in ctn] for cd in range(3)]
 
 		# Drop out crowder-crowder separation data for R density plotting
+		# Each distinct pair is listed once, initial and final
 		if args.sepden:
-			with open(f"sepden-{l}-{r}-c.txt", 'w') as f:
-				ctr = 0
-				print(f"initial final", file=f)
-				clip = [cloc[0][n] for n in range(nc)]
-				clfp = [cloc[-1][n] for n in range(nc)]
-				for c1 in range(len(clfp)):
-					for c2 in range(len(clfp)):
-						ctr += 1
-						vi12d = vdiff(clip[c1],clip[c2])
-						ci12d = sqrt(vdot(vi12d,vi12d))
-						vf12d = vdiff(clfp[c1],clfp[c2])
-						cf12d = sqrt(vdot(vf12d,vf12d))
-						print(f"{ctr} {ci12d} {cf12d}", file=f)
+			(c1, c2) = triu_indices(nc, 1)
+			(clip, clfp) = [array(cloc[n][0:nc] if nc > 0 else [],
+								  dtype=float).reshape(nc,3) for n in (0, -1)]
+			(ci12d, cf12d) = [npsqrt(vd[:,0]*vd[:,0] + vd[:,1]*vd[:,1] \
+								   + vd[:,2]*vd[:,2])
+								for vd in (clip[c1]-clip[c2], clfp[c1]-clfp[c2])]
+			writeSeps(f"sepden-{l}-{r}-c.txt", ci12d, cf12d, args.sepbins)
 		
 		# Obtain the "centre" of the arena
 		# Centre is a specific subject if subsel set, else average of all
@@ -716,14 +829,7 @@ for l in sorted(lrit):
 						
 		# Drop out crowder-subject separation data for R density plotting
 		if args.sepden:
-			with open(f"sepden-{l}-{r}-s.txt", 'w') as f:
-				ctr = 0
-				print(f"initial final", file=f)
-				clip = dcs[0]
-				clfp = dcs[-1]
-				for c1 in range(len(clfp)):
-					ctr += 1
-					print(f"{ctr} {clip[c1]} {clfp[c1]}", file=f)
+			writeSeps(f"sepden-{l}-{r}-s.txt", dcs[0], dcs[-1], args.sepbins)
 		
 
 		# Directions for axial arrows
@@ -748,22 +854,19 @@ for l in sorted(lrit):
 		ct = avd[:]
 		sdd = avd[:]
 		sdt = avd[:]
+		# Totals and counts per band, each from one pass over the points of
+		# each acceptance status, with band indices taken from the records
+		tb = [array([ib[n] for n in its[i]], dtype=int) for i in range(len(v))]
 		for i in range(len(v)):		# Bands
-			# Distance and angle per point
-			#for n in range(len(v[i])):
-				# Distance from location to centre
-				#d[i] += [sqrt(vdot(wd[i][n], wd[i][n]))]
-				# Calculate angle from axis to centre of arena
-				#theta[i] += [angle(wd[i][n], qaxis(q[i][n]))]
-			# Totals and counts from this band
+			(dv, tv) = (array(d[i], dtype=float), array(theta[i], dtype=float))
+			for (tot, w) in ((avd, dv), (ave, pe[i]), (avt, tv),
+							 (sdd, dv*dv), (sdt, tv*tv)):
+				sums = bincount(tb[i], weights=w, minlength=len(ps))
+				for c in range(len(ps)):
+					tot[c] += sums[c].item()
+			ctb = bincount(tb[i], minlength=len(ps))
 			for c in range(len(ps)):
-				ci = [n for n in range(len(d[i])) if pc[i][n] == ps[c]] # Match
-				avd[c] += sum([d[i][n] for n in ci])
-				ave[c] += sum([pe[i][n] for n in ci])
-				avt[c] += sum([theta[i][n] for n in ci])
-				sdd[c] += sum([d[i][n]*d[i][n] for n in ci])
-				sdt[c] += sum([theta[i][n]*theta[i][n] for n in ci])
-				ct[c] += len(ci)
+				ct[c] += ctb[c].item()
 		# Colour, averages and counts across bands
 		ctc = [c for c in range(len(ps)) if ct[c] != 0]  # Exclude empties
 		ca = [ps[c] for c in ctc]
@@ -783,29 +886,28 @@ for l in sorted(lrit):
 		# For angles it is also useful to consider densities
 		dg = 11			# density granularity
 		db = 8			# width to count across is pi/db
-		dty = [list()]*len(ps)	# list of density lists
-		dtx = dty[:]			# list of density angle lists
+		dtx = [nt*pi/dg for nt in range(dg)]	# density angles
+		# Band x angle histogram:  mask points within pi/db of each angle,
+		# wrapping around [0,pi) as for tband, then count by band and angle
+		ta = concatenate([array(tv, dtype=float) for tv in theta] + [[]])
+		ba = concatenate(tb + [array([], dtype=int)])
+		lo = array(dtx)-pi/db		# Lower bounds
+		up = array(dtx)+pi/db		# Upper bounds
+		t = ta[:,newaxis]
+		inb = ((t < minimum(up,pi)) & (t >= maximum(lo,0))) | \
+				where(lo < 0, t > pi+lo, t < up-pi)
+		hb = (ba[:,newaxis]*dg + arange(dg))[inb]
+		hist = bincount(hb, minlength=len(ps)*dg).reshape(len(ps),dg)
+		dty = list()			# list of density lists
 		for c in range(len(ps)):	# Split by colour band
-			dty[c] = [0]*dg			# density list for this band
-			dtx[c] = dty[c][:]		# density angle list for this band
-			for nt in range(dg):	# To construct the density list
-				dtx[c][nt] = nt*pi/dg
-				lo = dtx[c][nt]-pi/db	# Lower bound
-				up = dtx[c][nt]+pi/db	# Upper bound
-				# sum of counts of angles in the band and within the interval
-				for i in range(len(theta)):
-					for n in range(len(theta[i])):
-						if pc[i][n] == ps[c]:
-							dty[c][nt] += tband(lo, theta[i][n], up)
 			# Convert counts to densities
-			dts = sum(dty[c])
-			dty[c] = [dtv/dts if dts > 0 else 0 for dtv in dty[c]]
+			dts = hist[c].sum()
+			dty += [[(dtv/dts).item() if dts > 0 else 0 for dtv in hist[c]]]
 			# Complete the cycle for plotting
 			dty[c] += [dty[c][0]]
-			dtx[c] += [pi]
+		dtx = [dtx+[pi] for c in range(len(ps))]	# density angle lists
 
 		# Save the useful calculations by location-idx and run-idx
-		k = (l,r)
 		(lre[k], lra[k]) = (e, a)	# propose/accept energy
 		(lrsx[k], lrsy[k], lrsz[k]) = (sx, sy, sz) # Subj coords
 		# Crowder type records, colours and initial and final coords
@@ -824,6 +926,12 @@ for l in sorted(lrit):
 		# Labelling and colours
 		lrebc[k] = ebc						# Energy band midpoints
 		(lrlb[k], lrca[k], lrlbc[k]) = (lb, ca, lbc)
+		if cache != None:
+			cache.saveBlock(k, lrcnt[k], tuple([lrdv[k] for lrdv in lrdicts]))
+
+# Cache the indexing state covering the results read
+if cache != None:
+	cache.save(state, state['offset'])
 
 #######################
 # Plots
@@ -952,7 +1060,7 @@ for l in sorted(lrit):
 			continue	# No more plots without the iterations
 
 		# Bug-hunting?
-		if sum([len(cv[1]) for cv in locations]) == 0 and len(lre[k]) > 0:
+		if not state['crowded'] and len(lre[k]) > 0:
 			if not k in figures[Fig.b][0]:
 				figures[Fig.b][0][k] = plt.subplots()
 				axb = figures[Fig.b][0][k][1]
@@ -1015,7 +1123,7 @@ for l in sorted(lrit):
 			with open(f"results-{l}-{r}.txt", 'w') as f:
 				ctr = 0
 				print(f"status x y z u v w colour marker label", file=f)
-				for n in range(len(sx)):
+				for n in range(len(lrsx[k])):
 					ctr += 1
 					print(f"{ctr} -1 {lrsx[k][n]} {lrsy[k][n]} {lrsz[k][n]} " \
 						"0.0 0.0 0.0 k * subject", file=f)
@@ -1162,7 +1270,7 @@ for l in sorted(lrit):
 			axdt = figures[Fig.dt][0][k][1]
 			for c in range(len(ps)):
 				(dtx, dty) = (lrdtx[k][c], lrdty[k][c])
-				axdt.plot(dtx, dty, c=ps[c], label=lb[c])
+				axdt.plot(dtx, dty, c=ps[c], label=lrlb[k][c])
 
 
 # Show and save figures
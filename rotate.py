@@ -18,33 +18,24 @@ Note that an RE on a shell line needs suitable protection.  However, argparse
 has trouble with leading '-', so an initial '#' is ignored in this script, i.e.
 '#-5\.2860*\s+' is interpreted as '-5\.2860*\s+'.  Note that the #
 is a comment character and must be escaped or quoted!
+transform.py does the work, and can apply several shifts and rotations to
+many files in one run.
 """
-__version__ = '0.1'
+__version__ = '0.3'
 __all__ = [
 	'shift',
 ]
 
 from typing import Iterable, Tuple
 from sys import stdout, stdin, stderr
-from pybeep import Vector, Quaternion
-from math import sqrt, fabs
+from coordio import pdbformat
+from transform import transform, vector, xyzformat
 import logging as log
 import re
 
 #=============================================================================
 # Global variables
 
-#=============================================================================
-# Functions
-def vector(s):
-	s.lstrip('( ')
-	s.rstrip(' )')
-	try:
-		x, y, z = map(float, s.split(','))
-		return x, y, z
-	except:
-		raise argparse.ArgumentTypeError("Direction must be x,y,z")
-
 #=============================================================================
 # Main
 if __name__== "__main__":
@@ -86,28 +77,22 @@ if __name__== "__main__":
 
 	# Interpret arguments
 	args = vars(parser.parse_args())
+	if [len(a) for a in args['axis']] != [3, 3]:
+		parser.error("Direction must be x,y,z")
 	loglevel = args['loglevel']
 	logstream = args['log']
 	ifs = args['in']
 	ofs = args['out']
 	if args['fmt'] == 'pdb':
-		fmt = 0
-		ofmt = str().join(["{:8.3f}" for i in range(3)]) # [-999.999,9999.999]
+		ofmt = pdbformat
 	elif args['fmt'] == 'xyz':
-		fmt = 1
-		ofmt = " ".join(["{:.6f}" for i in range(3)])
+		ofmt = xyzformat
 	else:
 		print(f"This should not have happened - bad format {args['fmt']}")
 		exit(1)
 	beg = args['beg']
 	end = args['end']
-	ax = [Vector(*args['axis'][i]) for i in range(2)]
-	qa = ax[0].cross(ax[1])	# a for axis
-	qd = ax[0].dot(ax[1])	# d for dot
-	# To get half-way, add (1,0,0,0) but ql not normalised yet, so adjust unit
-	unit = sqrt(qd*qd + qa.length2())
-	ql = Quaternion(unit + qd, qa.x, qa.y, qa.z)
-	ql.normalise()
+	steps = [('axes', tuple(args['axis']))]
 
 	# Set up logging - if to stdout, assume caller handles time and module name
 	if logstream == stdout:
@@ -118,9 +103,6 @@ if __name__== "__main__":
 					level=getattr(log, loglevel.upper()))
 
 	# Set up REs
-	floatrest = r"(-?[0-9\.]+(?:e-?[0-9]+)?)"
-	locrest = (floatrest+r"\s+")*3
-	locre = re.compile(locrest)
 	try:
 		pat = beg[1:] if beg[0] == "#" else beg
 		begre = re.compile(pat)
@@ -130,74 +112,13 @@ if __name__== "__main__":
 		print(f"Unable to interpret pattern \"{pat}\"")
 		exit(1)
 
-	state = 0
-	lineno = 1
-	c = Vector(0.0,0.0,0.0)	# centre of rotation, initially origin
-	nc = 0			# number of coordinates to rotate
-	rc = list()		# coordinates to rotate
-	lines = list()	# first part of each line containing coordinates to rotate
-	linee = list()	# last part of each line containing coordinates to rotate
-	rest = list()	# remainder of file after vector subset
-	for line in ifs:
-		line = line[0:-1] # lose \n
-
-		# Locate the beginning pattern
-		if state == 0:
-			m = begre.search(line)
-			if m:
-				state = 1
-			else:
-				print(line, file=ofs)
-			
-		# Add this line to the average for the centre of rotation
-		if state == 1:
-			# Test for end pattern
-			m = endre.search(line)
-			if m:
-				state = 2
-
-			# Extract coordinates
-			if fmt == 0:
-				test = [s.strip() for s in \
-									[line[30:38], line[38:46], line[46:54]]]
-			else:
-				test = line.split()[0:3]
-
-			# Sum coordinates
-			try:
-				rc.append(Vector(*[float(test[i]) for i in range(3)]))
-			except:
-				print(f"Failed to interpret float {test[i]} line {lineno}")
-				exit(0)
-			c = c + rc[-1]
-			nc += 1
-
-			# Save other parts of line
-			if fmt == 0:
-				lines.append(line[0:30])
-				linee.append(line[54:])
-			else:
-				lines.append(str())
-				linee.append(" ".join(line.split()[3:]))
-
-		# Remainder of file
-		elif state == 2:
-			rest.append(line)
-
-		lineno += 1
-
-	# Rotate coordinates and output modified lines
-	c /= nc	# Average is centre
-	for i in range(nc):
-		v = Vector(*rc[i])
-		v.change_coordinate_frame(c, ql, c)
-		if fmt == 0:
-			rotc = ofmt.format(*v)
-		else:
-			rotc = ofmt.format(*v)+" "
-		print(lines[i]+rotc+linee[i], file=ofs)
-	for line in rest:
-		print(line, file=ofs)
+	# Rotate the coordinates of the lines from the beginning pattern to
+	# the end one
+	try:
+		transform(ifs, ofs, args['fmt'], begre, endre, steps, ofmt)
+	except ValueError as e:
+		print(f"Failed to interpret coordinates: {e}")
+		exit(1)
 
 	# Close the files
 	ifs.close()
@@ -123,7 +123,10 @@ class Scenario:
 			'QualPts': 4,
 			'QuadPts': 0,
 			'NbSize': 2200,
-			'Planar': False
+			'Planar': False,
+			'LODlevels': list(),
+			'LODdistance': 3.0,
+			'LODbatch': 8
 		}
 		self._paramTypes = {
 			'ArenaRadius': float,
@@ -142,7 +145,10 @@ class Scenario:
 			'QualPts': int,
 			'QuadPts': int,
 			'NbSize': int,
-			'Planar': bool
+			'Planar': bool,
+			'LODlevels': Scenario._makeIntList,
+			'LODdistance': float,
+			'LODbatch': int
 		}
 
 		# Read scenario specification file
@@ -282,6 +288,11 @@ class Scenario:
 			q.normalise()
 		return lq
 
+	# Comma-separated integers, e.g. decimation percentages
+	@staticmethod
+	def _makeIntList(s: str) -> List[int]:
+		return [int(n) for n in s.split(',') if n.strip() != '']
+
 	#>>> How to handle variable list of args?
 	@staticmethod
 	def _makeSameLength(ll: List[List[any]]) -> int:
@@ -27,7 +27,8 @@ require('argparser')
 p <- arg_parser("Plot density or histogram of separation data from results.py")
 p <- add_argument(p,
         c("--file", "--breaks"),
-        help = c("separations data file", "number of histogram breaks"),
+        help = c("separations data file",
+			"number of histogram breaks (unused for binned data)"),
 		default=list(file=".", breaks="Sturges"),
         flag = c(FALSE, FALSE))
 p <- add_argument(p,
@@ -37,8 +38,24 @@ p <- add_argument(p,
 argv <- parse_args(p)
 if (!is.na(as.integer(argv$breaks))) argv$breaks = as.integer(argv$breaks)
 
-# Read the data
-df <- read.table(argv$file, comment.char="")
+# Read the data:  either one separation per line, or counts in bins if
+# results.py --sepbins was used, in which case the bins are fixed
+df <- read.table(argv$file, header=TRUE, comment.char="")
+binned <- "lower" %in% names(df)
+if (binned) {
+	breaks <- c(df$lower, df$upper[nrow(df)])
+	mids <- (df$lower + df$upper)/2
+	# Histogram object from counts, as hist() would construct
+	binhist <- function(counts) {
+		structure(list(breaks=breaks, counts=counts,
+				density=counts/(sum(counts)*diff(breaks)), mids=mids,
+				xname="separation", equidist=TRUE), class="histogram")
+	}
+	# Density estimate from bin midpoints weighted by counts
+	bindens <- function(counts) {
+		density(mids, weights=counts/sum(counts))
+	}
+}
 
 # Main plot
 if (argv$png) {
@@ -54,19 +71,33 @@ if (argv$png) {
 }
 
 # Combined plot
-print(c(mean(df$initial), mean(df$final)))
+if (binned) {
+	print(c(weighted.mean(mids, df$initial), weighted.mean(mids, df$final)))
+} else {
+	print(c(mean(df$initial), mean(df$final)))
+}
 if (argv$hist) {
-	merge <- hist(range(c(df$initial,df$final)),breaks=argv$breaks)
-	xyi <- hist(df$initial, breaks=merge$breaks)
-	xyf <- hist(df$final, breaks=merge$breaks)
+	if (binned) {
+		xyi <- binhist(df$initial)
+		xyf <- binhist(df$final)
+	} else {
+		merge <- hist(range(c(df$initial,df$final)),breaks=argv$breaks)
+		xyi <- hist(df$initial, breaks=merge$breaks)
+		xyf <- hist(df$final, breaks=merge$breaks)
+	}
 	yr <- c(min(c(xyi$counts,xyf$counts)),max(c(xyi$counts,xyf$counts)))
 print(yr)
 	mt <- "Frequency"
 	al <- 0.2
 	nc <- 3
 } else {
-	xyi <- density(df$initial)
-	xyf <- density(df$final)
+	if (binned) {
+		xyi <- bindens(df$initial)
+		xyf <- bindens(df$final)
+	} else {
+		xyi <- density(df$initial)
+		xyf <- density(df$final)
+	}
 	yr <- c(min(c(xyi$y,xyf$y)),max(c(xyi$y,xyf$y)))
 	mt <- "Density"
 	al <- 1.0
@@ -16,14 +16,18 @@ Note that an RE on a shell line needs suitable protection.  However, argparse
 has trouble with leading '-', so an initial '#' is ignored in this script, i.e.
 '#-5\.2860*\s+' is interpreted as '-5\.2860*\s+'.  Note that the #
 is a comment character and must be escaped or quoted!
+transform.py does the work, and can apply several shifts and rotations to
+many files in one run.
 """
-__version__ = '0.1'
+__version__ = '0.3'
 __all__ = [
 	'shift',
 ]
 
 from typing import Iterable, Tuple
 from sys import stdout, stdin, stderr
+from coordio import pdbformat
+from transform import transform, xyzformat
 import logging as log
 import re
 
@@ -82,11 +86,9 @@ if __name__== "__main__":
 	ifs = args['in']
 	ofs = args['out']
 	if args['fmt'] == 'pdb':
-		fmt = 0
-		ofmt = str().join(["{:8.3f}" for i in range(3)]) # [-999.999,9999.999]
+		ofmt = pdbformat
 	elif args['fmt'] == 'xyz':
-		fmt = 1
-		ofmt = " ".join(["{:.6f}" for i in range(3)])
+		ofmt = xyzformat
 	else:
 		print(f"This should not have happened - bad format {args['fmt']}")
 		exit(1)
@@ -99,6 +101,7 @@ if __name__== "__main__":
 		except:
 			print(f"Bad shift {args[argshift[i]]}")
 			exit(1)
+	steps = [('shift', shift)]
 
 	# Set up logging - if to stdout, assume caller handles time and module name
 	if logstream == stdout:
@@ -109,9 +112,6 @@ if __name__== "__main__":
 					level=getattr(log, loglevel.upper()))
 
 	# Set up REs
-	floatrest = r"(-?[0-9\.]+(?:e-?[0-9]+)?)"
-	locrest = (floatrest+r"\s+")*3
-	locre = re.compile(locrest)
 	try:
 		pat = beg[1:] if beg[0] == "#" else beg
 		begre = re.compile(pat)
@@ -121,49 +121,13 @@ if __name__== "__main__":
 		print(f"Unable to interpret pattern \"{pat}\"")
 		exit(1)
 
-	state = 0
-	lineno = 1
-	for line in ifs:
-		line = line[0:-1] # lose \n
-
-		# Locate the beginning pattern
-		if state == 0:
-			m = begre.search(line)
-			if m:
-				state = 1
-		# Shift this line
-		if state == 1:
-			# Test for end pattern
-			m = endre.search(line)
-			if m:
-				state = 2
-
-			# Extract coordinates
-			if fmt == 0:
-				test = [s.strip() for s in \
-									[line[30:38], line[38:46], line[46:54]]]
-			else:
-				test = line.split()[0:3]
-
-			# Shift coordinates
-			c = [0.0]*3
-			for i in range(3):
-				try:
-					c[i] = float(test[i])
-				except:
-					print(f"Failed to interpret float {test[i]} line {lineno}")
-					exit(0)
-				c[i] += shift[i]
-
-			# Output revised line
-			if fmt == 0:
-				line = line[0:30]+ofmt.format(*c)+line[54:]
-			else:
-				line = ofmt.format(*c)+" "+" ".join(line.split()[3:])
-
-		# Output line
-		print(line, file=ofs)
-		lineno += 1
+	# Shift the coordinates of the lines from the beginning pattern to
+	# the end one
+	try:
+		transform(ifs, ofs, args['fmt'], begre, endre, steps, ofmt)
+	except ValueError as e:
+		print(f"Failed to interpret coordinates: {e}")
+		exit(1)
 
 	# Close the files
 	ifs.close()
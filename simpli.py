@@ -5,16 +5,26 @@
 This script handles simplification of a molecular mesh.
 
 Example use:
-	simpli.py -i <gts> -o <gts-d>
+	simpli.py -i <gts> -o <gts-d> [--decimate <pct> ... [-j <jobs>]]
 with <gts> being a GTS file and <gts-d> the output GTS file.
+Several decimation levels are made from the same <gts>, up to <jobs> at once,
+each with its own meshlab script, and each is passed to prepare.py as soon as
+it is made.
+If BEEP_DISPLAY is set (e.g. by pipeline.py --displays), meshlab is run on
+that X display rather than on one started by xvfb-run.
+With --qem, decimate.py does the quadric edge collapse instead of meshlab,
+needing neither meshlab scripts nor an X display.
 """
-__version__ = '1.0'
+__version__ = '1.3'
 __all__ = [
+	'main',
 ]
 
 # imports
 from sys import stdout
-from os import environ, path, sep as pathsep
+from typing import List
+from os import environ, remove, path, sep as pathsep
+from concurrent.futures import ThreadPoolExecutor
 from pipeline import runCommand
 import argparse
 import re
@@ -22,89 +32,127 @@ import shutil
 import logging as log
 
 # Main program
+def main(argv: List[str] = None, cwd: str = None) -> int:
+	"""Runs simpli.py with the given arguments, returning the exit status.
 
-# Set up command line parsing
-parser = argparse.ArgumentParser(description=\
-				'Simplify a surface representation.',
-				epilog="If multiple PERCENT supplied, prepare.py is also " \
-						"run for each case.")
-# -i input gts file
-parser.add_argument('-i', metavar='in-gts', dest='igts', required=True,
-                    help='name of input gts file')
-# -o output gts file
-parser.add_argument('-o', metavar='out-gts', dest='ogts', required=True,
-                    help='name of input gts file')
-# --decimate target percentage decimation
-parser.add_argument('--decimate', metavar="PERCENT", type=int,
-                    nargs='+', required=False,
-                    help='target percentage for decimation')
-# --loglevel
-parser.add_argument('--loglevel', metavar='(INFO|WARNING|ERROR)',
-					dest='loglevel', default="INFO",
-                    help='minimum log level to capture: INFO, WARNING, ERROR')
-# --logfile
-parser.add_argument('--logfile', metavar='log', type=argparse.FileType('a'),
-					dest='log', default=stdout, help='name of log file')
-# -d dummy run - only log the commands that would be run
-parser.add_argument('-d', action='store_true',
-					help='dummy run, log commands to be run only')
-
-# Interpret arguments
-args = vars(parser.parse_args())
-decimation = [d for d in args['decimate']] if args['decimate'] != None else []
-igts = args['igts']
-ogts = args['ogts']
-loglevel = args['loglevel']
-logstream = args['log']
-dummy = args['d']
-
-# Set up logging - if to stdout, assume caller handles time and module name
-if logstream == stdout:
-	fmt="%(levelname)s:%(message)s"
-else:
-	fmt="%(asctime)s %(module)s %(levelname)s:%(message)s"
-log.basicConfig(stream=logstream, format=fmt,
-                level=getattr(log, loglevel.upper()))
-
-# Output filename substitutions
-extre = re.compile(r'(\.[^.]*)$')
-here = environ['PWD']
-if igts[0] != pathsep:
-	igts = path.join(here, igts)
-if ogts[0] != pathsep:
-	ogts = path.join(here, ogts)
-mlx = path.join(path.dirname(ogts), "decimate-replaced.mlx")
-
-# Decimation
-action = None  # Record what action has been taken
-for dec in decimation:
-	retcode = runCommand("cat decimate.mlx | "
-           f"sed 's/TARGET_PERCENTAGE/{dec/100.0}/' >{mlx}",
-           dummy)
-	if retcode != 0:
-		log.error(f"Failed to create decimate-replaced.mlx [{retcode}]")
-		exit(1)
-
-	odf = extre.sub(f"-{dec}" r'\1', ogts) if len(decimation) > 1 else ogts
-	retcode = runCommand("xvfb-run meshlab/meshlabserver "
-                         f"-i {igts} -o {odf} -s {mlx}",
-                         dummy)
-	if retcode != 0:
-		log.error(f"Failed to run meshlab decimate-replaced.mlx [{retcode}]")
-		exit(1)
-	action = 1
+	- argv	  -- command line arguments, default sys.argv[1:]
+	- cwd	  -- directory for relative file names, default $PWD
+	"""
+	# Set up command line parsing
+	parser = argparse.ArgumentParser(description=\
+					'Simplify a surface representation.',
+					epilog="If multiple PERCENT supplied, prepare.py is also " \
+							"run for each case.")
+	# -i input gts file
+	parser.add_argument('-i', metavar='in-gts', dest='igts', required=True,
+	                    help='name of input gts file')
+	# -o output gts file
+	parser.add_argument('-o', metavar='out-gts', dest='ogts', required=True,
+	                    help='name of input gts file')
+	# --decimate target percentage decimation
+	parser.add_argument('--decimate', metavar="PERCENT", type=int,
+	                    nargs='+', required=False,
+	                    help='target percentage for decimation')
+	# --qem decimate with decimate.py rather than meshlab
+	parser.add_argument('--qem', action='store_true',
+						help='decimate with decimate.py rather than meshlab')
+	# -j number of levels to decimate concurrently
+	parser.add_argument('-j', metavar='jobs', type=int, dest='jobs', default=1,
+						help='number of decimation levels to make concurrently')
+	# --loglevel
+	parser.add_argument('--loglevel', metavar='(INFO|WARNING|ERROR)',
+						dest='loglevel', default="INFO",
+	                    help='minimum log level to capture: INFO, WARNING, ERROR')
+	# --logfile
+	parser.add_argument('--logfile', metavar='log', type=argparse.FileType('a'),
+						dest='log', default=stdout, help='name of log file')
+	# -d dummy run - only log the commands that would be run
+	parser.add_argument('-d', action='store_true',
+						help='dummy run, log commands to be run only')
+
+	# Interpret arguments
+	args = vars(parser.parse_args(argv))
+	decimation = [d for d in args['decimate']] if args['decimate'] != None else []
+	igts = args['igts']
+	ogts = args['ogts']
+	loglevel = args['loglevel']
+	logstream = args['log']
+	dummy = args['d']
+	jobs = args['jobs']
+	qem = args['qem']
+
+	# Set up logging - if to stdout, assume caller handles time and module name
+	if logstream == stdout:
+		fmt="%(levelname)s:%(message)s"
+	else:
+		fmt="%(asctime)s %(module)s %(levelname)s:%(message)s"
+	log.basicConfig(stream=logstream, format=fmt,
+	                level=getattr(log, loglevel.upper()))
+
+	# Output filename substitutions
+	extre = re.compile(r'(\.[^.]*)$')
+	here = cwd if cwd != None else environ['PWD']
+	if igts[0] != pathsep:
+		igts = path.join(here, igts)
+	if ogts[0] != pathsep:
+		ogts = path.join(here, ogts)
+
+	# Decimation of a level, with its own script if there are several levels
+	def decimate(dec: int) -> int:
+		odf = extre.sub(f"-{dec}" r'\1', ogts) if len(decimation) > 1 else ogts
+		if qem:
+			retcode = runCommand(f"decimate.py -i {igts} -o {odf} -p {dec}",
+								 dummy)
+			if retcode != 0:
+				log.error(f"Failed to run decimate.py for {odf} [{retcode}]")
+				return 1
+			return prepare(dec, odf)
+
+		mlx = path.join(path.dirname(ogts), "decimate-replaced.mlx"
+						if len(decimation) == 1 else f"decimate-replaced-{dec}.mlx")
+		retcode = runCommand("cat decimate.mlx | "
+	           f"sed 's/TARGET_PERCENTAGE/{dec/100.0}/' >{mlx}",
+	           dummy)
+		if retcode != 0:
+			log.error(f"Failed to create {path.basename(mlx)} [{retcode}]")
+			return 1
+
+		retcode = runCommand("xvfb-run -a meshlab/meshlabserver "
+	                         f"-i {igts} -o {odf} -s {mlx}",
+	                         dummy)
+		if len(decimation) > 1 and not dummy and path.exists(mlx):
+			remove(mlx)
+		if retcode != 0:
+			log.error(f"Failed to run meshlab {path.basename(mlx)} [{retcode}]")
+			return 1
+		return prepare(dec, odf)
 
 	# Run prepare if there were multiple decimations, else leave to pipeline
-	if len(decimation) > 1:
-		xyzqr = extre.sub(f".xyzqr", ogts)
-		mtz = extre.sub(f"-{dec}.mtz", ogts)
-		retcode = runCommand(f"prepare.py {odf} {xyzqr} {mtz}", dummy)
+	def prepare(dec: int, odf: str) -> int:
+		if len(decimation) > 1:
+			xyzqr = extre.sub(f".xyzqr", ogts)
+			mtz = extre.sub(f"-{dec}.mtz", ogts)
+			retcode = runCommand(f"prepare.py {odf} {xyzqr} {mtz}", dummy)
+			if retcode != 0:
+				log.error(f"Failed to run prepare.py for {odf} [{retcode}]")
+				return 1
+		return 0
+
+	# Decimation, of several levels concurrently if jobs allow
+	action = None  # Record what action has been taken
+	with ThreadPoolExecutor(max_workers=max(jobs,1)) as pool:
+		retcodes = list(pool.map(decimate, decimation))
+	if len([r for r in retcodes if r != 0]) > 0:
+		return 1
+	if len(decimation) > 0:
+		action = 1
 
-# No action
-if action == None:
-	if igts != ogts and not dummy:
-		shutil.copyfile(igts, ogts)
+	# No action
+	if action == None:
+		if igts != ogts and not dummy:
+			shutil.copyfile(igts, ogts)
 
-# Exit cleanly
-exit(0)
+	return 0
 
+if __name__ == "__main__":
+	exit(main())
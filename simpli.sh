@@ -1,7 +1,11 @@
 #!/bin/bash
 # Informal script to test simplification.
 # Run simpli.py to generate multiple simplifications and then phase1.py to test.
+# If QEM is set, decimate.py is used rather than meshlab.
+# JOBS simplifications are made at once, by default one per core with QEM,
+# else 1 as each meshlab run can need a lot of memory on large meshes.
 PCT=$(eval echo {10..100..10})
+JOBS=${JOBS:-${QEM:+$(nproc)}}
 restart=all
 
 source $(dirname $0)/setupResults.sh
@@ -36,7 +40,7 @@ do
 	)
 	if [ "x$pct" != x ]
 	then
-		$TOOLS/simpli.py --decimate $pct -i $RESULTS/${pdb}-3.gts -o $RESULTS/${pdb}.gts
+		$TOOLS/simpli.py -j ${JOBS:-1} ${QEM:+--qem} --decimate $pct -i $RESULTS/${pdb}-3.gts -o $RESULTS/${pdb}.gts
 		if [ $? -ne 0 ]
 		then
 			echo Simplify error
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# Author: Adam Light <la002@mail.cryst.bbk.ac.uk>
+"""MRes Bioinformatics with Systems Biology Project
+
+Apply a chain of shifts and rotations to the coordinates of a subset of
+each of a list of PDB or xyzqr files.  It generalises shift.py and
+rotate.py, which are now written in terms of it, so that a bound complex
+can be set up in one run rather than a chain of runs through temporary
+files.
+
+Example use:
+	transform.py -f fmt -b pattern -e pattern -s 1,0,0 -r 1,0,0 0,1,0 \
+		-o {s}-moved.pdb a.pdb b.pdb
+fmt, and the patterns giving the inclusive begin and end lines of the
+subset, are as for shift.py;  '#' is ignored at the start of a pattern.
+The steps are applied in the order given:
+	-s X,Y,Z		shift
+	-r AX1 AX2		rotate as from axis AX1 to axis AX2
+	-q W,X,Y,Z		rotate by the (normalised) quaternion
+A vector starting with '-' must be written as (-1,0,0), or argparse takes
+it for an option.  Rotations are about the average of the subset's
+coordinates at that point in the chain.  The whole chain is one affine map,
+applied to the coordinates of each file as a single matrix product, and the
+output is written as each file is read.  {s} in the output name is replaced
+by each input name less its extension;  without -o, output is to stdout.
+
+The steps are also available as functions, e.g.
+	steps = [('shift', (1,0,0)), ('axes', ((1,0,0), (0,1,0)))]
+	with open("a.pdb") as i, open("b.pdb", 'w') as o:
+		transform(i, o, 'pdb', re.compile("."), re.compile("!!!"), steps)
+"""
+__version__ = '0.1'
+__all__ = [
+	'main',
+	'quaternion',
+	'rotation',
+	'compose',
+	'transform',
+	'check',
+]
+
+# imports
+from typing import Iterable, List, Tuple
+from sys import stdout, stdin, stderr
+from os import path
+from io import StringIO
+from numpy import allclose, arange, array, cross, dot, eye, float64, ndarray, \
+				  sqrt, zeros
+from numpy.random import default_rng
+from coordio import lineIndex, mapFile, matchRange, parseBlock, parseColumns, \
+					pdbcoords, pdbformat, pdbLines, writeBytes, xyzLines
+import argparse
+import logging as log
+import re
+
+# Global variables
+xyzformat = "%.6f %.6f %.6f"
+
+# Functions
+def vector(s: str) -> Tuple[float, ...]:
+	"""Returns a tuple of floats from a string x,y,z or w,x,y,z."""
+	try:
+		return tuple(map(float, s.strip('() ').split(',')))
+	except:
+		raise argparse.ArgumentTypeError("Expected comma-separated numbers")
+
+def quaternion(a: Iterable[float], b: Iterable[float]) -> ndarray:
+	"""Returns the unit quaternion (w,x,y,z) rotating axis a to axis b."""
+	(a, b) = (array(a, dtype=float64), array(b, dtype=float64))
+	qa = cross(a, b)	# a for axis
+	qd = dot(a, b)		# d for dot
+	# To get half-way, add (1,0,0,0) but q not normalised yet, so adjust unit
+	unit = sqrt(qd*qd + dot(qa, qa))
+	q = array([unit + qd, *qa])
+	if dot(q, q) == 0.0:
+		if dot(a, a) == 0.0 or dot(b, b) == 0.0:
+			raise ValueError("Rotation axis of zero length")
+		# Opposite axes, so a half turn about any perpendicular
+		qa = cross(a, eye(3)[abs(a).argmin()])
+		q = array([0.0, *qa])
+	return q/sqrt(dot(q, q))
+
+def rotation(q: Iterable[float]) -> ndarray:
+	"""Returns the 3x3 matrix of the rotation by the quaternion (w,x,y,z)."""
+	q = array(q, dtype=float64)
+	if q.shape != (4,) or dot(q, q) == 0.0:
+		raise ValueError("Quaternion must be four numbers, not all zero")
+	(w, x, y, z) = q/sqrt(dot(q, q))
+	return array([[1-2*(y*y+z*z), 2*(x*y-w*z), 2*(x*z+w*y)],
+				  [2*(x*y+w*z), 1-2*(x*x+z*z), 2*(y*z-w*x)],
+				  [2*(x*z-w*y), 2*(y*z+w*x), 1-2*(x*x+y*y)]])
+
+def compose(steps: List[Tuple], centre: ndarray) -> Tuple[ndarray, ndarray]:
+	"""Returns the matrix and translation, (m, t), of the affine map that is
+	the chain of steps, each ('shift', (x,y,z)), ('axes', (ax1, ax2)) or
+	('quaternion', (w,x,y,z)), the rotations being about the image of centre
+	at that point in the chain."""
+	(m, t) = (eye(3), zeros(3))
+	for (kind, value) in steps:
+		if kind == 'shift':
+			t = t + array(value, dtype=float64)
+			continue
+		elif kind == 'axes':
+			r = rotation(quaternion(*value))
+		elif kind == 'quaternion':
+			r = rotation(value)
+		else:
+			raise ValueError(f"Unknown step {kind}")
+		c = m @ centre + t
+		(m, t) = (r @ m, r @ (t - c) + c)
+	return (m, t)
+
+def transform(ifs, ofs, fmt: str, begre, endre, steps: List[Tuple],
+			  ofmt: str = None) -> int:
+	"""Copies the open file ifs to ofs with the steps, as for compose,
+	applied to the coordinates of the lines from the first matching the
+	compiled RE begre to the next matching endre.  fmt is 'pdb' or 'xyz',
+	and ofmt, if given, the coordinate output format.  Returns the number
+	of lines transformed.  Raises ValueError if a coordinate is invalid."""
+	buf = mapFile(ifs)
+	starts = lineIndex(buf)
+	(first, last) = matchRange(buf, starts, begre, endre)
+	count = last - first + 1 if first != None else 0
+	first = first if first != None else len(starts) - 1
+
+	# Extract coordinates
+	if fmt == 'pdb':
+		c = parseColumns(buf, starts, arange(first, first + count), pdbcoords)
+	else:
+		c = parseBlock(buf, starts, first, count, 3)
+
+	# Transform them, all at once
+	if count > 0:
+		(m, t) = compose(steps, c.mean(axis=0))
+		c = c + t if (m == eye(3)).all() else c @ m.T + t
+
+	# Output the lines, revised where transformed
+	writeBytes(ofs, buf[0:starts[first]])
+	if fmt == 'pdb':
+		writeBytes(ofs, pdbLines(buf, starts, first, count, c,
+								 ofmt if ofmt != None else pdbformat))
+	else:
+		writeBytes(ofs, xyzLines(buf, starts, first, count, c,
+								 ofmt if ofmt != None else xyzformat))
+	writeBytes(ofs, buf[starts[first + count]:])
+	return count
+
+def check(trials: int = 100) -> int:
+	"""Checks the sense of rotations, returning the number of failures:
+	transform against hard-coded images of points rotated about their
+	centre, and, if pybeep is installed, compose against rotation by
+	Vector.change_coordinate_frame, as rotate.py did before transform.py, for
+	random axes and points."""
+	failures = 0
+	# Points centred on (10,20,30), rotated from x to y, from z to x and from
+	# x to -x (a half turn about an axis perpendicular to x, here -z)
+	cases = [
+		(((1,0,0), (0,1,0)), [(11,20,30), (9,20,30), (10,20,32), (10,20,28)],
+							 [(10,21,30), (10,19,30), (10,20,32), (10,20,28)]),
+		(((0,0,1), (1,0,0)), [(11,20,30), (9,20,30), (10,23,30), (10,17,30)],
+							 [(10,20,29), (10,20,31), (10,23,30), (10,17,30)]),
+		(((1,0,0), (-1,0,0)), [(11,20,30), (9,20,30), (10,21,30), (10,19,30)],
+							  [(9,20,30), (11,20,30), (10,19,30), (10,21,30)]),
+	]
+	for (axes, points, images) in cases:
+		ifs = StringIO("".join([f"{x} {y} {z}\n" for (x, y, z) in points]))
+		ofs = StringIO()
+		transform(ifs, ofs, 'xyz', re.compile("."), re.compile("!!!"),
+				  [('axes', axes)])
+		got = array([line.split() for line in ofs.getvalue().splitlines()],
+					dtype=float64)
+		if not allclose(got, images, atol=1e-6):
+			log.error(f"Rotation from {axes[0]} to {axes[1]} gave {got.tolist()}")
+			failures += 1
+
+	# Agreement with pybeep, with the quaternion as rotate.py built it
+	try:
+		from pybeep import Vector, Quaternion
+	except ImportError:
+		log.warning("pybeep not installed, so not compared")
+		return failures
+	rng = default_rng(1)
+	for _ in range(trials):
+		(a, b) = rng.normal(size=(2, 3))
+		points = rng.normal(size=(5, 3))*10
+		centre = points.mean(axis=0)
+		(m, t) = compose([('axes', (a, b))], centre)
+		ax = [Vector(*a), Vector(*b)]
+		qa = ax[0].cross(ax[1])
+		qd = ax[0].dot(ax[1])
+		unit = sqrt(qd*qd + qa.length2())
+		ql = Quaternion(unit + qd, qa.x, qa.y, qa.z)
+		ql.normalise()
+		c = Vector(*centre)
+		old = list()
+		for p in points:
+			v = Vector(*p)
+			v.change_coordinate_frame(c, ql, c)
+			old += [(v.x, v.y, v.z)]
+		if not allclose(points @ m.T + t, old, atol=1e-6):
+			log.error(f"Rotation from {a} to {b} differs from pybeep")
+			failures += 1
+	return failures
+
+def pattern(s: str):
+	"""Returns the compiled RE of a pattern, ignoring an initial '#'."""
+	try:
+		return re.compile(s[1:] if s[0:1] == "#" else s)
+	except re.error:
+		raise argparse.ArgumentTypeError(f"Unable to interpret pattern \"{s}\"")
+
+class _Step(argparse.Action):
+	"""Appends (kind, value) to the one list of steps, keeping their order."""
+	def __call__(self, parser, namespace, values, option_string=None):
+		steps = getattr(namespace, 'steps', None) or list()
+		steps.append((self.const, tuple(values) if self.nargs == 2 else values))
+		setattr(namespace, 'steps', steps)
+
+# Main program
+def main(argv: List[str] = None) -> int:
+	"""Runs transform.py with the given arguments, returning the exit status.
+
+	- argv	  -- command line arguments, default sys.argv[1:]
+	"""
+	# Set up command line parsing
+	parser = argparse.ArgumentParser(description=\
+				"Shift and rotate the coordinates of a subset of PDB or xyz "
+				"atoms in each of a list of files.",
+				epilog="Hints: # is ignored at the start of a pattern;  "
+					   "write a vector starting with - as (-1,0,0).")
+	# --loglevel
+	parser.add_argument('--loglevel', metavar='(INFO|WARNING|ERROR)',
+					dest='loglevel', required=False, default="INFO",
+					help="minimum log level to capture: INFO, WARNING, ERROR")
+	# --logfile
+	parser.add_argument('--logfile', metavar='log', type=argparse.FileType('a'),
+						dest='log', default=stderr, help="name of log file")
+	# -o
+	parser.add_argument('-o', metavar='OUT', type=str, dest='out', default=None,
+						help="name of output file, {s} being the input name "
+							 "less extension")
+	# -f
+	parser.add_argument('-f', metavar='FORMAT', type=str, dest='fmt',
+						choices=('pdb', 'xyz'), default='pdb',
+						help="format as pdb or xyz")
+	# -b
+	parser.add_argument('-b', metavar='PATTERN', type=pattern, dest='beg',
+						default=".",
+						help="the inclusive beginning line pattern")
+	# -e
+	parser.add_argument('-e', metavar='PATTERN', type=pattern, dest='end',
+						default="!!!",
+						help="the inclusive end line pattern")
+	# -s
+	parser.add_argument('-s', metavar='X,Y,Z', type=vector, action=_Step,
+						const='shift', dest='steps', help="shift")
+	# -r
+	parser.add_argument('-r', metavar='AXIS', type=vector, action=_Step,
+						const='axes', dest='steps', nargs=2,
+						help="rotate as from first axis to second")
+	# -q
+	parser.add_argument('-q', metavar='W,X,Y,Z', type=vector, action=_Step,
+						const='quaternion', dest='steps',
+						help="rotate by quaternion")
+	# --check
+	parser.add_argument('--check', action='store_true', dest='check',
+						help="check the sense of rotations, against pybeep "
+							 "if installed, and exit")
+	# files
+	parser.add_argument('files', metavar='FILE', nargs='*',
+						help="input files, default stdin")
+
+	# Interpret arguments
+	args = vars(parser.parse_args(argv))
+	loglevel = args['loglevel']
+	logstream = args['log']
+	out = args['out']
+	steps = args['steps'] if args['steps'] != None else list()
+	files = args['files'] if len(args['files']) > 0 else ['-']
+
+	# Set up logging - if to stdout, assume caller handles time and module name
+	if logstream == stdout:
+		lfmt="%(levelname)s:%(message)s"
+	else:
+		lfmt="%(asctime)s %(module)s %(levelname)s:%(message)s"
+	log.basicConfig(stream=logstream, format=lfmt,
+					level=getattr(log, loglevel.upper()))
+
+	if args['check']:
+		failures = check()
+		log.info(f"Rotation check: {failures} failures")
+		return 1 if failures > 0 else 0
+	if out != None and len(files) > 1 and not "{s}" in out:
+		log.error("Output name needs {s} for more than one input file")
+		return 1
+	for (kind, value) in steps:
+		if (kind == 'shift' and len(value) != 3) or \
+		   (kind == 'axes' and [len(v) for v in value] != [3, 3]) or \
+		   (kind == 'quaternion' and len(value) != 4):
+			log.error(f"Wrong number of values for {kind} {value}")
+			return 1
+
+	# Transform each file in turn
+	for f in files:
+		ofn = out.replace("{s}", path.splitext(f)[0]) if out != None else None
+		try:
+			ifs = stdin if f == '-' else open(f)
+			ofs = stdout if ofn == None else open(ofn, 'w')
+			try:
+				n = transform(ifs, ofs, args['fmt'], args['beg'], args['end'],
+							  steps)
+			finally:
+				if ifs != stdin:
+					ifs.close()
+				if ofs != stdout:
+					ofs.close()
+		except (OSError, ValueError) as e:
+			log.error(f"Failed to transform {f}: {e}")
+			return 1
+		log.info(f"{f}: {n} lines transformed")
+	return 0
+
+if __name__ == "__main__":
+	exit(main())